@@ -13,12 +13,12 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         if hasattr(user, "student"):
             role = "student"
             primary_id = user.student.id
-            school_id = user.student.school.id
+            school_id = user.student.school_id
             sub_id = user.student.id
         elif hasattr(user, "teacher"):
             role = "teacher"
             primary_id = user.teacher.id
-            school_id = user.teacher.school.id
+            school_id = user.teacher.school_id
             sub_id = user.teacher.id
 
         token = super().get_token(user)
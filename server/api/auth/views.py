@@ -1,6 +1,8 @@
 from rest_framework_simplejwt.views import TokenObtainPairView
+from api.users.throttling import LoginRateThrottle
 from .serializers import CustomTokenObtainPairSerializer
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [LoginRateThrottle]
@@ -1,5 +1,7 @@
+from django.db import transaction
 from rest_framework import serializers
 from .models import Question, Category, Answer, Image
+from api.quiz.marking import remark_question
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -86,17 +88,31 @@ class QuestionSerializer(serializers.ModelSerializer):
         """
         Override the default update method to set the modified_by field
         and handle nested answer data.
+
+        The answers are replaced and the attempts re-marked in one transaction, so that
+        the stored marks never disagree with the committed answer key.
         """
         request = self.context.get("request")
         validated_data["modified_by"] = request.user
 
         answers_data = validated_data.pop("answers", [])
-
-        instance = super().update(instance, validated_data)
-
-        instance.answers.all().delete()
-        for answer_data in answers_data:
-            Answer.objects.create(question=instance, **answer_data)
+        with transaction.atomic():
+            # lock the question so that concurrent edits re-mark against the mark they replaced
+            previous_mark = (
+                Question.objects.select_for_update().values_list("mark", flat=True).get(pk=instance.pk)
+            )
+            previous_answers = sorted(instance.answers.values_list("value", flat=True))
+
+            instance = super().update(instance, validated_data)
+
+            instance.answers.all().delete()
+            for answer_data in answers_data:
+                Answer.objects.create(question=instance, **answer_data)
+
+            # re-mark the attempts at this question if the answer key or the mark changed
+            answers = sorted(answer_data["value"] for answer_data in answers_data)
+            if answers != previous_answers or instance.mark != previous_mark:
+                remark_question(instance.id, previous_mark=previous_mark)
         return instance
 
     class Meta:
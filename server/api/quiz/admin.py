@@ -2,7 +2,7 @@ from django.contrib import admin
 from unfold.admin import ModelAdmin
 from import_export.admin import ImportExportModelAdmin
 # Register your models here.
-from .models import QuizAttempt, Quiz, QuizSlot, QuestionAttempt
+from .models import QuizAttempt, Quiz, QuizSlot, QuestionAttempt, MarkingJob
 
 
 @admin.register(Quiz)
@@ -36,3 +36,17 @@ class QuestionAttemptAdmin(ModelAdmin, ImportExportModelAdmin):
         "quiz_attempt_id",
         "question_id",
     )
+
+
+@admin.register(MarkingJob)
+class MarkingJobAdmin(ModelAdmin):
+    list_display = (
+        "id",
+        "quiz",
+        "state",
+        "attempts_processed",
+        "attempts_total",
+        "elapsed_seconds",
+        "created_at",
+        "finished_at",
+    )
@@ -5,6 +5,9 @@ class QuizConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api.quiz"
 
+    def ready(self):
+        from . import signals  # noqa: F401
+
     # def ready(self):
     #     from .tasks import schedule_tasks
     #     schedule_tasks()
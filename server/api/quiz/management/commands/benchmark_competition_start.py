@@ -0,0 +1,88 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.quiz.models import Quiz, QuizAttempt
+from api.quiz.views import CompetitionQuizViewSet
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate students starting a competition at the same time by calling the slots "
+        "endpoint concurrently, and report the p50/p99 latency. The quiz must be open and "
+        "should have been warmed up with warm_up_competitions. Run it against a staging database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("quiz", type=int, help="The competition quiz to start.")
+        parser.add_argument(
+            "--students", type=int, default=500, help="Number of students starting the quiz."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=20, help="Number of concurrent requests."
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Put the started attempts back into the prepared state afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            quiz = Quiz.objects.get(pk=options["quiz"])
+        except Quiz.DoesNotExist:
+            raise CommandError(f"Quiz {options['quiz']} does not exist.")
+
+        attempts = list(
+            QuizAttempt.objects.filter(quiz=quiz, prepared=True)
+            .select_related("student__user")[: options["students"]]
+        )
+        if not attempts:
+            raise CommandError("No prepared attempts found, run warm_up_competitions first.")
+
+        factory = APIRequestFactory()
+        view = CompetitionQuizViewSet.as_view({"get": "slots"})
+
+        def start(attempt):
+            request = factory.get(f"/api/quiz/competition/{quiz.id}/slots/")
+            force_authenticate(request, user=attempt.student.user)
+            started = time.perf_counter()
+            try:
+                response = view(request, pk=quiz.id)
+                return time.perf_counter() - started, response.status_code
+            finally:
+                connection.close()
+
+        self.stdout.write(
+            f"Starting {len(attempts)} attempts of {quiz} with {options['concurrency']} concurrent requests."
+        )
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(start, attempts))
+        wall_time = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, status_code in results if status_code != 200)
+        self.stdout.write(
+            f"requests: {len(results)}  errors: {errors}  "
+            f"throughput: {len(results) / wall_time:.1f} req/s\n"
+            f"p50: {percentile(latencies, 0.50) * 1000:.1f} ms  "
+            f"p99: {percentile(latencies, 0.99) * 1000:.1f} ms  "
+            f"max: {latencies[-1] * 1000:.1f} ms"
+        )
+
+        if options["reset"]:
+            QuizAttempt.objects.filter(id__in=[attempt.id for attempt in attempts]).update(
+                state=QuizAttempt.State.UNATTEMPTED, prepared=True, dead_line=None
+            )
+            self.stdout.write("Attempts reset to prepared.")
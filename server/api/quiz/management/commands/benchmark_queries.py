@@ -0,0 +1,207 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from api.question.models import Question
+from api.quiz.models import Quiz, QuizSlot, QuizAttempt, QuestionAttempt
+from api.team.models import Team, TeamMember
+from api.users.models import School, Student
+
+
+class Rollback(Exception):
+    """Raised to roll back the seeded dataset."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN ANALYZE on the hot competition and results queries against a seeded dataset, "
+        "and fail if any of them has no usable index on its table. "
+        "The dataset is created inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--students", type=int, default=2000, help="Number of seeded students."
+        )
+        parser.add_argument(
+            "--questions", type=int, default=30, help="Number of questions in the seeded quiz."
+        )
+        parser.add_argument(
+            "--quizzes", type=int, default=20, help="Number of seeded quizzes."
+        )
+        parser.add_argument(
+            "--verbose-plans", action="store_true", help="Print the full query plans."
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The query benchmark needs PostgreSQL for EXPLAIN ANALYZE.")
+
+        regressions = []
+        try:
+            with transaction.atomic():
+                quiz, student, attempt, question = self.seed(options)
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+                for name, table, queryset in self.get_hot_queries(quiz, student, attempt, question):
+                    plan = queryset.explain(analyze=True)
+                    sequential = self.needs_sequential_scan(queryset, table)
+                    if sequential:
+                        regressions.append(name)
+                    self.stdout.write(
+                        f"{name}: {self.get_execution_time(plan)}"
+                        f"{'  NO INDEX' if sequential else ''}"
+                    )
+                    if options["verbose_plans"]:
+                        self.stdout.write(plan + "\n")
+                raise Rollback()
+        except Rollback:
+            pass
+
+        if regressions:
+            raise CommandError(f"Queries without an index scan: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS("All hot queries use an index."))
+
+    def seed(self, options):
+        """
+        Seed a competition with one attempt and a team per student, plus other quizzes.
+
+        Returns:
+            tuple: A quiz, student, quiz attempt and question to run the hot queries with.
+        """
+        started = time.perf_counter()
+        school = School.objects.create(name="Benchmark School", code="BENCH")
+        Quiz.objects.bulk_create(
+            Quiz(name=f"Benchmark quiz {index}", intro="", total_marks=0, status=index % 4)
+            for index in range(options["quizzes"])
+        )
+        quiz = Quiz.objects.create(
+            name="Benchmark competition",
+            intro="",
+            total_marks=options["questions"],
+            is_comp=True,
+            visible=True,
+            status=2,
+            open_time_date=now(),
+            time_window=30,
+        )
+        questions = Question.objects.bulk_create(
+            Question(name=f"Benchmark question {index}", is_comp=True, diff_level=1, mark=1)
+            for index in range(options["questions"])
+        )
+        QuizSlot.objects.bulk_create(
+            QuizSlot(quiz=quiz, question=question, slot_index=index, block=1)
+            for index, question in enumerate(questions)
+        )
+
+        users = User.objects.bulk_create(
+            User(username=f"benchmark-{index}") for index in range(options["students"])
+        )
+        students = Student.objects.bulk_create(
+            Student(user=user, school=school, year_level=str(7 + index % 3))
+            for index, user in enumerate(users)
+        )
+        teams = Team.objects.bulk_create(
+            Team(name=f"Benchmark team {index}", school=school, description="")
+            for index in range(0, len(students), 4)
+        )
+        TeamMember.objects.bulk_create(
+            TeamMember(student=student, team=teams[index // 4])
+            for index, student in enumerate(students)
+        )
+        attempts = QuizAttempt.objects.bulk_create(
+            QuizAttempt(
+                quiz=quiz,
+                student=student,
+                team=teams[index // 4],
+                current_page=0,
+                total_marks=0,
+                # most attempts are finished, as in the results views after a competition
+                state=QuizAttempt.State.IN_PROGRESS if index % 10 == 0 else QuizAttempt.State.COMPLETED,
+            )
+            for index, student in enumerate(students)
+        )
+        QuestionAttempt.objects.bulk_create(
+            (
+                QuestionAttempt(
+                    student_id=attempt.student_id,
+                    question=question,
+                    quiz_attempt=attempt,
+                    answer_student=0,
+                    is_correct=False,
+                )
+                for attempt in attempts
+                for question in questions
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(
+            f"Seeded {len(students)} students and {len(students) * len(questions)} answers "
+            f"in {time.perf_counter() - started:.1f} s."
+        )
+        middle = len(students) // 2
+        return quiz, students[middle], attempts[middle], questions[len(questions) // 2]
+
+    def get_hot_queries(self, quiz, student, attempt, question):
+        """
+        Returns:
+            list: Tuples of (name, table, queryset) of the hot queries.
+        """
+        return [
+            (
+                "attempt of a student",
+                QuizAttempt._meta.db_table,
+                QuizAttempt.objects.filter(quiz_id=quiz.id, student_id=student.id),
+            ),
+            (
+                "in-progress attempts",
+                QuizAttempt._meta.db_table,
+                QuizAttempt.objects.filter(quiz_id=quiz.id, state=QuizAttempt.State.IN_PROGRESS),
+            ),
+            (
+                "answer of a question",
+                QuestionAttempt._meta.db_table,
+                QuestionAttempt.objects.filter(
+                    quiz_attempt_id=attempt.id, question_id=question.id, student_id=student.id
+                ),
+            ),
+            (
+                "slots of a quiz",
+                QuizSlot._meta.db_table,
+                QuizSlot.objects.filter(quiz_id=quiz.id).order_by("slot_index"),
+            ),
+            (
+                "team of a student",
+                TeamMember._meta.db_table,
+                TeamMember.objects.filter(student_id=student.id),
+            ),
+            (
+                "visible competitions",
+                Quiz._meta.db_table,
+                Quiz.objects.filter(is_comp=True, visible=True, status=2),
+            ),
+        ]
+
+    def needs_sequential_scan(self, queryset, table):
+        """
+        Check if the query can only be answered by a sequential scan of its table.
+
+        Small tables are scanned sequentially by choice, so the plan is made again with
+        sequential scans disabled, which the planner then only uses without a usable index.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        try:
+            return f"Seq Scan on {table}" in queryset.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = on")
+
+    def get_execution_time(self, plan):
+        for line in plan.splitlines():
+            if line.startswith("Execution Time"):
+                return line.split(":", 1)[1].strip()
+        return "unknown"
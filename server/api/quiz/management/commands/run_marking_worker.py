@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.quiz.models import MarkingJob
+from api.quiz.marking import MARKING_CHUNK_SIZE, claim_marking_job, run_marking_job
+from api.results.refresh import rank_pending_results
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued marking jobs. Jobs are claimed from the database, "
+        "so several workers can run side by side without a message broker. "
+        "While the queue is empty, the placements left pending by saved attempts are computed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no more jobs to run instead of polling.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=MARKING_CHUNK_SIZE,
+            help="Number of quiz attempts committed together.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Marking worker started.")
+        while True:
+            # a connection broken by a failed run is replaced, like between two requests
+            close_old_connections()
+            job = claim_marking_job()
+            if job is None:
+                rank_pending_results()
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(
+                f"Marking quiz {job.quiz_id} (job {job.id}), resuming after attempt {job.last_attempt_id}."
+            )
+            job = run_marking_job(job, chunk_size=options["chunk_size"])
+            if job.state == MarkingJob.State.FAILED:
+                self.stderr.write(f"Job {job.id} failed: {job.error}")
+            elif job.state == MarkingJob.State.QUEUED:
+                self.stderr.write(f"Job {job.id} run {job.tries} failed, it is queued again: {job.error}")
+            else:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Job {job.id} marked {job.attempts_processed} attempts in {job.elapsed_seconds:.2f}s."
+                    )
+                )
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.quiz.models import Quiz
+from api.quiz.warmup import get_upcoming_competitions, warm_up_competition
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-create quiz attempts and build the cached paper for competitions about to open. "
+        "The paper is only built with a cache shared by the web workers (CACHE_BACKEND). "
+        "Run it from cron shortly before the open time, e.g. every 5 minutes with --within 15."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--quiz", type=int, help="Warm up this quiz instead of the upcoming competitions."
+        )
+        parser.add_argument(
+            "--within",
+            type=int,
+            default=15,
+            help="Warm up competitions opening within this many minutes.",
+        )
+        parser.add_argument(
+            "--school", type=int, action="append", help="Only include students of this school."
+        )
+        parser.add_argument(
+            "--year-level", type=int, action="append", help="Only include students of this year level."
+        )
+
+    def handle(self, *args, **options):
+        if options["quiz"]:
+            try:
+                quizzes = [Quiz.objects.get(pk=options["quiz"])]
+            except Quiz.DoesNotExist:
+                raise CommandError(f"Quiz {options['quiz']} does not exist.")
+        else:
+            quizzes = get_upcoming_competitions(timedelta(minutes=options["within"]))
+
+        for quiz in quizzes:
+            stats = warm_up_competition(
+                quiz, school_ids=options["school"], year_levels=options["year_level"]
+            )
+            if stats["paper_bytes"] is None:
+                paper = "paper not cached, the cache is not shared with the web workers"
+            else:
+                paper = f"{stats['paper_bytes']} bytes of paper cached"
+            self.stdout.write(
+                self.style.SUCCESS(f"Warmed up {quiz}: {stats['attempts_created']} attempts created, {paper}.")
+            )
@@ -0,0 +1,455 @@
+"""
+Set-based marking engine for quiz attempts.
+
+The answer key of a quiz is loaded once, every question attempt is marked in memory
+and the results are written back in chunks with ``bulk_update``.
+
+Answers written by students are upserted and marked against a cached answer key with
+`save_answers`, which keeps `QuizAttempt.total_marks` up to date. It sends no signal, the
+results views refresh the stored results of attempts whose total changed when they are read.
+
+When the answer key or mark of a question changes, `remark_question` re-marks only the
+attempts at that question and adjusts the affected totals by the difference.
+
+Marking a quiz or re-marking a question sets `Quiz.marked_at`, which versions the cached
+results of the quiz, and sends the `attempts_marked` signal to refresh the stored results.
+Answers written by students rely on the short timeout of those caches.
+
+Long running marks are queued as a `MarkingJob` and executed by the
+`run_marking_worker` management command, which commits the job progress together
+with each chunk so that a crashed job resumes from its last committed chunk. A run failing
+with an error, e.g. a deadlock or a dropped connection, queues the job again to resume the
+same way, and the job only fails once it was tried `MARKING_JOB_MAX_TRIES` times.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from api.question.models import Question, Answer
+from .models import Quiz, QuizSlot, QuizAttempt, QuestionAttempt, MarkingJob
+from .signals import attempts_marked
+
+# number of quiz attempts marked (and committed) together
+MARKING_CHUNK_SIZE = 500
+# seconds a quiz answer key stays cached, the key is also replaced whenever the quiz is saved
+ANSWER_KEY_CACHE_TIMEOUT = 60 * 60
+# a running job without a committed chunk for this long is considered crashed
+MARKING_JOB_STALE_AFTER = timedelta(minutes=5)
+# runs of a job, crashed or failed, before it is given up
+MARKING_JOB_MAX_TRIES = 3
+
+
+def load_answer_key(quiz_id):
+    """
+    Load the answer key of a quiz in two queries.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+
+    Returns:
+        dict: Maps each question id in the quiz to a tuple of
+            (frozenset of accepted answer values, mark of the question).
+    """
+    marks = dict(
+        QuizSlot.objects.filter(quiz_id=quiz_id).values_list(
+            "question_id", "question__mark"
+        )
+    )
+    accepted = {question_id: set() for question_id in marks}
+    answers = Answer.objects.filter(question_id__in=list(marks)).values_list(
+        "question_id", "value"
+    )
+    for question_id, value in answers:
+        accepted[question_id].add(value)
+    return {
+        question_id: (frozenset(values), marks[question_id])
+        for question_id, values in accepted.items()
+    }
+
+
+def get_answer_key(quiz):
+    """
+    Get the answer key of a quiz from the cache, loading it on a miss.
+
+    The cache key includes `quiz.updated_at`, so saving the quiz (for example when its
+    slots are replaced) makes every process load the new answer key.
+
+    Args:
+        quiz (Quiz): The quiz instance.
+
+    Returns:
+        dict: The answer key returned by `load_answer_key`.
+    """
+    version = quiz.updated_at.timestamp() if quiz.updated_at else 0
+    return cache.get_or_set(
+        f"quiz:{quiz.id}:answer-key:{version}",
+        lambda: load_answer_key(quiz.id),
+        ANSWER_KEY_CACHE_TIMEOUT,
+    )
+
+
+def total_marks_expression():
+    """
+    Build an expression for the total marks of a quiz attempt, summed from its correct answers.
+
+    Returns:
+        Expression: To be used in an update or annotation of `QuizAttempt`.
+    """
+    correct = (
+        QuestionAttempt.objects.filter(quiz_attempt=OuterRef("pk"), is_correct=True)
+        .values("quiz_attempt")
+        .annotate(total=Sum("question__mark"))
+        .values("total")
+    )
+    return Coalesce(Subquery(correct), 0)
+
+
+def save_answers(quiz_attempt, answers, seq=None):
+    """
+    Save and mark answers of a quiz attempt and update its total marks.
+
+    The answers are written with a single ``INSERT ... ON CONFLICT DO UPDATE`` on the unique
+    (quiz_attempt, question) pair, the total marks are then summed again in one UPDATE.
+    The caller must hold a row lock on the quiz attempt (`select_for_update`), so that
+    concurrent answers of the same student are applied one after another.
+
+    Args:
+        quiz_attempt (QuizAttempt): The locked quiz attempt, with its quiz loaded.
+        answers (dict): Maps question ids to the answers of the student.
+        seq (int, optional): The client sequence number of an answer batch. A batch whose
+            sequence number is not newer than the last applied one is a retry and is not written again.
+
+    Returns:
+        list: The stored `QuestionAttempt` of each answered question.
+    """
+    if seq is not None and seq <= quiz_attempt.answer_seq:
+        return list(
+            QuestionAttempt.objects.filter(
+                quiz_attempt=quiz_attempt, question_id__in=list(answers)
+            )
+        )
+
+    answer_key = get_answer_key(quiz_attempt.quiz)
+    question_attempts = [
+        QuestionAttempt(
+            student_id=quiz_attempt.student_id,
+            question_id=question_id,
+            quiz_attempt=quiz_attempt,
+            answer_student=answer,
+            is_correct=answer in answer_key.get(question_id, (frozenset(), 0))[0],
+        )
+        for question_id, answer in answers.items()
+    ]
+    QuestionAttempt.objects.bulk_create(
+        question_attempts,
+        update_conflicts=True,
+        unique_fields=["quiz_attempt", "question"],
+        update_fields=["answer_student", "is_correct"],
+    )
+
+    update = {"total_marks": total_marks_expression()}
+    if seq is not None:
+        update["answer_seq"] = seq
+        quiz_attempt.answer_seq = seq
+    QuizAttempt.objects.filter(pk=quiz_attempt.pk).update(**update)
+    return question_attempts
+
+
+def mark_attempts(attempt_totals, answer_key):
+    """
+    Mark a chunk of quiz attempts against an answer key and write back the changed rows.
+
+    Question attempts for questions that are not part of the answer key are marked incorrect.
+
+    Args:
+        attempt_totals (dict): Maps each quiz attempt id in the chunk to its currently stored total_marks.
+        answer_key (dict): The answer key returned by `load_answer_key`.
+
+    Returns:
+        dict: Row counts for the chunk.
+    """
+    totals = dict.fromkeys(attempt_totals, 0)
+    changed_question_attempts = []
+    question_attempt_count = 0
+
+    question_attempts = QuestionAttempt.objects.filter(
+        quiz_attempt_id__in=list(attempt_totals)
+    ).only("id", "quiz_attempt_id", "question_id", "answer_student", "is_correct")
+
+    for question_attempt in question_attempts.iterator(chunk_size=2000):
+        question_attempt_count += 1
+        accepted, mark = answer_key.get(question_attempt.question_id, (frozenset(), 0))
+        is_correct = question_attempt.answer_student in accepted
+        if is_correct:
+            totals[question_attempt.quiz_attempt_id] += mark
+        if question_attempt.is_correct != is_correct:
+            question_attempt.is_correct = is_correct
+            changed_question_attempts.append(question_attempt)
+
+    changed_attempts = [
+        QuizAttempt(id=attempt_id, total_marks=total)
+        for attempt_id, total in totals.items()
+        if attempt_totals[attempt_id] != total
+    ]
+
+    with transaction.atomic():
+        QuestionAttempt.objects.bulk_update(
+            changed_question_attempts, ["is_correct"], batch_size=MARKING_CHUNK_SIZE
+        )
+        QuizAttempt.objects.bulk_update(
+            changed_attempts, ["total_marks"], batch_size=MARKING_CHUNK_SIZE
+        )
+
+    return {
+        "quiz_attempts": len(attempt_totals),
+        "question_attempts": question_attempt_count,
+        "updated_quiz_attempts": len(changed_attempts),
+        "updated_question_attempts": len(changed_question_attempts),
+    }
+
+
+def mark_quiz(quiz_id, chunk_size=MARKING_CHUNK_SIZE):
+    """
+    Mark every attempt of a quiz.
+
+    Each chunk of `chunk_size` quiz attempts is marked with three reads and at most two
+    bulk updates, so the number of queries no longer grows with the number of answers.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        chunk_size (int): The number of quiz attempts committed together.
+
+    Returns:
+        dict: Row counts, the elapsed time in seconds and the marking throughput.
+    """
+    started = perf_counter()
+    answer_key = load_answer_key(quiz_id)
+    attempts = list(
+        QuizAttempt.objects.filter(quiz_id=quiz_id)
+        .order_by("id")
+        .values_list("id", "total_marks")
+    )
+
+    stats = {
+        "quiz_attempts": 0,
+        "question_attempts": 0,
+        "updated_quiz_attempts": 0,
+        "updated_question_attempts": 0,
+    }
+    for start in range(0, len(attempts), chunk_size):
+        chunk_stats = mark_attempts(dict(attempts[start:start + chunk_size]), answer_key)
+        for key, value in chunk_stats.items():
+            stats[key] += value
+    Quiz.objects.filter(id=quiz_id).update(marked_at=now())
+    attempts_marked.send(sender=Quiz, quiz_ids=[quiz_id])
+
+    elapsed = perf_counter() - started
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["attempts_per_second"] = (
+        round(stats["quiz_attempts"] / elapsed, 1) if elapsed > 0 else None
+    )
+    return stats
+
+
+def remark_question(question_id, previous_mark=None):
+    """
+    Re-mark every attempt at a question after its answers or mark changed.
+
+    Only the question attempts of quizzes that use the question through a `QuizSlot` are
+    recomputed, and each affected `QuizAttempt.total_marks` is adjusted by the difference
+    in a single UPDATE per distinct difference. The quizzes are saved afterwards so that
+    their cached answer keys are replaced.
+
+    Args:
+        question_id (int): The primary key of the question.
+        previous_mark (int): The mark of the question before it was changed,
+            defaults to the current mark when only the answers changed.
+
+    Returns:
+        dict: Row counts and the elapsed time in seconds.
+    """
+    started = perf_counter()
+    mark = Question.objects.values_list("mark", flat=True).get(pk=question_id)
+    previous_mark = mark if previous_mark is None else previous_mark
+    accepted = frozenset(
+        Answer.objects.filter(question_id=question_id).values_list("value", flat=True)
+    )
+    quiz_ids = list(
+        QuizSlot.objects.filter(question_id=question_id)
+        .values_list("quiz_id", flat=True)
+        .distinct()
+    )
+
+    changed_question_attempts = []
+    attempts_by_delta = defaultdict(list)
+    question_attempt_count = 0
+    with transaction.atomic():
+        # lock the affected quiz attempts so that answers written meanwhile wait for the re-mark
+        list(
+            QuizAttempt.objects.select_for_update(of=("self",))
+            .filter(quiz_id__in=quiz_ids, question_attempts__question_id=question_id)
+            .values_list("id", flat=True)
+        )
+        question_attempts = QuestionAttempt.objects.filter(
+            question_id=question_id, quiz_attempt__quiz_id__in=quiz_ids
+        ).only("id", "quiz_attempt_id", "answer_student", "is_correct")
+
+        deltas = defaultdict(int)
+        for question_attempt in question_attempts:
+            question_attempt_count += 1
+            is_correct = question_attempt.answer_student in accepted
+            delta = (mark if is_correct else 0) - (
+                previous_mark if question_attempt.is_correct else 0
+            )
+            if delta:
+                deltas[question_attempt.quiz_attempt_id] += delta
+            if question_attempt.is_correct != is_correct:
+                question_attempt.is_correct = is_correct
+                changed_question_attempts.append(question_attempt)
+
+        for attempt_id, delta in deltas.items():
+            if delta:
+                attempts_by_delta[delta].append(attempt_id)
+
+        QuestionAttempt.objects.bulk_update(
+            changed_question_attempts, ["is_correct"], batch_size=MARKING_CHUNK_SIZE
+        )
+        for delta, attempt_ids in attempts_by_delta.items():
+            QuizAttempt.objects.filter(id__in=attempt_ids).update(
+                total_marks=F("total_marks") + delta
+            )
+        Quiz.objects.filter(id__in=quiz_ids).update(updated_at=now(), marked_at=now())
+    attempts_marked.send(sender=Quiz, quiz_ids=quiz_ids)
+
+    return {
+        "quizzes": len(quiz_ids),
+        "question_attempts": question_attempt_count,
+        "updated_question_attempts": len(changed_question_attempts),
+        "updated_quiz_attempts": sum(len(ids) for ids in attempts_by_delta.values()),
+        "elapsed_seconds": round(perf_counter() - started, 3),
+    }
+
+
+def enqueue_marking_job(quiz_id):
+    """
+    Queue a marking job for a quiz, unless one is already queued or running.
+    The quiz row is locked so that concurrent requests queue a single job.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+
+    Returns:
+        tuple: The (MarkingJob, created) pair.
+
+    Raises:
+        Quiz.DoesNotExist: If the quiz does not exist.
+    """
+    with transaction.atomic():
+        Quiz.objects.select_for_update().get(pk=quiz_id)
+        active_job = (
+            MarkingJob.objects.filter(
+                quiz_id=quiz_id,
+                state__in=[MarkingJob.State.QUEUED, MarkingJob.State.RUNNING],
+            )
+            .first()
+        )
+        if active_job:
+            return active_job, False
+        return MarkingJob.objects.create(quiz_id=quiz_id), True
+
+
+def claim_marking_job(stale_after=MARKING_JOB_STALE_AFTER):
+    """
+    Claim the oldest queued job, or a running job whose worker stopped sending heartbeats.
+
+    The row is locked with SKIP LOCKED so that several workers never claim the same job.
+
+    Returns:
+        MarkingJob or None: The claimed job, now in the running state.
+    """
+    current_time = now()
+    with transaction.atomic():
+        job = (
+            MarkingJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(state=MarkingJob.State.QUEUED)
+                | Q(
+                    state=MarkingJob.State.RUNNING,
+                    heartbeat_at__lt=current_time - stale_after,
+                )
+            )
+            .order_by("id")
+            .first()
+        )
+        if job is None:
+            return None
+        job.state = MarkingJob.State.RUNNING
+        job.started_at = job.started_at or current_time
+        job.heartbeat_at = current_time
+        job.tries += 1
+        job.save(update_fields=["state", "started_at", "heartbeat_at", "tries"])
+    return job
+
+
+def run_marking_job(job, chunk_size=MARKING_CHUNK_SIZE):
+    """
+    Mark the quiz attempts of a claimed job, resuming after `job.last_attempt_id`.
+
+    The job progress is saved in the same transaction as each marked chunk. When a chunk fails,
+    the job is queued again to resume after the last committed one, unless it has run out of tries.
+
+    Args:
+        job (MarkingJob): A job in the running state.
+        chunk_size (int): The number of quiz attempts committed together.
+
+    Returns:
+        MarkingJob: The finished, queued again or failed job.
+    """
+    try:
+        answer_key = load_answer_key(job.quiz_id)
+        attempts = list(
+            QuizAttempt.objects.filter(quiz_id=job.quiz_id, id__gt=job.last_attempt_id)
+            .order_by("id")
+            .values_list("id", "total_marks")
+        )
+        job.attempts_total = job.attempts_processed + len(attempts)
+        job.save(update_fields=["attempts_total"])
+
+        for start in range(0, len(attempts), chunk_size):
+            started = perf_counter()
+            chunk = attempts[start:start + chunk_size]
+            with transaction.atomic():
+                mark_attempts(dict(chunk), answer_key)
+                job.last_attempt_id = chunk[-1][0]
+                job.attempts_processed += len(chunk)
+                job.elapsed_seconds += perf_counter() - started
+                job.heartbeat_at = now()
+                job.save(
+                    update_fields=[
+                        "last_attempt_id",
+                        "attempts_processed",
+                        "elapsed_seconds",
+                        "heartbeat_at",
+                    ]
+                )
+                Quiz.objects.filter(id=job.quiz_id).update(marked_at=job.heartbeat_at)
+        job.state = MarkingJob.State.DONE
+    except Exception as error:
+        retry = job.tries < MARKING_JOB_MAX_TRIES
+        job.state = MarkingJob.State.QUEUED if retry else MarkingJob.State.FAILED
+        job.error = str(error)
+        if retry:
+            job.save(update_fields=["state", "error"])
+            return job
+    job.finished_at = now()
+    job.save(update_fields=["state", "error", "finished_at"])
+    if job.state == MarkingJob.State.DONE:
+        attempts_marked.send(sender=Quiz, quiz_ids=[job.quiz_id])
+    return job
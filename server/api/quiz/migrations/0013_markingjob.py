@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0012_alter_quiz_open_time_date_alter_quiz_time_window'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarkingJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('state', models.IntegerField(choices=[(1, 'Queued'), (2, 'Running'), (3, 'Done'), (4, 'Failed')], default=1)),
+                ('attempts_total', models.IntegerField(default=0)),
+                ('attempts_processed', models.IntegerField(default=0)),
+                ('last_attempt_id', models.IntegerField(default=0)),
+                ('elapsed_seconds', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('tries', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='marking_jobs', to='quiz.quiz')),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.15 on 2026-10-17 14:36
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, Min, OuterRef
+
+
+def delete_empty_duplicate_attempts(apps, schema_editor):
+    """
+    Delete the extra attempts of a student at a quiz that hold no answers, left behind by
+    concurrent first requests. The oldest attempt is kept when none of them has answers.
+    Duplicates that both hold answers are left for an admin, the constraint then fails to apply.
+    """
+    QuizAttempt = apps.get_model("quiz", "QuizAttempt")
+    QuestionAttempt = apps.get_model("quiz", "QuestionAttempt")
+
+    duplicated = list(
+        QuizAttempt.objects.values("quiz", "student")
+        .annotate(count=Count("id"), oldest=Min("id"))
+        .filter(count__gt=1)
+    )
+    for row in duplicated:
+        attempts = QuizAttempt.objects.filter(quiz_id=row["quiz"], student_id=row["student"]).annotate(
+            answered=Exists(QuestionAttempt.objects.filter(quiz_attempt=OuterRef("pk")))
+        )
+        empty = attempts.filter(answered=False)
+        if not attempts.filter(answered=True).exists():
+            empty = empty.exclude(id=row["oldest"])
+        QuizAttempt.objects.filter(id__in=list(empty.values_list("id", flat=True))).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0013_markingjob'),
+        ('team', '0001_initial'),
+        ('users', '0008_school_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='prepared',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(delete_empty_duplicate_attempts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='quizattempt',
+            constraint=models.UniqueConstraint(fields=('quiz', 'student'), name='quiz_attempt_quiz_student_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0014_quizattempt_prepared'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='answer_seq',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:46
+
+from django.db import migrations
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def deduplicate_question_attempts(apps, schema_editor):
+    """
+    Keep only the newest question attempt of each (quiz_attempt, question) pair,
+    and sum the total marks of the affected quiz attempts again.
+    """
+    QuestionAttempt = apps.get_model("quiz", "QuestionAttempt")
+    QuizAttempt = apps.get_model("quiz", "QuizAttempt")
+
+    duplicated = (
+        QuestionAttempt.objects.values("quiz_attempt", "question")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+    )
+    affected_attempts = list({row["quiz_attempt"] for row in duplicated})
+    if not affected_attempts:
+        return
+
+    newest = (
+        QuestionAttempt.objects.filter(quiz_attempt_id__in=affected_attempts)
+        .values("quiz_attempt", "question")
+        .annotate(newest=Max("id"))
+        .values("newest")
+    )
+    QuestionAttempt.objects.filter(quiz_attempt_id__in=affected_attempts).exclude(
+        id__in=Subquery(newest)
+    ).delete()
+
+    correct = (
+        QuestionAttempt.objects.filter(quiz_attempt=OuterRef("pk"), is_correct=True)
+        .values("quiz_attempt")
+        .annotate(total=Sum("question__mark"))
+        .values("total")
+    )
+    QuizAttempt.objects.filter(id__in=affected_attempts).update(
+        total_marks=Coalesce(Subquery(correct), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0015_quizattempt_answer_seq'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_question_attempts, migrations.RunPython.noop),
+    ]
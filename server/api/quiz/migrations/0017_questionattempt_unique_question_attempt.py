@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question', '0003_remove_image_jax_text_remove_image_scale_and_more'),
+        ('quiz', '0016_deduplicate_questionattempts'),
+        ('users', '0008_school_address'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='questionattempt',
+            constraint=models.UniqueConstraint(fields=('quiz_attempt', 'question'), name='unique_question_attempt'),
+        ),
+    ]
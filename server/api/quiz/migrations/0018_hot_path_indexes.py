@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question', '0003_remove_image_jax_text_remove_image_scale_and_more'),
+        ('quiz', '0017_questionattempt_unique_question_attempt'),
+        ('team', '0001_initial'),
+        ('users', '0008_school_address'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['is_comp', 'visible', 'status'], name='quiz_comp_visible_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(condition=models.Q(('state', 2)), fields=['quiz', 'dead_line'], name='quiz_attempt_in_progress_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizslot',
+            index=models.Index(fields=['quiz', 'slot_index'], name='quiz_slot_quiz_index_idx'),
+        ),
+    ]
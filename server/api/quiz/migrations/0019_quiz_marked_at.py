@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0018_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='marked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -20,6 +20,7 @@ class Quiz(models.Model):
        open_time_date (DateTimeField): Notes when the quiz opens.
        time_limit (Integer): Denotes the time allotted for each quiz.
        time_window: The amount of time after quiz start that a student has to be able to start the quiz
+       marked_at (DateTimeField): When attempts of the quiz were last marked, versions cached results.
     """
 
     id = models.AutoField(primary_key=True)
@@ -33,10 +34,17 @@ class Quiz(models.Model):
     time_window = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, null=True)
+    marked_at = models.DateTimeField(null=True, blank=True)
 
     # 0 for normal practice, 1 for upcoming, 2 for ongoing, 3 for finished
     status = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # competition and visible quiz lists
+            models.Index(fields=["is_comp", "visible", "status"], name="quiz_comp_visible_status_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name}"
 
@@ -76,6 +84,12 @@ class QuizSlot(models.Model):
     slot_index = models.IntegerField(db_index=True)
     block = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            # slots of a quiz in order
+            models.Index(fields=["quiz", "slot_index"], name="quiz_slot_quiz_index_idx"),
+        ]
+
     def __str__(self):
         return f"{self.id} {self.quiz} {self.question} {self.slot_index}"
 
@@ -93,6 +107,9 @@ class QuizAttempt(models.Model):
         time_modified (DateTimeField):  Last modified time of the quiz
         total_marks (IntegerField): Total marks for a particular quiz attempt
         team (ForeignKey): The id of the team this student belongs to
+        answer_seq (IntegerField): The client sequence number of the last applied answer batch
+        prepared (BooleanField): Whether the attempt was pre-created by the competition warm-up and not started yet.
+            Such placeholders are no entries of the quiz, unlike attempts created unattempted elsewhere.
 
     """
 
@@ -128,6 +145,22 @@ class QuizAttempt(models.Model):
         blank=True,
     )
     dead_line = models.DateTimeField(default=None, null=True, blank=True)
+    answer_seq = models.IntegerField(default=0)
+    prepared = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            # a student has one attempt at a quiz, also when the warm-up and a first request race
+            models.UniqueConstraint(fields=["quiz", "student"], name="quiz_attempt_quiz_student_uniq"),
+        ]
+        indexes = [
+            # attempts still being answered, a small part of all attempts during a competition
+            models.Index(
+                fields=["quiz", "dead_line"],
+                name="quiz_attempt_in_progress_idx",
+                condition=models.Q(state=2),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.id} {self.quiz} "
@@ -137,9 +170,31 @@ class QuizAttempt(models.Model):
             question_attempt.check_answer()
             question_attempt.save()
 
-    @property
-    def is_available(self):
-        current_time = now()
+    def start(self):
+        """
+        Start an attempt that was prepared by the competition warm-up.
+        The conditional update makes concurrent first requests start the attempt only once.
+        """
+        started = QuizAttempt.objects.filter(pk=self.pk, prepared=True).update(
+            time_start=now(), state=QuizAttempt.State.IN_PROGRESS, prepared=False
+        )
+        self.refresh_from_db(fields=["time_start", "state", "dead_line", "prepared"])
+        if started:
+            # the signals module imports the models
+            from .signals import attempts_started
+
+            # check the availability to update the dead_line from the new start time
+            self.check_availability()
+            attempts_started.send(sender=QuizAttempt, quiz_id=self.quiz_id, attempt_ids=[self.pk])
+
+    def get_dead_line(self, current_time):
+        """
+        Compute the deadline of the attempt without writing anything.
+
+        The deadline is the earlier of the quiz window closing and the time limit after the start,
+        a pending time extension of the student moves it to `current_time` plus the extension,
+        and it never moves earlier than the stored deadline.
+        """
         end_time = (
             self.quiz.open_time_date
             + timedelta(minutes=self.quiz.time_limit)
@@ -149,25 +204,54 @@ class QuizAttempt(models.Model):
             end_time, self.time_start + timedelta(minutes=self.quiz.time_limit)
         )
         if int(self.student.extenstion_time) > 0:
-            end_time = now() + timedelta(minutes=self.student.extenstion_time)
-            self.student.extenstion_time = 0
-            self.student.save()
-        if self.dead_line is None:
-            self.dead_line = end_time
-            self.save()
-        else:
-            self.dead_line = max(self.dead_line, end_time)
+            end_time = current_time + timedelta(minutes=self.student.extenstion_time)
+        if self.dead_line is not None:
+            end_time = max(self.dead_line, end_time)
+        return end_time
+
+    def check_availability(self):
+        """
+        Check if the student can still answer this attempt.
+
+        The deadline and state are computed from the loaded quiz and student (select_related
+        them to keep this to a single read) and written with one conditional UPDATE, only when
+        they change. A pending time extension is consumed with a conditional UPDATE on the student.
+
+        Returns:
+            bool: True if the attempt is open and not submitted.
+        """
+        current_time = now()
+        dead_line = self.get_dead_line(current_time)
+        is_available = self.quiz.open_time_date <= current_time <= dead_line
 
-        is_available = self.quiz.open_time_date <= current_time <= self.dead_line
         if not is_available:
-            self.state = QuizAttempt.State.COMPLETED
-            self.save()
+            state = QuizAttempt.State.COMPLETED
         elif self.state == QuizAttempt.State.SUBMITTED:
-            return False
+            state = self.state
         else:
-            self.state = QuizAttempt.State.IN_PROGRESS
-            self.save()
-        return is_available
+            state = QuizAttempt.State.IN_PROGRESS
+
+        extension = int(self.student.extenstion_time)
+        if extension > 0:
+            Student.objects.filter(pk=self.student_id, extenstion_time=extension).update(
+                extenstion_time=0
+            )
+            self.student.extenstion_time = 0
+
+        if state != self.state or dead_line != self.dead_line:
+            # only apply the change if the state was not changed meanwhile, e.g. by a submit
+            QuizAttempt.objects.filter(pk=self.pk, state=self.state).update(
+                state=state, dead_line=dead_line, time_modified=current_time
+            )
+            self.state = state
+            self.dead_line = dead_line
+
+        return is_available and state != QuizAttempt.State.SUBMITTED
+
+    @property
+    def is_available(self):
+        """Alias of `check_availability` kept for existing callers."""
+        return self.check_availability()
 
 
 class QuestionAttempt(models.Model):
@@ -184,6 +268,13 @@ class QuestionAttempt(models.Model):
     answer_student = models.IntegerField(default=None)
     is_correct = models.BooleanField(default=None)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["quiz_attempt", "question"], name="unique_question_attempt"
+            )
+        ]
+
     def __str__(self):
         return f"{self.id} {self.question} {self.quiz_attempt}"
 
@@ -192,3 +283,50 @@ class QuestionAttempt(models.Model):
             self.is_correct = True
         else:
             self.is_correct = False
+
+
+class MarkingJob(models.Model):
+    """Represents a background marking run of a quiz, executed by the `run_marking_worker` command.
+
+    Fields:
+        id: The primary key for the marking job.
+        quiz (ForeignKey): The quiz being marked.
+        state (IntegerField): 1 is for queued, 2 is for running, 3 is for done and 4 is for failed.
+        attempts_total (IntegerField): The number of quiz attempts to mark.
+        attempts_processed (IntegerField): The number of quiz attempts marked in committed chunks.
+        last_attempt_id (IntegerField): The id of the last quiz attempt of the last committed chunk,
+            a resumed job continues after it.
+        elapsed_seconds (FloatField): The time spent marking, summed over resumed runs.
+        error (TextField): The error message of the last failed run.
+        tries (IntegerField): The number of times a worker claimed the job. A failed run queues
+            the job again, to resume after its last committed chunk, until it was tried `MARKING_JOB_MAX_TRIES` times.
+        created_at (DateTimeField): When the job was queued.
+        started_at (DateTimeField): When a worker first picked up the job.
+        finished_at (DateTimeField): When the job finished or failed.
+        heartbeat_at (DateTimeField): Last time the running worker committed a chunk.
+    """
+
+    class State(models.IntegerChoices):
+        QUEUED = 1
+        RUNNING = 2
+        DONE = 3
+        FAILED = 4
+
+    id = models.AutoField(primary_key=True)
+    quiz = models.ForeignKey(
+        Quiz, on_delete=models.CASCADE, related_name="marking_jobs")
+    state = models.IntegerField(
+        choices=State.choices, default=State.QUEUED)
+    attempts_total = models.IntegerField(default=0)
+    attempts_processed = models.IntegerField(default=0)
+    last_attempt_id = models.IntegerField(default=0)
+    elapsed_seconds = models.FloatField(default=0)
+    error = models.TextField(default="", blank=True)
+    tries = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.id} {self.quiz} {self.get_state_display()}"
@@ -0,0 +1,81 @@
+"""
+Pre-encoded competition papers.
+
+The slots of a competition quiz are the same for every student, so they are serialized
+once per quiz version and cached as JSON bytes. The version is `Quiz.updated_at`, which
+the receivers in `signals.py` bump whenever a slot, question, answer or image changes.
+"""
+
+import json
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import QuizSlot
+from .serializers import CompQuizSlotSerializer
+
+# seconds a serialized paper stays cached
+PAPER_CACHE_TIMEOUT = 60 * 60
+
+
+def build_paper(quiz_id):
+    """
+    Serialize the slots of a quiz, ordered by slot index, in three queries.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+
+    Returns:
+        bytes: The JSON encoded list of slots.
+    """
+    slots = (
+        QuizSlot.objects.filter(quiz_id=quiz_id)
+        .select_related("question")
+        .prefetch_related("question__images")
+        .order_by("slot_index")
+    )
+    return JSONRenderer().render(CompQuizSlotSerializer(slots, many=True).data)
+
+
+def get_paper(quiz):
+    """
+    Get the serialized slots of a quiz from the cache, building them on a miss.
+
+    Args:
+        quiz (Quiz): The quiz instance.
+
+    Returns:
+        bytes: The JSON encoded list of slots.
+    """
+    version = quiz.updated_at.timestamp() if quiz.updated_at else 0
+    return cache.get_or_set(
+        f"quiz:{quiz.id}:paper:{version}",
+        lambda: build_paper(quiz.id),
+        PAPER_CACHE_TIMEOUT,
+    )
+
+
+def render_paper_response(paper, end_time, quiz_attempt_id):
+    """
+    Merge the per-student fields into a cached paper without decoding it.
+
+    Args:
+        paper (bytes): The JSON encoded list of slots.
+        end_time (datetime): The deadline of the student's attempt.
+        quiz_attempt_id (int): The primary key of the student's attempt.
+
+    Returns:
+        bytes: The JSON encoded `{"data", "end_time", "quiz_attempt_id"}` object.
+    """
+    return b"".join(
+        [
+            b'{"data":',
+            paper,
+            b',"end_time":',
+            json.dumps(end_time, cls=JSONEncoder).encode(),
+            b',"quiz_attempt_id":',
+            json.dumps(quiz_attempt_id).encode(),
+            b"}",
+        ]
+    )
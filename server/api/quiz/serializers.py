@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from api.question.models import Question, Category
 from api.question.serializers import AnswerSerializer, ImageSerializer
-from api.quiz.models import Quiz, QuizSlot, QuizAttempt, QuestionAttempt
+from api.quiz.models import Quiz, QuizSlot, QuizAttempt, QuestionAttempt, MarkingJob
 
 
 class QuestionSerializer(serializers.ModelSerializer):
@@ -108,6 +108,8 @@ class QuizAttemptSerializer(serializers.ModelSerializer):
     class Meta:
         model = QuizAttempt
         fields = "__all__"
+        # the views look up the existing attempt first, the unique (quiz, student) constraint catches races
+        validators = []
 
 
 class QuestionAttemptSerializer(serializers.ModelSerializer):
@@ -118,3 +120,40 @@ class QuestionAttemptSerializer(serializers.ModelSerializer):
     class Meta:
         model = QuestionAttempt
         fields = "__all__"
+        # answers are upserted on the unique (quiz_attempt, question) pair
+        validators = []
+
+
+class BatchAnswerSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    answer_student = serializers.IntegerField(min_value=0, max_value=999)
+
+
+class AnswerBatchSerializer(serializers.Serializer):
+    """
+    A batch of answers of a quiz attempt. `seq` is increased by the client for every new
+    batch, so a retried batch is recognised and not applied twice.
+    """
+
+    seq = serializers.IntegerField(min_value=1)
+    answers = BatchAnswerSerializer(many=True, allow_empty=False)
+
+
+class MarkingJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the progress of a background marking job.
+    """
+
+    state = serializers.CharField(source="get_state_display", read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    def get_progress(self, obj):
+        if obj.state == MarkingJob.State.DONE:
+            return 100.0
+        if not obj.attempts_total:
+            return 0.0
+        return round(100 * obj.attempts_processed / obj.attempts_total, 1)
+
+    class Meta:
+        model = MarkingJob
+        fields = "__all__"
@@ -1,3 +1,39 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from django.utils.timezone import now
+
+from api.question.models import Question, Answer, Image
+from .models import Quiz, QuizSlot
+
+# Sent by the marking engine after attempts of quizzes were marked in bulk,
+# with the keyword argument `quiz_ids`. Bulk updates do not send post_save.
+attempts_marked = Signal()
+# Sent by `QuizAttempt.start` after an attempt pre-created by the competition warm-up was started,
+# with the keyword arguments `quiz_id` and `attempt_ids`. The start is a conditional update.
+attempts_started = Signal()
+
+
+# Quiz.updated_at versions the cached answer keys and papers of a quiz,
+# so it is bumped whenever anything shown in or marked by the quiz changes.
+
+@receiver([post_save, post_delete], sender=QuizSlot)
+def touch_quiz_of_slot(sender, instance, **kwargs):
+    Quiz.objects.filter(id=instance.quiz_id).update(updated_at=now())
+
+
+@receiver([post_save, post_delete], sender=Question)
+def touch_quizzes_of_question(sender, instance, **kwargs):
+    Quiz.objects.filter(quiz_slots__question_id=instance.id).update(updated_at=now())
+
+
+@receiver([post_save, post_delete], sender=Answer)
+@receiver([post_save, post_delete], sender=Image)
+def touch_quizzes_of_question_detail(sender, instance, **kwargs):
+    Quiz.objects.filter(quiz_slots__question_id=instance.question_id).update(
+        updated_at=now()
+    )
+
+
 # from django.db.models.signals import post_save
 # from django.dispatch import receiver
 # from .models import Quiz
@@ -0,0 +1,426 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import APITestCase, APIClient
+
+from api.question.models import Question, Answer
+from api.users.models import School, Student
+from .models import Quiz, QuizSlot, QuizAttempt, QuestionAttempt, MarkingJob
+from .marking import (
+    load_answer_key,
+    mark_quiz,
+    enqueue_marking_job,
+    claim_marking_job,
+    run_marking_job,
+    remark_question,
+    MARKING_JOB_MAX_TRIES,
+)
+from .paper import get_paper
+from .warmup import warm_up_competition
+
+
+class MarkingTestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            username="admin", password="password", is_staff=True
+        )
+        self.client.force_authenticate(user=self.admin)
+
+        self.school = School.objects.create(name="Test School", code="TS1")
+        self.quiz = Quiz.objects.create(
+            name="Competition",
+            intro="intro",
+            total_marks=5,
+            is_comp=True,
+            open_time_date=now(),
+            time_window=30,
+        )
+        self.question1 = Question.objects.create(
+            name="q1", is_comp=True, diff_level=1, mark=2
+        )
+        self.question2 = Question.objects.create(
+            name="q2", is_comp=True, diff_level=1, mark=3
+        )
+        Answer.objects.create(question=self.question1, value=10)
+        Answer.objects.create(question=self.question2, value=20)
+        Answer.objects.create(question=self.question2, value=21)
+        QuizSlot.objects.create(quiz=self.quiz, question=self.question1, slot_index=1, block=1)
+        QuizSlot.objects.create(quiz=self.quiz, question=self.question2, slot_index=2, block=1)
+
+        self.attempts = self.create_attempts(self.quiz, [(10, 21), (10, 99), (1, 2)])
+
+    def create_attempts(self, quiz, answer_pairs):
+        """Create an attempt of a new student at the quiz for each pair of answers to the two questions."""
+        attempts = []
+        for answers in answer_pairs:
+            index = User.objects.count()
+            user = User.objects.create_user(username=f"student{index}", password="password")
+            student = Student.objects.create(user=user, school=self.school, year_level="7")
+            attempt = QuizAttempt.objects.create(
+                quiz=quiz, student=student, current_page=0, total_marks=0
+            )
+            for question, answer in zip([self.question1, self.question2], answers):
+                QuestionAttempt.objects.create(
+                    student=student,
+                    question=question,
+                    quiz_attempt=attempt,
+                    answer_student=answer,
+                    is_correct=False,
+                )
+            attempts.append(attempt)
+        return attempts
+
+    def test_load_answer_key(self):
+        answer_key = load_answer_key(self.quiz.id)
+        self.assertEqual(answer_key[self.question1.id], (frozenset({10}), 2))
+        self.assertEqual(answer_key[self.question2.id], (frozenset({20, 21}), 3))
+
+    def test_mark_quiz_sets_totals(self):
+        stats = mark_quiz(self.quiz.id, chunk_size=2)
+
+        totals = [QuizAttempt.objects.get(id=attempt.id).total_marks for attempt in self.attempts]
+        self.assertEqual(totals, [5, 2, 0])
+        self.assertEqual(stats["quiz_attempts"], 3)
+        self.assertEqual(stats["question_attempts"], 6)
+        self.assertEqual(stats["updated_question_attempts"], 3)
+        self.assertEqual(stats["updated_quiz_attempts"], 2)
+
+    def test_mark_quiz_query_count_is_independent_of_attempts(self):
+        larger_quiz = Quiz.objects.create(name="Larger", intro="intro", total_marks=5, open_time_date=now())
+        QuizSlot.objects.create(quiz=larger_quiz, question=self.question1, slot_index=1, block=1)
+        QuizSlot.objects.create(quiz=larger_quiz, question=self.question2, slot_index=2, block=1)
+        self.create_attempts(larger_quiz, [(10, 21), (10, 99), (1, 2), (2, 20)] * 5)
+
+        with CaptureQueriesContext(connection) as small:
+            mark_quiz(self.quiz.id, chunk_size=100)
+        with CaptureQueriesContext(connection) as large:
+            stats = mark_quiz(larger_quiz.id, chunk_size=100)
+
+        self.assertEqual(stats["quiz_attempts"], 20)
+        self.assertEqual(len(large), len(small))
+
+    def test_remark_question_adjusts_totals_by_delta(self):
+        mark_quiz(self.quiz.id)
+        Answer.objects.filter(question=self.question2).delete()
+        Answer.objects.create(question=self.question2, value=99)
+
+        stats = remark_question(self.question2.id)
+
+        totals = [QuizAttempt.objects.get(id=attempt.id).total_marks for attempt in self.attempts]
+        self.assertEqual(totals, [2, 5, 0])
+        self.assertEqual(stats["question_attempts"], 3)
+        self.assertEqual(stats["updated_question_attempts"], 2)
+
+    def test_remark_question_applies_mark_change(self):
+        mark_quiz(self.quiz.id)
+        Question.objects.filter(id=self.question1.id).update(mark=4)
+
+        remark_question(self.question1.id, previous_mark=2)
+
+        totals = [QuizAttempt.objects.get(id=attempt.id).total_marks for attempt in self.attempts]
+        self.assertEqual(totals, [7, 4, 0])
+
+    def test_marking_endpoint_queues_a_single_job(self):
+        url = f"/api/quiz/admin-quizzes/{self.quiz.id}/marking/"
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["job"]["state"], "Queued")
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(MarkingJob.objects.filter(quiz=self.quiz).count(), 1)
+
+    def test_marking_job_runs_to_completion(self):
+        job, _ = enqueue_marking_job(self.quiz.id)
+        self.assertEqual(claim_marking_job().id, job.id)
+        self.assertIsNone(claim_marking_job())
+
+        job = run_marking_job(MarkingJob.objects.get(id=job.id), chunk_size=2)
+
+        self.assertEqual(job.state, MarkingJob.State.DONE)
+        self.assertEqual(job.attempts_processed, 3)
+        self.assertEqual(job.last_attempt_id, self.attempts[-1].id)
+        response = self.client.get(f"/api/quiz/admin-quizzes/{self.quiz.id}/marking-status/")
+        self.assertEqual(response.data["progress"], 100.0)
+
+    def test_marking_job_resumes_after_last_committed_chunk(self):
+        job = MarkingJob.objects.create(
+            quiz=self.quiz,
+            state=MarkingJob.State.RUNNING,
+            attempts_processed=1,
+            last_attempt_id=self.attempts[0].id,
+            heartbeat_at=now() - timedelta(hours=1),
+        )
+        job = run_marking_job(claim_marking_job())
+
+        self.assertEqual(job.attempts_total, 3)
+        self.assertEqual(job.attempts_processed, 3)
+        # the first attempt was part of the committed chunk and is not marked again
+        self.assertEqual(QuizAttempt.objects.get(id=self.attempts[0].id).total_marks, 0)
+        self.assertEqual(QuizAttempt.objects.get(id=self.attempts[1].id).total_marks, 2)
+
+    def test_failed_marking_job_is_retried_from_last_committed_chunk(self):
+        job, _ = enqueue_marking_job(self.quiz.id)
+        MarkingJob.objects.filter(id=job.id).update(attempts_processed=1, last_attempt_id=self.attempts[0].id)
+
+        # a chunk size of zero makes the run fail before any chunk is committed
+        job = run_marking_job(claim_marking_job(), chunk_size=0)
+        self.assertEqual(job.state, MarkingJob.State.QUEUED)
+        self.assertEqual(job.tries, 1)
+        self.assertNotEqual(job.error, "")
+
+        job = run_marking_job(claim_marking_job())
+        self.assertEqual(job.state, MarkingJob.State.DONE)
+        self.assertEqual(job.tries, 2)
+        self.assertEqual(job.attempts_processed, 3)
+        self.assertEqual(QuizAttempt.objects.get(id=self.attempts[0].id).total_marks, 0)
+        self.assertEqual(QuizAttempt.objects.get(id=self.attempts[1].id).total_marks, 2)
+
+    def test_marking_job_fails_after_max_tries(self):
+        job, _ = enqueue_marking_job(self.quiz.id)
+        for _ in range(MARKING_JOB_MAX_TRIES):
+            job = run_marking_job(claim_marking_job(), chunk_size=0)
+
+        self.assertEqual(job.state, MarkingJob.State.FAILED)
+        self.assertEqual(job.tries, MARKING_JOB_MAX_TRIES)
+        self.assertIsNone(claim_marking_job())
+
+
+class IncrementalMarkingTestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        school = School.objects.create(name="Test School", code="TS1")
+        self.user = User.objects.create_user(username="student", password="password")
+        self.student = Student.objects.create(user=self.user, school=school, year_level="8")
+        self.client.force_authenticate(user=self.user)
+
+        self.quiz = Quiz.objects.create(
+            name="Competition",
+            intro="intro",
+            total_marks=2,
+            is_comp=True,
+            open_time_date=now() - timedelta(minutes=1),
+            time_window=30,
+        )
+        self.question = Question.objects.create(
+            name="q1", is_comp=True, diff_level=1, mark=2
+        )
+        Answer.objects.create(question=self.question, value=7)
+        QuizSlot.objects.create(quiz=self.quiz, question=self.question, slot_index=1, block=1)
+        self.attempt = QuizAttempt.objects.create(
+            quiz=self.quiz, student=self.student, current_page=0, total_marks=0
+        )
+
+    def answer(self, value):
+        return self.client.post(
+            "/api/quiz/question-attempts/",
+            {
+                "quiz_attempt": self.attempt.id,
+                "question": self.question.id,
+                "answer_student": value,
+            },
+            format="json",
+        )
+
+    def test_answers_are_marked_on_write(self):
+        response = self.answer(7)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data["is_correct"])
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.total_marks, 2)
+
+        # changing to a wrong answer removes the marks again
+        response = self.answer(8)
+        self.assertEqual(response.status_code, 200)
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.total_marks, 0)
+        self.assertFalse(QuestionAttempt.objects.get(quiz_attempt=self.attempt).is_correct)
+
+        # answering correctly twice only counts once
+        self.answer(7)
+        self.answer(7)
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.total_marks, 2)
+
+    def test_repeated_answers_do_not_create_duplicates(self):
+        self.answer(7)
+        self.answer(7)
+        self.assertEqual(QuestionAttempt.objects.filter(quiz_attempt=self.attempt).count(), 1)
+        with self.assertRaises(IntegrityError):
+            QuestionAttempt.objects.create(
+                student=self.student,
+                question=self.question,
+                quiz_attempt=self.attempt,
+                answer_student=1,
+                is_correct=False,
+            )
+
+    def test_answer_batch_is_applied_once(self):
+        url = f"/api/quiz/quiz-attempts/{self.attempt.id}/answers/"
+        batch = {"seq": 1, "answers": [{"question": self.question.id, "answer_student": 7}]}
+        response = self.client.post(url, batch, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["seq"], 1)
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.total_marks, 2)
+
+        response = self.client.post(
+            url,
+            {"seq": 2, "answers": [{"question": self.question.id, "answer_student": 8}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # a retry of the first batch does not overwrite the newer answer
+        response = self.client.post(url, batch, format="json")
+        self.assertEqual(response.data["seq"], 2)
+        self.assertEqual(response.data["answers"], [{"question": self.question.id, "answer_student": 8}])
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.total_marks, 0)
+        self.assertEqual(QuestionAttempt.objects.filter(quiz_attempt=self.attempt).count(), 1)
+
+    def test_answer_batch_rejects_questions_outside_the_quiz(self):
+        other = Question.objects.create(name="q2", is_comp=True, diff_level=1, mark=1)
+        response = self.client.post(
+            f"/api/quiz/quiz-attempts/{self.attempt.id}/answers/",
+            {"seq": 1, "answers": [{"question": other.id, "answer_student": 1}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(QuestionAttempt.objects.exists())
+
+
+class AvailabilityTestCase(APITestCase):
+    def setUp(self):
+        school = School.objects.create(name="Test School", code="TS1")
+        user = User.objects.create_user(username="student", password="password")
+        self.student = Student.objects.create(user=user, school=school, year_level="8")
+        self.quiz = Quiz.objects.create(
+            name="Competition",
+            intro="intro",
+            total_marks=2,
+            is_comp=True,
+            open_time_date=now() - timedelta(minutes=1),
+            time_window=30,
+        )
+        self.attempt = QuizAttempt.objects.create(
+            quiz=self.quiz,
+            student=self.student,
+            current_page=0,
+            total_marks=0,
+            state=QuizAttempt.State.IN_PROGRESS,
+        )
+
+    def get_attempt(self):
+        return QuizAttempt.objects.select_related("quiz", "student").get(id=self.attempt.id)
+
+    def test_check_availability_only_writes_changes(self):
+        attempt = self.get_attempt()
+        with self.assertNumQueries(1):
+            self.assertTrue(attempt.check_availability())
+        self.assertIsNotNone(QuizAttempt.objects.get(id=attempt.id).dead_line)
+
+        # the deadline is already stored, so nothing is written
+        attempt = self.get_attempt()
+        with self.assertNumQueries(0):
+            self.assertTrue(attempt.check_availability())
+
+    def test_extension_is_consumed_once(self):
+        QuizAttempt.objects.filter(id=self.attempt.id).update(
+            time_start=now() - timedelta(hours=3), dead_line=now() - timedelta(minutes=1)
+        )
+        Student.objects.filter(id=self.student.id).update(extenstion_time=10)
+
+        attempt = self.get_attempt()
+        self.assertTrue(attempt.check_availability())
+        self.assertEqual(Student.objects.get(id=self.student.id).extenstion_time, 0)
+        dead_line = QuizAttempt.objects.get(id=attempt.id).dead_line
+        self.assertGreater(dead_line, now() + timedelta(minutes=9))
+
+        # checking again keeps the extended deadline without writing
+        attempt = self.get_attempt()
+        with self.assertNumQueries(0):
+            self.assertTrue(attempt.check_availability())
+
+    def test_closed_attempt_is_completed(self):
+        QuizAttempt.objects.filter(id=self.attempt.id).update(
+            dead_line=now() - timedelta(minutes=1)
+        )
+        Quiz.objects.filter(id=self.quiz.id).update(
+            open_time_date=now() - timedelta(hours=3)
+        )
+
+        self.assertFalse(self.get_attempt().check_availability())
+        self.assertEqual(
+            QuizAttempt.objects.get(id=self.attempt.id).state, QuizAttempt.State.COMPLETED
+        )
+
+
+class CompetitionPaperTestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        school = School.objects.create(name="Test School", code="TS1")
+        self.user = User.objects.create_user(username="student", password="password")
+        Student.objects.create(user=self.user, school=school, year_level="8")
+        self.client.force_authenticate(user=self.user)
+
+        self.quiz = Quiz.objects.create(
+            name="Competition",
+            intro="intro",
+            total_marks=2,
+            is_comp=True,
+            visible=True,
+            status=1,
+            open_time_date=now() - timedelta(minutes=1),
+            time_window=30,
+        )
+        self.question = Question.objects.create(
+            name="q1", question_text="1 + 1", is_comp=True, diff_level=1, mark=2
+        )
+        QuizSlot.objects.create(quiz=self.quiz, question=self.question, slot_index=1, block=1)
+
+    def test_slots_merge_attempt_into_cached_paper(self):
+        response = self.client.get(f"/api/quiz/competition/{self.quiz.id}/slots/")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        attempt = QuizAttempt.objects.get(quiz=self.quiz)
+        self.assertEqual(data["quiz_attempt_id"], attempt.id)
+        self.assertIsNotNone(data["end_time"])
+        self.assertEqual(data["data"][0]["question"]["question_text"], "1 + 1")
+        self.assertNotIn("answers", data["data"][0]["question"])
+
+    def test_paper_is_cached_until_a_question_changes(self):
+        quiz = Quiz.objects.get(id=self.quiz.id)
+        get_paper(quiz)
+        with self.assertNumQueries(0):
+            get_paper(quiz)
+
+        self.question.question_text = "2 + 2"
+        self.question.save()
+
+        quiz = Quiz.objects.get(id=self.quiz.id)
+        self.assertIn(b"2 + 2", get_paper(quiz))
+
+    def test_warm_up_pre_creates_attempts_started_on_first_request(self):
+        stats = warm_up_competition(Quiz.objects.get(id=self.quiz.id))
+        self.assertEqual(stats["attempts_created"], 1)
+        attempt = QuizAttempt.objects.get(quiz=self.quiz)
+        self.assertTrue(attempt.prepared)
+        # running the warm-up again does not create duplicates
+        self.assertEqual(warm_up_competition(self.quiz)["attempts_created"], 0)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            QuizAttempt.objects.create(quiz=self.quiz, student=attempt.student, current_page=0, total_marks=0)
+
+        response = self.client.get(f"/api/quiz/competition/{self.quiz.id}/slots/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["quiz_attempt_id"], attempt.id)
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.state, QuizAttempt.State.IN_PROGRESS)
+        self.assertFalse(attempt.prepared)
+        self.assertGreater(attempt.time_start, self.quiz.open_time_date)
+        self.assertIsNotNone(attempt.dead_line)
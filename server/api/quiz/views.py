@@ -1,5 +1,5 @@
 from rest_framework import viewsets, mixins
-from .models import Quiz, QuizSlot, QuizAttempt, QuestionAttempt
+from .models import Quiz, QuizSlot, QuizAttempt, QuestionAttempt, MarkingJob
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.decorators import action, permission_classes
 from rest_framework.permissions import IsAdminUser, AllowAny, IsAuthenticated
@@ -9,8 +9,9 @@ from .serializers import (
     QuizAttemptSerializer,
     QuestionAttemptSerializer,
     AdminQuizSerializer,
-    CompQuizSlotSerializer,
     UserQuizSerializer,
+    MarkingJobSerializer,
+    AnswerBatchSerializer,
 )
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
@@ -19,6 +20,10 @@ from datetime import timedelta
 from django.utils.timezone import now
 from api.team.models import TeamMember
 from django.db.models import Count
+from .marking import enqueue_marking_job, get_answer_key, save_answers
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from .paper import get_paper, render_paper_response
 
 
 @permission_classes([IsAdminUser])
@@ -99,33 +104,40 @@ class AdminQuizViewSet(viewsets.ModelViewSet):
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=True, methods=["get"])
+    @action(detail=True, methods=["get", "post"])
     def marking(self, request, pk=None):
         """
-        Mark the quiz attempt.
+        Queue a background job to mark the quiz attempts of a quiz.
+        The job is run by the `run_marking_worker` management command,
+        if a job is already queued or running for the quiz it is returned instead.
+        api: /api/quiz/admin-quizzes/1/marking/
         """
+        try:
+            job, created = enqueue_marking_job(pk)
+        except Quiz.DoesNotExist:
+            return Response(
+                {"error": "Quiz not exist"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(
+            {
+                "message": "Marking job queued." if created else "Marking job already in progress.",
+                "job": MarkingJobSerializer(job).data,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-        # get the quiz attempts
-        quiz_attempts = QuizAttempt.objects.all().filter(quiz_id=pk)
-
-        for attempt in quiz_attempts:
-            question_attempts = attempt.question_attempts.all()
-            total_marks = 0
-            for question_attempt in question_attempts:
-                question = question_attempt.question
-                answers_list = question.answers.all()
-                answers = [answer.value for answer in answers_list]
-                if question_attempt.answer_student in answers:
-                    total_marks += question.mark
-                    question_attempt.is_correct = True
-                    question_attempt.save()
-                else:
-                    question_attempt.is_correct = False
-                    question_attempt.save()
-            attempt.total_marks = total_marks
-            attempt.save()
-
-        return Response({"message": "Quiz attempt marked successfully."})
+    @action(detail=True, methods=["get"], url_path="marking-status")
+    def marking_status(self, request, pk=None):
+        """
+        Retrieve the progress of the latest marking job of a quiz.
+        api: /api/quiz/admin-quizzes/1/marking-status/
+        """
+        job = MarkingJob.objects.filter(quiz_id=pk).order_by("-id").first()
+        if job is None:
+            return Response(
+                {"error": "No marking job for this quiz"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(MarkingJobSerializer(job).data)
 
     @action(detail=False, methods=["get"])
     def get_quiz_name(self, request):
@@ -263,16 +275,18 @@ class CompetitionQuizViewSet(viewsets.ReadOnlyModelViewSet):
             )
 
         student_id = user.student.id
-        existing_attempt = QuizAttempt.objects.filter(
-            quiz_id=pk, student_id=student_id
-        ).first()
+        existing_attempt = (
+            QuizAttempt.objects.filter(quiz_id=pk, student_id=student_id)
+            .select_related("quiz", "student")
+            .first()
+        )
         # if attempt after the quiz has finished:
         is_available = self._is_available(quiz_instance, existing_attempt)
 
         user = request.user.student
         if (
             existing_attempt is not None
-            and user.quiz_attempts.get(quiz_id=pk).state == QuizAttempt.State.SUBMITTED
+            and existing_attempt.state == QuizAttempt.State.SUBMITTED
         ):
             return Response(
                 {"error": "Quiz has submitted "}, status=status.HTTP_400_BAD_REQUEST
@@ -284,7 +298,7 @@ class CompetitionQuizViewSet(viewsets.ReadOnlyModelViewSet):
             )
         # check the attempt is available or not
         elif is_available is True:
-            return self._get_slots_response(pk, existing_attempt, user)
+            return self._get_slots_response(quiz_instance, existing_attempt, user)
         else:
             return is_available
 
@@ -309,8 +323,8 @@ class CompetitionQuizViewSet(viewsets.ReadOnlyModelViewSet):
                 + timedelta(minutes=quiz.time_window)
             )
 
-            # if never attempt before, no attempt instance yet
-            if attempt is None:
+            # if never attempt before, no attempt instance yet or only the one prepared by the warm-up
+            if attempt is None or attempt.prepared:
                 if start_time <= current_time <= end_time:
                     return True
                 elif current_time < start_time:
@@ -324,7 +338,7 @@ class CompetitionQuizViewSet(viewsets.ReadOnlyModelViewSet):
                     )
             # if the user has already attempted the quiz
             else:
-                if attempt.is_available:
+                if attempt.check_availability():
                     return True
                 else:
                     return Response(
@@ -336,53 +350,60 @@ class CompetitionQuizViewSet(viewsets.ReadOnlyModelViewSet):
                 {"error": "Quiz not exist"}, status=status.HTTP_404_NOT_FOUND
             )
 
-    def _get_slots_response(self, quiz_id, existing_attempt, student):
+    def _get_slots_response(self, quiz, existing_attempt, student):
         """
         Get the response containing the slosts data.
         The slots are corresponding sorted questions of the quiz.
+        The slots are the same for every student, so they are served from the cached paper
+        and only the end time and attempt id are added per request.
 
         Args:
-            quiz_id (int): The primary key of the quiz.
+            quiz (Quiz): The quiz instance.
             existing_attempt (QuizAttempt): The existing quiz attempt.
             user (User): The current user.
 
         Returns:
-            Response: The response object containing the slots data.
+            HttpResponse: The response object containing the slots data.
         """
-        # Find the team for the student
-        team_member = TeamMember.objects.filter(student=student.id).first()
-        team_id = team_member.team.id if team_member else None
-
         if existing_attempt is None:
+            # Find the team for the student
+            team_member = TeamMember.objects.filter(student=student.id).first()
+            team_id = team_member.team_id if team_member else None
             quiz_attempt_serializer = QuizAttemptSerializer(
                 data={
-                    "quiz": quiz_id,
+                    "quiz": quiz.id,
                     "student": student.id,
                     "state": QuizAttempt.State.IN_PROGRESS,
                     "team": team_id,
                 }
             )
             quiz_attempt_serializer.is_valid(raise_exception=True)
-            attempt = quiz_attempt_serializer.save()
-
-            # run attempt.is_available to update the dead_line
-            attempt.is_available
+            try:
+                with transaction.atomic():
+                    attempt = quiz_attempt_serializer.save()
+            except IntegrityError:
+                # a concurrent request or the warm-up created the attempt first
+                attempt = QuizAttempt.objects.get(quiz=quiz, student=student)
+            attempt.quiz = quiz
+            attempt.student = student
+
+            if attempt.prepared:
+                attempt.start()
+            else:
+                # check the availability to update the dead_line
+                attempt.check_availability()
             end_time = attempt.dead_line
             quiz_attempt_id = attempt.id
             existing_attempt = attempt
         else:
+            if existing_attempt.prepared:
+                existing_attempt.start()
             end_time = existing_attempt.dead_line
             quiz_attempt_id = existing_attempt.id
         # wrap the end_time into the response
-        instances = QuizSlot.objects.filter(quiz_id=quiz_id)
-        serializer = CompQuizSlotSerializer(instances, many=True)
-
-        return Response(
-            {
-                "data": serializer.data,
-                "end_time": end_time,
-                "quiz_attempt_id": quiz_attempt_id,
-            },
+        return HttpResponse(
+            render_paper_response(get_paper(quiz), end_time, quiz_attempt_id),
+            content_type="application/json",
             status=status.HTTP_200_OK,
         )
 
@@ -467,12 +488,14 @@ class QuizAttemptViewSet(viewsets.ModelViewSet):
         print("-----------------------------------------")
         print("-----------------------------------------\n\n")
 
-        existing_attempt = QuizAttempt.objects.filter(
-            quiz_id=quiz_id, student_id=student_id
-        ).first()
+        existing_attempt = (
+            QuizAttempt.objects.filter(quiz_id=quiz_id, student_id=student_id)
+            .select_related("quiz", "student")
+            .first()
+        )
 
         if existing_attempt:
-            if not existing_attempt.is_available:
+            if not existing_attempt.check_availability():
                 return Response(
                     {"error": "Quiz has finished"}, status=status.HTTP_403_FORBIDDEN
                 )
@@ -511,7 +534,12 @@ class QuizAttemptViewSet(viewsets.ModelViewSet):
             data["team"] = team.id if team else None
             serializer = self.get_serializer(data=data)
             serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
+            try:
+                with transaction.atomic():
+                    self.perform_create(serializer)
+            except IntegrityError:
+                # a concurrent request created the attempt first, answer as for an existing one
+                return self.create(request, *args, **kwargs)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
@@ -573,6 +601,67 @@ class QuizAttemptViewSet(viewsets.ModelViewSet):
         print("-----------------------------------------\n\n")
         return Response({"message": "Quiz attempt submitted successfully."})
 
+    @action(detail=True, methods=["post"])
+    def answers(self, request, pk=None):
+        """
+        Save a batch of answers of the quiz attempt in a single transaction.
+
+        The body holds a client sequence number and the answers, e.g.
+        `{"seq": 3, "answers": [{"question": 1, "answer_student": 42}]}`.
+        A retried batch (a `seq` not newer than the last applied one) is not applied again,
+        the stored answers are returned instead.
+        """
+        if not hasattr(request.user, "student"):
+            return Response(
+                {"error": "You are not authorized to perform this action."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        serializer = AnswerBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        seq = serializer.validated_data["seq"]
+        answers = {
+            answer["question"]: answer["answer_student"]
+            for answer in serializer.validated_data["answers"]
+        }
+
+        with transaction.atomic():
+            # lock the quiz attempt so that concurrent batches of the same student are applied one at a time
+            attempt = (
+                QuizAttempt.objects.select_for_update(of=("self",))
+                .select_related("quiz", "student")
+                .filter(pk=pk, student_id=request.user.student.id)
+                .first()
+            )
+            if attempt is None:
+                return Response(
+                    {"error": "Quiz attempt not found."}, status=status.HTTP_404_NOT_FOUND
+                )
+            if not attempt.check_availability():
+                return Response(
+                    {"error": "Quiz has finished"}, status=status.HTTP_403_FORBIDDEN
+                )
+            unknown = set(answers) - set(get_answer_key(attempt.quiz))
+            if unknown:
+                return Response(
+                    {"error": f"Questions {sorted(unknown)} are not part of this quiz."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            question_attempts = save_answers(attempt, answers, seq)
+
+        return Response(
+            {
+                "seq": attempt.answer_seq,
+                "answers": [
+                    {
+                        "question": question_attempt.question_id,
+                        "answer_student": question_attempt.answer_student,
+                    }
+                    for question_attempt in question_attempts
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 @permission_classes([IsAuthenticated])
 class QuestionAttemptViewSet(
@@ -595,73 +684,57 @@ class QuestionAttemptViewSet(
 
     def create(self, request, *args, **kwargs):
         """
-        Create a new question attempt. Ensure that a user can continue answering questions upon re-login.
+        Save the answer of a question attempt. Ensure that a user can continue answering questions upon re-login.
+        The answer is inserted or updated in a single statement and marked straight away,
+        and the quiz attempt's total marks are updated with the change.
+        Responds 201 when the question was answered for the first time and 200 when the answer was changed.
         """
-
-        quiz_attempt_id = request.data.get("quiz_attempt")
-        print("quiz_attempt_id", quiz_attempt_id)
-        comp_attempt = QuizAttempt.objects.get(
-            pk=quiz_attempt_id, student_id=request.user.student.id
-        )
-
-        # check if the quiz is available for the user
-        if not comp_attempt.is_available:
+        # if the answer is empty, do nothing
+        if request.data.get("answer_student") == "":
             return Response(
-                {"error": "Quiz has finished"}, status=status.HTTP_403_FORBIDDEN
+                {"message": "Answer not updated."},
+                status=status.HTTP_200_OK,
             )
-
-        question_id = request.data.get("question")
-        print("question_id", question_id)
-        # student_id = int(request.data.get("student"))
-        # TODO: Uncomment this line when using JWT authentication
-        # student_user_id = request.user.id
-        student_id = request.user.student.id
-        print("student2222222_id", request.data)
-
-        # if (
-        #     int(student_user_id) != int(student_id)
-        # ):
-        #     print("studentxxxxxx_id")
-        #     return Response(
-        #         {"error": "You are not authorized to perform this action."},
-        #         status=status.HTTP_403_FORBIDDEN,
-        #     )
-
-        existing_attempt = QuestionAttempt.objects.filter(
-            quiz_attempt_id=quiz_attempt_id, question_id=question_id, student_id=student_id
-        ).first()
-        print("existing_attempt", existing_attempt)
-        if existing_attempt:
-            isSameStduent = existing_attempt.quiz_attempt.student.id == student_id
-            if not isSameStduent:
-                return Response(
-                    {"error": "You are not authorized to perform this action."},
-                    status=status.HTTP_403_FORBIDDEN,
+        serializer = self.get_serializer(
+            data={
+                "quiz_attempt": request.data.get("quiz_attempt"),
+                "question": request.data.get("question"),
+                "answer_student": request.data.get("answer_student"),
+                "student": request.user.student.id,
+                "is_correct": False,
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        question_id = serializer.validated_data["question"].id
+
+        with transaction.atomic():
+            # lock the quiz attempt so that concurrent answers of the same student are marked one at a time
+            comp_attempt = (
+                QuizAttempt.objects.select_for_update(of=("self",))
+                .select_related("quiz", "student")
+                .get(
+                    pk=serializer.validated_data["quiz_attempt"].id,
+                    student_id=request.user.student.id,
                 )
-            new_answer = request.data.get("answer_student")
+            )
 
-            # if the answer is empty, do nothing
-            if new_answer == "":
+            # check if the quiz is available for the user
+            if not comp_attempt.check_availability():
                 return Response(
-                    {"message": "Answer not updated."},
-                    status=status.HTTP_200_OK,
+                    {"error": "Quiz has finished"}, status=status.HTTP_403_FORBIDDEN
                 )
-            # modify the answer
-            existing_attempt.answer_student = request.data.get(
-                "answer_student")
-            existing_attempt.save()
-            new_answer = QuestionAttemptSerializer(existing_attempt).data[
-                "answer_student"
-            ]
-            return Response(
-                {"message": "Answer updated successfully.", "new_answer": new_answer},
-                status=status.HTTP_200_OK,
-            )
-        print("xxxxx", request.data)
-        request.data["student"] = student_id
-        request.data["is_correct"] = False
 
-        return super().create(request, *args, **kwargs)
+            # answers of the attempt are written under its lock, so the row cannot appear in between
+            created = not QuestionAttempt.objects.filter(
+                quiz_attempt=comp_attempt, question_id=question_id
+            ).exists()
+            [question_attempt] = save_answers(
+                comp_attempt, {question_id: serializer.validated_data["answer_student"]}
+            )
+        return Response(
+            self.get_serializer(question_attempt).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
 
     def _is_comp_available(self, quiz_instance):
         # check if the quiz is available for the user
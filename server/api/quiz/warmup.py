@@ -0,0 +1,129 @@
+"""
+Competition warm-up.
+
+Shortly before a competition opens, every eligible student gets a prepared
+`QuizAttempt` (with their team already resolved), so the first `slots` request of each
+student only needs to look up and start its attempt. Students that never start the
+competition keep a prepared attempt, which is no entry of the quiz.
+
+The paper is only built ahead when the default cache is shared with the web workers
+(`CACHE_BACKEND`, e.g. Redis or Memcached), a process-local cache would keep it in the
+warm-up command alone.
+"""
+
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.timezone import now
+
+from api.team.models import TeamMember
+from api.users.models import Student
+from .models import Quiz, QuizAttempt
+from .paper import get_paper
+
+WARM_UP_BATCH_SIZE = 1000
+
+
+def get_eligible_students(quiz, school_ids=None, year_levels=None):
+    """
+    Get the students that can sit a quiz and do not have an attempt for it yet.
+
+    Args:
+        quiz (Quiz): The competition quiz.
+        school_ids (list): Only include students of these schools.
+        year_levels (list): Only include students of these year levels.
+
+    Returns:
+        QuerySet: The eligible students.
+    """
+    students = Student.objects.exclude(quiz_attempts__quiz_id=quiz.id)
+    if school_ids:
+        students = students.filter(school_id__in=school_ids)
+    if year_levels:
+        students = students.filter(year_level__in=[str(year) for year in year_levels])
+    return students
+
+
+def warm_up_competition(quiz, school_ids=None, year_levels=None, batch_size=WARM_UP_BATCH_SIZE):
+    """
+    Pre-create prepared quiz attempts for the eligible students of a quiz and build its paper.
+
+    Attempts created meanwhile by the students' first requests or another warm-up are
+    skipped by the unique (quiz, student) constraint.
+
+    Args:
+        quiz (Quiz): The competition quiz.
+        school_ids (list): Only include students of these schools.
+        year_levels (list): Only include students of these year levels.
+        batch_size (int): The number of attempts inserted per statement.
+
+    Returns:
+        dict: The number of attempts created and the size of the cached paper in bytes,
+            None when the cache is not shared with the web workers.
+    """
+    student_ids = list(
+        get_eligible_students(quiz, school_ids, year_levels).values_list("id", flat=True)
+    )
+    # a student is expected to be in at most one team, keep the first one like the slots view does
+    teams = {}
+    for student_id, team_id in (
+        TeamMember.objects.filter(student_id__in=student_ids)
+        .order_by("-id")
+        .values_list("student_id", "team_id")
+    ):
+        teams[student_id] = team_id
+
+    with transaction.atomic():
+        existing = QuizAttempt.objects.filter(quiz=quiz).count()
+        QuizAttempt.objects.bulk_create(
+            [
+                QuizAttempt(
+                    quiz=quiz,
+                    student_id=student_id,
+                    team_id=teams.get(student_id),
+                    state=QuizAttempt.State.UNATTEMPTED,
+                    prepared=True,
+                    current_page=0,
+                    total_marks=0,
+                )
+                for student_id in student_ids
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        created = QuizAttempt.objects.filter(quiz=quiz).count() - existing
+
+    paper = get_paper(quiz) if is_cache_shared() else None
+    return {"attempts_created": created, "paper_bytes": None if paper is None else len(paper)}
+
+
+def is_cache_shared():
+    """
+    Check whether the default cache is shared between processes, so that a paper built here reaches the web workers.
+
+    Returns:
+        bool: False for the process-local and dummy cache backends.
+    """
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def get_upcoming_competitions(within):
+    """
+    Get the visible competition quizzes that open within the given time.
+
+    Args:
+        within (timedelta): How far ahead to look.
+
+    Returns:
+        QuerySet: The upcoming competition quizzes.
+    """
+    current_time = now()
+    return Quiz.objects.filter(
+        is_comp=True,
+        visible=True,
+        open_time_date__gte=current_time,
+        open_time_date__lte=current_time + max(within, timedelta(0)),
+    )
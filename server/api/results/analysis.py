@@ -0,0 +1,152 @@
+"""
+Item analysis of the questions of a quiz for the setters.
+
+For each slot of the quiz the share of attempts answering the question correctly, its most
+common wrong answers, its point-biserial correlation with the total marks of the attempts and
+the average position it was answered at are aggregated in the database, in a fixed number of
+queries however many attempts the quiz has. The analysis is cached per quiz and versioned by
+`Quiz.marked_at`, so a new mark replaces it.
+"""
+
+import math
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, IntegerField, OuterRef, Q, StdDev, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from ..quiz.models import QuestionAttempt, QuizAttempt, QuizSlot
+from .insights import get_marked_version
+
+# seconds the analysis stays cached, answers saved without a new mark show up after it
+ITEM_ANALYSIS_CACHE_TIMEOUT = 60 * 60
+# number of wrong answers listed per question by default, and at most
+DEFAULT_WRONG_ANSWERS = 3
+MAX_WRONG_ANSWERS = 10
+
+
+def get_answer_position():
+    """
+    Build the position an answer was given at in its attempt, 1 for the first question answered.
+
+    The answers of an attempt are inserted when a question is first answered and updated in place
+    afterwards, so their ids are in the order the questions were first answered.
+    """
+    earlier = (
+        QuestionAttempt.objects.filter(quiz_attempt_id=OuterRef("quiz_attempt_id"), id__lte=OuterRef("id"))
+        .order_by()
+        .values("quiz_attempt_id")
+        .annotate(position=Count("id"))
+        .values("position")
+    )
+    return Subquery(earlier, output_field=IntegerField())
+
+
+def get_point_biserial(attempts, mean, deviation, correct, correct_total):
+    """
+    Compute the point-biserial correlation of answering a question correctly with the total marks,
+    which include the marks of the question itself.
+
+    Args:
+        attempts (int): The number of attempts at the quiz.
+        mean (float): The mean total marks of the attempts.
+        deviation (float): The population standard deviation of the total marks.
+        correct (int): The number of attempts answering the question correctly.
+        correct_total (int): The sum of the total marks of those attempts.
+
+    Returns:
+        float: The correlation, or None when every or no attempt is correct or the totals are equal.
+    """
+    incorrect = attempts - correct
+    if not correct or not incorrect or not deviation:
+        return None
+    correct_mean = correct_total / correct
+    incorrect_mean = (mean * attempts - correct_total) / incorrect
+    share = correct / attempts
+    return round((correct_mean - incorrect_mean) / deviation * math.sqrt(share * (1 - share)), 3)
+
+
+def build_item_analysis(quiz_id, wrong_answers=DEFAULT_WRONG_ANSWERS):
+    """
+    Analyse each question of a quiz.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        wrong_answers (int): The number of most common wrong answers listed per question.
+
+    Returns:
+        list: One dict per slot of the quiz, in slot order.
+    """
+    # attempts prepared by the warm-up and never started are not entries
+    totals = QuizAttempt.objects.filter(quiz_id=quiz_id, prepared=False).aggregate(
+        attempts=Count("id"),
+        mean=Avg("total_marks"),
+        deviation=StdDev("total_marks"),
+    )
+    answers = QuestionAttempt.objects.filter(quiz_attempt__quiz_id=quiz_id).order_by()
+    correct = Q(is_correct=True)
+    questions = {
+        row["question_id"]: row
+        for row in answers.values("question_id").annotate(
+            answered=Count("id"),
+            correct=Count("id", filter=correct),
+            correct_total=Coalesce(Sum("quiz_attempt__total_marks", filter=correct), 0),
+            average_position=Avg(get_answer_position()),
+        )
+    }
+    # the answers are counted in the database, the few counts per question are ranked here
+    wrong = {}
+    for row in (
+        answers.filter(is_correct=False)
+        .values("question_id", answer=F("answer_student"))
+        .annotate(count=Count("id"))
+        .order_by("question_id", "-count", "answer")
+    ):
+        wrong.setdefault(row.pop("question_id"), []).append(row)
+
+    attempts = totals["attempts"]
+    analysis = []
+    for slot in (
+        QuizSlot.objects.filter(quiz_id=quiz_id)
+        .order_by("slot_index")
+        .values("slot_index", "block", "question_id", "question__name", "question__mark")
+    ):
+        stats = questions.get(slot["question_id"], {})
+        correct_count = stats.get("correct", 0)
+        average_position = stats.get("average_position")
+        analysis.append({
+            "slot_index": slot["slot_index"],
+            "block": slot["block"],
+            "question_id": slot["question_id"],
+            "question_name": slot["question__name"],
+            "mark": slot["question__mark"],
+            "attempts": attempts,
+            "answered": stats.get("answered", 0),
+            "correct": correct_count,
+            "percent_correct": round(correct_count * 100 / attempts, 1) if attempts else None,
+            "point_biserial": get_point_biserial(
+                attempts, totals["mean"], totals["deviation"], correct_count, stats.get("correct_total", 0)
+            ),
+            "average_position": round(average_position, 2) if average_position is not None else None,
+            "wrong_answers": wrong.get(slot["question_id"], [])[:wrong_answers],
+        })
+    return analysis
+
+
+def get_item_analysis(quiz_id, wrong_answers=DEFAULT_WRONG_ANSWERS):
+    """
+    Get the item analysis of a quiz from the cache, building it on a miss.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        wrong_answers (int): The number of most common wrong answers listed per question.
+
+    Returns:
+        list: The analysis returned by `build_item_analysis`.
+
+    Raises:
+        Quiz.DoesNotExist: If there is no quiz with the given id.
+    """
+    key = f"results:item-analysis:{quiz_id}:{get_marked_version(quiz_id)}:{wrong_answers}"
+    return cache.get_or_set(
+        key, lambda: build_item_analysis(quiz_id, wrong_answers), ITEM_ANALYSIS_CACHE_TIMEOUT
+    )
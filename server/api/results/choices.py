@@ -0,0 +1,97 @@
+"""
+Choices of the results filters.
+
+The quizzes and the year levels of the students are read once into the cache, so validating
+the filters of a request does not scan the quiz and student tables. The receivers in
+`signals.py` delete the cached choices when a quiz or a student is saved or deleted, and
+bulk writes which send no signals call `invalidate_filter_choices` themselves.
+
+The receivers only reach the cache of their own process with a per-process cache backend, so
+the choices of other processes can miss a new quiz or year level. `CachedChoiceFilter` looks
+up a value missing from the choices in the database before it rejects it, instead of answering
+400, and drops the cached choices only when the value does exist. A request with an unknown
+value costs one indexed query and no rebuild.
+"""
+
+from django.core.cache import cache
+from django_filters import ChoiceFilter
+from django_filters.fields import ChoiceField
+
+from ..quiz.models import Quiz
+from ..users.models import Student
+
+FILTER_CHOICES_CACHE_KEY = "results:filter-choices"
+# seconds the choices stay cached, they are deleted on change before that
+FILTER_CHOICES_CACHE_TIMEOUT = 60 * 60
+
+
+def build_filter_choices():
+    """
+    Returns:
+        dict: The ids and names of the quizzes in `quizzes`, and the year levels in `year_levels`.
+    """
+    year_levels = Student.objects.order_by().values_list("year_level", flat=True).distinct()
+    return {
+        "quizzes": list(Quiz.objects.order_by("id").values_list("id", "name")),
+        # year levels are text, shorter first puts "9" before "10"
+        "year_levels": sorted(year_levels, key=lambda year_level: (len(year_level), year_level)),
+    }
+
+
+def get_filter_choices():
+    """Get the choices of the results filters from the cache, building them on a miss."""
+    return cache.get_or_set(FILTER_CHOICES_CACHE_KEY, build_filter_choices, FILTER_CHOICES_CACHE_TIMEOUT)
+
+
+def invalidate_filter_choices():
+    cache.delete(FILTER_CHOICES_CACHE_KEY)
+
+
+class CachedChoiceField(ChoiceField):
+    def __init__(self, *args, exists, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exists = exists
+
+    def valid_value(self, value):
+        if super().valid_value(value):
+            return True
+        if not self.exists(value):
+            return False
+        # the choices are a callable, which reads them again once they are no longer cached
+        invalidate_filter_choices()
+        return True
+
+
+class CachedChoiceFilter(ChoiceFilter):
+    """
+    Choice filter of the cached choices, which looks up a value in the database before rejecting it.
+
+    Args:
+        exists (callable): Checks whether a value missing from the cached choices exists.
+    """
+
+    field_class = CachedChoiceField
+
+
+def quiz_id_exists(value):
+    return str(value).isdigit() and Quiz.objects.filter(id=value).exists()
+
+
+def quiz_name_exists(value):
+    return Quiz.objects.filter(name=value).exists()
+
+
+def year_level_exists(value):
+    return Student.objects.filter(year_level=value).exists()
+
+
+def get_quiz_id_choices():
+    return [(quiz_id, quiz_id) for quiz_id, _ in get_filter_choices()["quizzes"]]
+
+
+def get_quiz_name_choices():
+    return [(name, name) for _, name in get_filter_choices()["quizzes"]]
+
+
+def get_year_level_choices():
+    return [(year_level, year_level) for year_level in get_filter_choices()["year_levels"]]
@@ -0,0 +1,342 @@
+"""
+Streaming exports of the results endpoints.
+
+The rows are read with `QuerySet.iterator` and written to the response as they are produced,
+so an export of a large quiz is never held in memory as a whole. The export actions negotiate
+their format from the `format` query parameter, `json` by default, `csv` or `xlsx`.
+XLSX files are written as a zip stream of inline-string worksheets, which needs no
+spreadsheet library and is read by Excel, LibreOffice and the usual parsers.
+"""
+
+import csv
+import io
+import json
+import re
+import zipfile
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+
+# number of rows fetched from the database at a time
+EXPORT_CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_CONTENT_TYPE = "application/zip"
+
+
+def get_error_rows(data):
+    """
+    Get the header and rows of an error response, e.g. `{"detail": "Quiz ID is required."}`.
+    """
+    if isinstance(data, dict):
+        return list(data), [data]
+    return ["detail"], [{"detail": item} for item in data]
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renderer accepting `?format=csv`. The exports stream their own response, so this only
+    renders the errors of an export.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return "".join(stream_csv(*get_error_rows(data))).encode(self.charset)
+
+
+class XLSXRenderer(BaseRenderer):
+    """
+    Renderer accepting `?format=xlsx`. The exports stream their own response, so this only
+    renders the errors of an export.
+    """
+
+    media_type = XLSX_CONTENT_TYPE
+    format = "xlsx"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"".join(stream_xlsx(*get_error_rows(data)))
+
+
+EXPORT_RENDERERS = [JSONRenderer, CSVRenderer, XLSXRenderer]
+
+
+class Echo:
+    """Pseudo-buffer returning what is written to it, so `csv.writer` formats one row at a time."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    """
+    Yield the lines of a CSV file.
+
+    Args:
+        header (list): The column names.
+        rows (iterable): Dicts keyed by the column names.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([row.get(column) for column in header])
+
+
+def stream_json(rows):
+    """
+    Yield the parts of a JSON array.
+
+    Args:
+        rows (iterable): The JSON serializable rows.
+    """
+    yield "["
+    for index, row in enumerate(rows):
+        yield ("," if index else "") + json.dumps(row, cls=DjangoJSONEncoder)
+    yield "]"
+
+
+class ZipStream(io.RawIOBase):
+    """Unseekable file keeping what `zipfile` writes to it until it is taken."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(files):
+    """
+    Yield the bytes of a zip file, each file compressed as its content is produced.
+
+    Args:
+        files (list): The name and the text parts, e.g. of `stream_csv`, of each file.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, parts in files:
+            with archive.open(name, "w") as file:
+                for part in parts:
+                    file.write(part.encode())
+                    yield stream.take()
+    yield stream.take()
+
+
+def get_xlsx_parts(sheet_names):
+    """
+    Get the parts of an XLSX file besides its worksheets, `xl/worksheets/sheet<n>.xml` for
+    the n-th of `sheet_names`.
+    """
+    sheets = range(1, len(sheet_names) + 1)
+    return {
+        "[Content_Types].xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + "".join(
+                f'<Override PartName="/xl/worksheets/sheet{sheet}.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                for sheet in sheets
+            )
+            + "</Types>"
+        ),
+        "_rels/.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="xl/workbook.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            "</Relationships>"
+        ),
+        "xl/workbook.xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(
+                f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{sheet}" r:id="rId{sheet}"/>'
+                for sheet, name in zip(sheets, sheet_names)
+            )
+            + "</sheets></workbook>"
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{sheet}" Target="worksheets/sheet{sheet}.xml" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+                for sheet in sheets
+            )
+            + "</Relationships>"
+        ),
+    }
+
+
+# characters which are not allowed in XML
+INVALID_XML_CHARACTERS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def get_xlsx_row(values):
+    """
+    Get the XML of a worksheet row, with numbers and booleans as typed cells and
+    everything else as inline strings.
+    """
+    cells = []
+    for value in values:
+        if value is None:
+            cells.append("<c/>")
+        elif isinstance(value, bool):
+            cells.append(f'<c t="b"><v>{int(value)}</v></c>')
+        elif isinstance(value, (int, float)):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            text = escape(INVALID_XML_CHARACTERS.sub("", str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>"
+
+
+def stream_xlsx(header, rows):
+    """
+    Yield the bytes of an XLSX file with one worksheet.
+
+    Args:
+        header (list): The column names.
+        rows (iterable): Dicts keyed by the column names.
+    """
+    return stream_xlsx_sheets([("Results", header, rows)])
+
+
+def stream_xlsx_sheets(sheets):
+    """
+    Yield the bytes of an XLSX file with a worksheet for each sheet, written one after the other.
+
+    Args:
+        sheets (list): The name, column names and rows of each sheet, the rows as in `stream_xlsx`.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in get_xlsx_parts([name for name, *_ in sheets]).items():
+            archive.writestr(name, content)
+        for number, (_, header, rows) in enumerate(sheets, 1):
+            with archive.open(f"xl/worksheets/sheet{number}.xml", "w") as sheet:
+                sheet.write(
+                    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                )
+                sheet.write(get_xlsx_row(header).encode())
+                for row in rows:
+                    sheet.write(get_xlsx_row(row.get(column) for column in header).encode())
+                    yield stream.take()
+                sheet.write(b"</sheetData></worksheet>")
+    yield stream.take()
+
+
+def export_response(request, filename, header, rows):
+    """
+    Stream an export in the format accepted by the request.
+
+    Args:
+        request (Request): The request, negotiated by `EXPORT_RENDERERS`.
+        filename (str): The name of the downloaded file, without extension.
+        header (list): The column names.
+        rows (iterable): Dicts keyed by the column names.
+
+    Returns:
+        StreamingHttpResponse: The streamed file.
+    """
+    extension = request.accepted_renderer.format
+    if extension == "csv":
+        response = StreamingHttpResponse(stream_csv(header, rows), content_type="text/csv")
+    elif extension == "xlsx":
+        response = StreamingHttpResponse(stream_xlsx(header, rows), content_type=XLSX_CONTENT_TYPE)
+    else:
+        extension = "json"
+        response = StreamingHttpResponse(stream_json(rows), content_type="application/json")
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+
+def flatten_row(data, prefix=""):
+    """
+    Flatten serialized data into one row, e.g. `{"placements": {"country": {"rank": 1}}}`
+    into `{"placements.country.rank": 1}`, with lists joined into one cell.
+    """
+    row = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            row.update(flatten_row(value, f"{prefix}{key}."))
+        elif isinstance(value, list):
+            row[f"{prefix}{key}"] = "; ".join(str(item) for item in value)
+        else:
+            row[f"{prefix}{key}"] = value
+    return row
+
+
+class ExportMixin:
+    """
+    Adds an `export` action to a results viewset, streaming the filtered rows of a quiz
+    as JSON, CSV or XLSX, with one row per serialized object.
+
+    Views set `export_name` and may override `get_export_row` to shape the rows.
+    """
+
+    export_name = "results"
+
+    def get_export_row(self, data):
+        return flatten_row(data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        pagination_class=None,
+        permission_classes=[IsAdminUser],
+        renderer_classes=EXPORT_RENDERERS,
+    )
+    def export(self, request, *args, **kwargs):
+        quiz_id = request.query_params.get("quiz_id")
+        if not quiz_id:
+            return Response(
+                {"detail": "Quiz ID is required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by("pk")
+        serializer = self.get_serializer()
+        rows = (
+            self.get_export_row(serializer.to_representation(instance))
+            for instance in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        # the header is taken from the first row, which has the columns of nested fields
+        first = next(rows, None)
+        if first is None:
+            header, rows = list(serializer.fields), []
+        else:
+            header, rows = list(first), chain([first], rows)
+        return export_response(request, f"quiz-{quiz_id}-{self.export_name}", header, rows)
@@ -0,0 +1,82 @@
+"""
+Score distributions of a quiz for the results dashboard and the post-competition report.
+
+The total marks of the individual results are binned in the database by integer division with
+the bin width, and counted per bin, year level and school type in one grouped query, so the
+distribution is a few arrays of counts however many students took the quiz. It is cached per
+quiz and bin width, and versioned by `Quiz.marked_at`, so a new mark replaces it.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, ExpressionWrapper, F, IntegerField
+
+from ..quiz.models import Quiz
+from .insights import get_marked_version
+from .models import IndividualResult
+
+# seconds the histograms stay cached, short because answers are marked as they are written
+HISTOGRAM_CACHE_TIMEOUT = 60
+DEFAULT_BIN_WIDTH = 5
+
+
+def build_histogram(quiz_id, bin_width=DEFAULT_BIN_WIDTH):
+    """
+    Count the individual results of a quiz per score bin, in total, by year level and by school type.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        bin_width (int): The number of marks covered by each bin.
+
+    Returns:
+        dict: The lower bounds of the bins in `bins`, and the counts per bin in `all`,
+            `year_level` and `school_type`, e.g. `{"bins": [0, 5], "all": [3, 1], ...}`.
+    """
+    results = IndividualResult.objects.filter(quiz_id=quiz_id).order_by()
+    counts = list(
+        results.values(
+            "year_level",
+            "school_type",
+            # both sides are integers, so the division is rounded down to the bin index
+            bin=ExpressionWrapper(F("total_marks") / bin_width, output_field=IntegerField()),
+        )
+        .annotate(count=Count("id"))
+        .values_list("bin", "year_level", "school_type", "count")
+    )
+    quiz_marks = Quiz.objects.values_list("total_marks", flat=True).get(pk=quiz_id)
+    # the bins cover the marks of the quiz, and any result above them
+    top_bin = max([int(max(quiz_marks, 0)) // bin_width] + [index for index, *_ in counts])
+    size = top_bin + 1
+
+    histogram = {
+        "bin_width": bin_width,
+        "bins": [index * bin_width for index in range(size)],
+        "all": [0] * size,
+        "year_level": {},
+        "school_type": {},
+    }
+    for index, year_level, school_type, count in counts:
+        histogram["all"][index] += count
+        histogram["year_level"].setdefault(year_level, [0] * size)[index] += count
+        histogram["school_type"].setdefault(school_type, [0] * size)[index] += count
+    # year levels are text, shorter first puts "9" before "10"
+    histogram["year_level"] = dict(sorted(histogram["year_level"].items(), key=lambda item: (len(item[0]), item[0])))
+    histogram["school_type"] = dict(sorted(histogram["school_type"].items()))
+    return histogram
+
+
+def get_histogram(quiz_id, bin_width=DEFAULT_BIN_WIDTH):
+    """
+    Get the score histogram of a quiz from the cache, building it on a miss.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        bin_width (int): The number of marks covered by each bin.
+
+    Returns:
+        dict: The histogram returned by `build_histogram`.
+
+    Raises:
+        Quiz.DoesNotExist: If there is no quiz with the given id.
+    """
+    key = f"results:histogram:{quiz_id}:{get_marked_version(quiz_id)}:{bin_width}"
+    return cache.get_or_set(key, lambda: build_histogram(quiz_id, bin_width), HISTOGRAM_CACHE_TIMEOUT)
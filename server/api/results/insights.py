@@ -0,0 +1,122 @@
+"""
+Participation insights of a quiz for the results dashboard.
+
+Every category is counted with conditional aggregates, so the insights take one query
+for the students and one for the teams, however many attempts the quiz has.
+The result is cached per quiz and versioned by `Quiz.marked_at`, so a new mark replaces it.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from ..quiz.models import Quiz
+from ..team.models import Team
+from ..users.models import School, Student
+
+# seconds the insights stay cached, short because answers are marked as they are written
+INSIGHTS_CACHE_TIMEOUT = 60
+
+
+def get_count_aggregates(prefix, year_field, condition):
+    """
+    Build the conditional counts of one insights category.
+
+    Args:
+        prefix (str): Prefix of the aggregate names, separating the categories.
+        year_field (str): Lookup of the student year level.
+        condition (Q): The condition of the category, `Q()` for all rows.
+
+    Returns:
+        dict: Maps aggregate names to `Count` expressions.
+    """
+    filters = {
+        "total": Q(),
+        "public_count": Q(school__type=School.SchoolType.PUBLIC),
+        "catholic_count": Q(school__type=School.SchoolType.CATHOLIC),
+        "independent_count": Q(school__type=School.SchoolType.INDEPENDENT),
+        "allies_count": Q(school__type=School.SchoolType.ALLIES),
+        "country": Q(school__is_country=True),
+        "year_7": Q(**{year_field: "7"}),
+        "year_8": Q(**{year_field: "8"}),
+        "year_9": Q(**{year_field: "9"}),
+    }
+    return {
+        f"{prefix}{name}": Count("id", distinct=True, filter=category_filter & condition)
+        for name, category_filter in filters.items()
+    }
+
+
+def build_insights(quiz_id=None):
+    """
+    Count the students and teams of a quiz, in total and with scores, by school type and year level.
+
+    Args:
+        quiz_id (int): The primary key of the quiz, or None for every student and team.
+
+    Returns:
+        list: One dict of counts per category.
+    """
+    students = Student.objects.all()
+    teams = Team.objects.all()
+    if quiz_id:
+        # attempts prepared by the warm-up and never started are not entries
+        entered = {"quiz_attempts__quiz_id": quiz_id, "quiz_attempts__prepared": False}
+        students = students.filter(**entered)
+        teams = teams.filter(**entered)
+    scored = Q(quiz_attempts__total_marks__gt=0)
+
+    student_counts = students.aggregate(
+        **get_count_aggregates("all_", "year_level", Q()),
+        **get_count_aggregates("scored_", "year_level", scored),
+    )
+    team_counts = teams.aggregate(
+        **get_count_aggregates("all_", "students__year_level", Q()),
+        **get_count_aggregates("scored_", "students__year_level", scored),
+    )
+
+    def get_category(counts, prefix, category):
+        data = {"category": category}
+        data.update(
+            (name[len(prefix):], value)
+            for name, value in counts.items()
+            if name.startswith(prefix)
+        )
+        return data
+
+    return [
+        get_category(student_counts, "all_", "All Students"),
+        get_category(student_counts, "scored_", "Students with scores"),
+        get_category(team_counts, "all_", "All Teams"),
+        get_category(team_counts, "scored_", "Teams with scores"),
+    ]
+
+
+def get_marked_version(quiz_id):
+    """
+    Get the version of the cached results of a quiz, which changes whenever the quiz is marked.
+
+    Raises:
+        Quiz.DoesNotExist: If there is no quiz with the given id.
+    """
+    marked_at = Quiz.objects.values_list("marked_at", flat=True).get(pk=quiz_id)
+    return marked_at.timestamp() if marked_at else 0
+
+
+def get_insights(quiz_id=None):
+    """
+    Get the insights of a quiz from the cache, building them on a miss.
+
+    Args:
+        quiz_id (int): The primary key of the quiz, or None for every student and team.
+
+    Returns:
+        list: The insights returned by `build_insights`.
+
+    Raises:
+        Quiz.DoesNotExist: If there is no quiz with the given id.
+    """
+    if quiz_id:
+        key = f"results:insights:{quiz_id}:{get_marked_version(quiz_id)}"
+    else:
+        key = "results:insights:all"
+    return cache.get_or_set(key, lambda: build_insights(quiz_id), INSIGHTS_CACHE_TIMEOUT)
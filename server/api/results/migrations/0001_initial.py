@@ -0,0 +1,69 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('quiz', '0019_quiz_marked_at'),
+        ('team', '0001_initial'),
+        ('users', '0008_school_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndividualResult',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('total_marks', models.IntegerField(default=0)),
+                ('rank', models.IntegerField(default=1)),
+                ('year_level', models.CharField(max_length=50)),
+                ('school_type', models.TextField(
+                    choices=[('Public', 'Public'), ('Independent', 'Independent'), ('Catholic', 'Catholic'), ('Allies', 'Allies')]
+                )),
+                ('is_country', models.BooleanField(default=False)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='individual_results', to='quiz.quiz')),
+                ('quiz_attempt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result', to='quiz.quizattempt')),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='individual_results', to='users.school')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='individual_results', to='users.student')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['quiz', '-total_marks'], name='individual_result_total_idx'),
+                    models.Index(fields=['quiz', 'year_level'], name='individual_result_year_idx'),
+                    models.Index(fields=['quiz', 'rank'], name='individual_result_rank_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='TeamResult',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('total_marks', models.IntegerField(default=0)),
+                ('rank', models.IntegerField(default=1)),
+                ('max_year', models.IntegerField(blank=True, null=True)),
+                ('school_type', models.TextField(
+                    blank=True,
+                    choices=[('Public', 'Public'), ('Independent', 'Independent'), ('Catholic', 'Catholic'), ('Allies', 'Allies')],
+                    default='',
+                )),
+                ('is_country', models.BooleanField(default=False)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='team_results', to='quiz.quiz')),
+                ('school', models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='team_results', to='users.school'
+                )),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='team.team')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['quiz', '-total_marks'], name='team_result_total_idx'),
+                    models.Index(fields=['quiz', 'rank'], name='team_result_rank_idx'),
+                ],
+                'constraints': [models.UniqueConstraint(fields=('quiz', 'team'), name='unique_quiz_team_result')],
+            },
+        ),
+    ]
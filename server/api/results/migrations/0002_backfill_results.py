@@ -0,0 +1,90 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:55
+
+from django.db import migrations
+from django.db.models import BigIntegerField, F, Max, Sum, Window
+from django.db.models.functions import Cast, Rank
+
+
+def backfill_results(apps, schema_editor):
+    """
+    Fill the results tables from the existing quiz attempts.
+    """
+    QuizAttempt = apps.get_model("quiz", "QuizAttempt")
+    Team = apps.get_model("team", "Team")
+    IndividualResult = apps.get_model("results", "IndividualResult")
+    TeamResult = apps.get_model("results", "TeamResult")
+
+    attempts = QuizAttempt.objects.filter(student__isnull=False).values_list(
+        "id",
+        "quiz_id",
+        "student_id",
+        "total_marks",
+        "student__year_level",
+        "student__school_id",
+        "student__school__type",
+        "student__school__is_country",
+    )
+    IndividualResult.objects.bulk_create(
+        (
+            IndividualResult(
+                quiz_attempt_id=attempt_id,
+                quiz_id=quiz_id,
+                student_id=student_id,
+                total_marks=total_marks,
+                year_level=year_level,
+                school_id=school_id,
+                school_type=school_type,
+                is_country=is_country,
+            )
+            for attempt_id, quiz_id, student_id, total_marks, year_level, school_id, school_type, is_country in attempts
+        ),
+        batch_size=1000,
+    )
+
+    totals = (
+        QuizAttempt.objects.filter(team__isnull=False)
+        .order_by()
+        .values("quiz_id", "team_id")
+        .annotate(total=Sum("total_marks"))
+        .values_list("quiz_id", "team_id", "total")
+    )
+    teams = {
+        team_id: details
+        for team_id, *details in Team.objects.annotate(
+            max_year=Max(Cast("students__year_level", output_field=BigIntegerField()))
+        ).values_list("id", "max_year", "school_id", "school__type", "school__is_country")
+    }
+    TeamResult.objects.bulk_create(
+        (
+            TeamResult(
+                quiz_id=quiz_id,
+                team_id=team_id,
+                total_marks=total,
+                max_year=teams[team_id][0],
+                school_id=teams[team_id][1],
+                school_type=teams[team_id][2] or "",
+                is_country=bool(teams[team_id][3]),
+            )
+            for quiz_id, team_id, total in totals
+        ),
+        batch_size=1000,
+    )
+
+    for model in (IndividualResult, TeamResult):
+        ranked = model.objects.annotate(
+            new_rank=Window(Rank(), partition_by=F("quiz_id"), order_by=F("total_marks").desc())
+        ).values_list("id", "new_rank")
+        model.objects.bulk_update(
+            [model(id=result_id, rank=rank) for result_id, rank in ranked], ["rank"], batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_results, migrations.RunPython.noop),
+    ]
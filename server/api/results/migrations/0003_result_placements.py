@@ -0,0 +1,180 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:58
+
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import CumeDist, DenseRank, Rank
+
+# the placements as defined when this migration was written, kept here so that later
+# changes to the refresh do not change what this migration computes
+INDIVIDUAL_PARTITIONS = {
+    "": [],
+    "year_level_": ["year_level"],
+    "school_type_": ["school_type"],
+    "country_": ["is_country"],
+}
+TEAM_PARTITIONS = {
+    "": [],
+    "year_level_": ["max_year"],
+    "school_type_": ["school_type"],
+    "country_": ["is_country"],
+}
+
+
+def get_placement_windows(partitions):
+    windows = {}
+    for prefix, fields in partitions.items():
+        partition_by = [F("quiz_id")] + [F(field) for field in fields]
+        windows[f"{prefix}rank"] = Window(Rank(), partition_by=partition_by, order_by=F("total_marks").desc())
+        windows[f"{prefix}dense_rank"] = Window(DenseRank(), partition_by=partition_by, order_by=F("total_marks").desc())
+        windows[f"{prefix}percentile"] = Window(CumeDist(), partition_by=partition_by, order_by=F("total_marks").asc())
+    return windows
+
+
+def compute_placements(apps, schema_editor):
+    """
+    Compute the placements of the existing results.
+    """
+    for model_name, partitions in (
+        ("IndividualResult", INDIVIDUAL_PARTITIONS),
+        ("TeamResult", TEAM_PARTITIONS),
+    ):
+        model = apps.get_model("results", model_name)
+        windows = get_placement_windows(partitions)
+        rows = model.objects.annotate(
+            **{f"new_{field}": window for field, window in windows.items()}
+        ).values("id", *(f"new_{field}" for field in windows))
+        model.objects.bulk_update(
+            [
+                model(
+                    id=row["id"],
+                    **{
+                        field: round(row[f"new_{field}"] * 100, 1) if field.endswith("percentile") else row[f"new_{field}"]
+                        for field in windows
+                    },
+                )
+                for row in rows
+            ],
+            list(windows),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0002_backfill_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='individualresult',
+            name='country_dense_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='country_percentile',
+            field=models.FloatField(default=100),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='country_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='dense_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='percentile',
+            field=models.FloatField(default=100),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='school_type_dense_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='school_type_percentile',
+            field=models.FloatField(default=100),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='school_type_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='year_level_dense_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='year_level_percentile',
+            field=models.FloatField(default=100),
+        ),
+        migrations.AddField(
+            model_name='individualresult',
+            name='year_level_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='country_dense_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='country_percentile',
+            field=models.FloatField(default=100),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='country_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='dense_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='percentile',
+            field=models.FloatField(default=100),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='school_type_dense_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='school_type_percentile',
+            field=models.FloatField(default=100),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='school_type_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='year_level_dense_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='year_level_percentile',
+            field=models.FloatField(default=100),
+        ),
+        migrations.AddField(
+            model_name='teamresult',
+            name='year_level_rank',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.RunPython(compute_placements, migrations.RunPython.noop),
+    ]
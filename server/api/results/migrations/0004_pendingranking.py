@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-17 14:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0019_quiz_marked_at'),
+        ('results', '0003_result_placements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRanking',
+            fields=[
+                ('quiz', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='pending_ranking',
+                    serialize=False,
+                    to='quiz.quiz',
+                )),
+            ],
+        ),
+    ]
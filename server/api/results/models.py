@@ -0,0 +1,147 @@
+from django.db import models
+
+from api.quiz.models import Quiz, QuizAttempt
+from api.team.models import Team
+from api.users.models import School, Student
+
+
+class IndividualResult(models.Model):
+    """Precomputed result of a quiz attempt, read by the individual results endpoints.
+    The rows are refreshed by `api.results.refresh` whenever attempts are marked.
+
+    Fields:
+        id: The primary key for the result.
+        quiz (ForeignKey): The quiz of the attempt.
+        student (ForeignKey): The student of the attempt.
+        quiz_attempt (OneToOneField): The attempt the result is computed from.
+        total_marks (IntegerField): Total marks of the attempt.
+        rank (IntegerField): Competition rank of the attempt in the quiz, equal totals share a rank
+            and the next rank is skipped.
+        dense_rank (IntegerField): Dense rank of the attempt in the quiz, no ranks are skipped.
+        percentile (FloatField): Percentage of the attempts in the quiz scoring at most as high.
+        year_level_rank, year_level_dense_rank, year_level_percentile: The placement among
+            the attempts of the same year level.
+        school_type_rank, school_type_dense_rank, school_type_percentile: The placement among
+            the attempts of the same school type.
+        country_rank, country_dense_rank, country_percentile: The placement among the attempts
+            of country schools, or of the other schools.
+        year_level (CharField): Year level of the student.
+        school (ForeignKey): School of the student.
+        school_type (TextField): Type of the school.
+        is_country (BooleanField): Whether the school is a country school.
+    """
+
+    id = models.AutoField(primary_key=True)
+    quiz = models.ForeignKey(
+        Quiz, on_delete=models.CASCADE, related_name="individual_results")
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="individual_results")
+    quiz_attempt = models.OneToOneField(
+        QuizAttempt, on_delete=models.CASCADE, related_name="result")
+    total_marks = models.IntegerField(default=0)
+    rank = models.IntegerField(default=1)
+    dense_rank = models.IntegerField(default=1)
+    percentile = models.FloatField(default=100)
+    year_level_rank = models.IntegerField(default=1)
+    year_level_dense_rank = models.IntegerField(default=1)
+    year_level_percentile = models.FloatField(default=100)
+    school_type_rank = models.IntegerField(default=1)
+    school_type_dense_rank = models.IntegerField(default=1)
+    school_type_percentile = models.FloatField(default=100)
+    country_rank = models.IntegerField(default=1)
+    country_dense_rank = models.IntegerField(default=1)
+    country_percentile = models.FloatField(default=100)
+    year_level = models.CharField(max_length=50)
+    school = models.ForeignKey(
+        School, on_delete=models.CASCADE, related_name="individual_results")
+    school_type = models.TextField(choices=School.SchoolType.choices)
+    is_country = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["quiz", "-total_marks"], name="individual_result_total_idx"),
+            models.Index(fields=["quiz", "year_level"], name="individual_result_year_idx"),
+            models.Index(fields=["quiz", "rank"], name="individual_result_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quiz} {self.student} {self.total_marks}"
+
+
+class TeamResult(models.Model):
+    """Precomputed result of a team in a quiz, read by the team results endpoints.
+    The rows are refreshed by `api.results.refresh` whenever attempts are marked.
+
+    Fields:
+        id: The primary key for the result.
+        quiz (ForeignKey): The quiz.
+        team (ForeignKey): The team.
+        total_marks (IntegerField): Sum of the total marks of the team's attempts at the quiz.
+        rank (IntegerField): Competition rank of the team in the quiz, equal totals share a rank
+            and the next rank is skipped.
+        dense_rank (IntegerField): Dense rank of the team in the quiz, no ranks are skipped.
+        percentile (FloatField): Percentage of the teams in the quiz scoring at most as high.
+        year_level_rank, year_level_dense_rank, year_level_percentile: The placement among
+            the teams with the same highest year level.
+        school_type_rank, school_type_dense_rank, school_type_percentile: The placement among
+            the teams of the same school type.
+        country_rank, country_dense_rank, country_percentile: The placement among the teams
+            of country schools, or of the other schools.
+        max_year (IntegerField): Highest year level of the team's students.
+        school (ForeignKey): School of the team.
+        school_type (TextField): Type of the school.
+        is_country (BooleanField): Whether the school is a country school.
+    """
+
+    id = models.AutoField(primary_key=True)
+    quiz = models.ForeignKey(
+        Quiz, on_delete=models.CASCADE, related_name="team_results")
+    team = models.ForeignKey(
+        Team, on_delete=models.CASCADE, related_name="results")
+    total_marks = models.IntegerField(default=0)
+    rank = models.IntegerField(default=1)
+    dense_rank = models.IntegerField(default=1)
+    percentile = models.FloatField(default=100)
+    year_level_rank = models.IntegerField(default=1)
+    year_level_dense_rank = models.IntegerField(default=1)
+    year_level_percentile = models.FloatField(default=100)
+    school_type_rank = models.IntegerField(default=1)
+    school_type_dense_rank = models.IntegerField(default=1)
+    school_type_percentile = models.FloatField(default=100)
+    country_rank = models.IntegerField(default=1)
+    country_dense_rank = models.IntegerField(default=1)
+    country_percentile = models.FloatField(default=100)
+    max_year = models.IntegerField(null=True, blank=True)
+    school = models.ForeignKey(
+        School, on_delete=models.SET_NULL, null=True, blank=True, related_name="team_results")
+    school_type = models.TextField(choices=School.SchoolType.choices, blank=True, default="")
+    is_country = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["quiz", "team"], name="unique_quiz_team_result")
+        ]
+        indexes = [
+            models.Index(fields=["quiz", "-total_marks"], name="team_result_total_idx"),
+            models.Index(fields=["quiz", "rank"], name="team_result_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quiz} {self.team} {self.total_marks}"
+
+
+class PendingRanking(models.Model):
+    """A quiz whose results changed since their placements were last computed.
+    Saved attempts only upsert their own result rows and add the quiz here, and the placements
+    of the whole quiz are computed once by the next read of its results or by the idle marking worker,
+    see `api.results.refresh`.
+
+    Fields:
+        quiz (OneToOneField): The quiz, also the primary key.
+    """
+
+    quiz = models.OneToOneField(
+        Quiz, on_delete=models.CASCADE, primary_key=True, related_name="pending_ranking")
+
+    def __str__(self):
+        return f"{self.quiz}"
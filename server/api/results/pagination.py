@@ -0,0 +1,240 @@
+"""
+Keyset pagination of the results and attempt listings.
+
+A page is found from the sort key of the last row of the previous page, e.g.
+`WHERE total_marks < 40 OR (total_marks = 40 AND id > 17)`, so a deep page costs the same as
+the first instead of an `OFFSET` scan, and the rows are only counted when asked.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Estimate the number of rows of a queryset from the plan of the PostgreSQL query planner,
+    without running the query. Other databases count the rows.
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset.count()
+    plan = json.loads(queryset.explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def get_count(queryset, request, count_query_param="count"):
+    """
+    Count the rows of a queryset as asked by the request, `?count=exact` or `?count=estimate`.
+
+    Returns:
+        int: The number of rows, or None when no count is asked.
+    """
+    count = request.query_params.get(count_query_param)
+    if count == "exact":
+        return queryset.count()
+    if count == "estimate":
+        return estimate_count(queryset)
+    return None
+
+
+def get_keyset_filter(ordering, position, reverse=False):
+    """
+    Build the condition of the rows following a position in an ordering, e.g. for
+    `("-total_marks", "id")` after `(40, 17)`: `total_marks < 40 | (total_marks = 40 & id > 17)`.
+
+    Args:
+        ordering (tuple): The ordering of the rows, ending with a unique field.
+        position (list): The values of the ordering fields of the last row.
+        reverse (bool): Whether to get the rows preceding the position instead.
+
+    Returns:
+        Q: The condition of the following rows.
+    """
+    condition = None
+    for field, value in reversed(list(zip(ordering, position))):
+        name = field.lstrip("-")
+        descending = field.startswith("-") != reverse
+        following = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+        condition = following if condition is None else following | (Q(**{name: value}) & condition)
+    return condition
+
+
+class EstimatedCountLimitOffsetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination, as used by the page-numbered grids, which can take its count
+    from the query planner with `?count=estimate`.
+    """
+
+    def get_count(self, queryset):
+        if self.request.query_params.get("count") == "estimate":
+            return estimate_count(queryset)
+        return super().get_count(queryset)
+
+
+class ResultsPagination(BasePagination):
+    """
+    Keyset pagination on the ordering of the view followed by the primary key.
+
+    Only the `cursor_fields` of a view, non-null columns of its model, can be part of the key.
+    Requests ordered by another field, or with an `offset` as sent by the page-numbered grids,
+    are paged with limit and offset. The rows are counted with `?count=exact`, or estimated
+    with `?count=estimate`, else `count` is null. The page size is the `page_size` of the view,
+    which a client can lower or raise up to `max_page_size` with `?limit=`.
+    """
+
+    page_size = 50
+    max_page_size = 1000
+    page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fallback = None
+        if "offset" in request.query_params or self.ordering is None:
+            # the primary key orders equal rows, so they do not move between pages
+            queryset = queryset.order_by(*(queryset.query.order_by or queryset.model._meta.ordering), "pk")
+            self.fallback = EstimatedCountLimitOffsetPagination()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request, view)
+        self.base_url = request.build_absolute_uri()
+        self.count = get_count(queryset, request, self.count_query_param)
+        position, reverse = self.decode_cursor(request)
+
+        if reverse:
+            queryset = queryset.order_by(*(
+                field[1:] if field.startswith("-") else f"-{field}" for field in self.ordering
+            ))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(get_keyset_filter(self.ordering, position, reverse))
+
+        # an extra row is fetched to know if there is a page after this one
+        rows = list(queryset[:self.page_size + 1])
+        self.page = rows[:self.page_size]
+        has_more = len(rows) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Get the ordering of the view followed by the primary key.
+
+        Returns:
+            tuple: The ordering, or None when a field of it cannot be part of a cursor.
+        """
+        ordering = []
+        for backend in getattr(view, "filter_backends", []):
+            if hasattr(backend, "get_ordering"):
+                ordering = backend().get_ordering(request, queryset, view) or []
+                break
+        pk = queryset.model._meta.pk.name
+        cursor_fields = set(getattr(view, "cursor_fields", [])) | {pk, "pk"}
+        if any(field.lstrip("-") not in cursor_fields for field in ordering):
+            return None
+        if not any(field.lstrip("-") in (pk, "pk") for field in ordering):
+            ordering = [*ordering, pk]
+        return tuple(ordering)
+
+    def get_page_size(self, request, view):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return getattr(view, "page_size", self.page_size)
+        if page_size <= 0:
+            return getattr(view, "page_size", self.page_size)
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        """
+        Returns:
+            tuple: The position of the cursor, None for the first page, and whether it points backwards.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            position, reverse = cursor["p"], bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse=False):
+        position = [getattr(instance, field.lstrip("-")) for field in self.ordering]
+        cursor = {"p": position, "r": 1} if reverse else {"p": position}
+        encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response({
+            "count": self.count,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return LimitOffsetPagination().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": "offset",
+                "required": False,
+                "in": "query",
+                "description": "The initial index from which to return the results, instead of a cursor.",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Count the results, `exact` or `estimate`.",
+                "schema": {"type": "string", "enum": ["exact", "estimate"]},
+            },
+        ]
@@ -0,0 +1,351 @@
+"""
+Refresh of the materialized results tables.
+
+`IndividualResult` holds one row per quiz attempt and `TeamResult` one row per team and
+quiz, with the totals, ranks and the school and year level columns the results endpoints
+filter and sort on. The rows are upserted from the attempts, so a refresh can be limited
+to the attempts that changed.
+The placements (rank, dense rank and percentile, overall and by year level, school type
+and country) are computed with window functions over the whole quiz, so they do not change
+with the filters of a request, and only the rows whose placement moved are written.
+
+Answers saved during a quiz only update `QuizAttempt.total_marks`, so that a student's
+answer does not write the results. `refresh_stale_results` refreshes the attempts whose
+total differs from their stored result.
+
+Computing the placements reads every result of the quiz, so a refresh of a few attempts, e.g.
+one started or answered, does not do it. It adds the quiz to `PendingRanking` instead.
+Marking a whole quiz computes them straight away.
+
+`update_quiz_results` applies both to the one quiz a results view reads, in a short
+transaction of its own, and the marking worker calls `rank_pending_results` for the
+quizzes nobody reads while it is idle.
+
+Attempts prepared by the competition warm-up and never started are not entries of the
+quiz, so they have no results and are left out of the placements.
+
+The receivers in `signals.py` refresh the rows when attempts are saved or marked.
+"""
+
+from django.db import transaction
+from django.db.models import BigIntegerField, F, Max, Sum, Window
+from django.db.models.functions import Cast, CumeDist, DenseRank, Rank
+
+from ..quiz.models import Quiz, QuizAttempt
+from ..team.models import Team
+from .models import IndividualResult, PendingRanking, TeamResult
+
+# number of result rows written per statement
+RESULTS_BATCH_SIZE = 1000
+
+# the partitions placements are computed in, by the prefix of their rank fields
+INDIVIDUAL_PARTITIONS = {
+    "": [],
+    "year_level_": ["year_level"],
+    "school_type_": ["school_type"],
+    "country_": ["is_country"],
+}
+TEAM_PARTITIONS = {
+    "": [],
+    "year_level_": ["max_year"],
+    "school_type_": ["school_type"],
+    "country_": ["is_country"],
+}
+# the stored placement fields, e.g. `rank` and `year_level_percentile`
+PLACEMENT_FIELDS = [
+    f"{prefix}{placement}"
+    for prefix in INDIVIDUAL_PARTITIONS
+    for placement in ("rank", "dense_rank", "percentile")
+]
+
+
+def refresh_individual_results(quiz_id, attempt_ids=None):
+    """
+    Upsert the individual results of the attempts of a quiz, and delete those of attempts prepared by the warm-up.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        attempt_ids (list): The attempts to refresh, defaults to every attempt of the quiz.
+
+    Returns:
+        int: The number of refreshed rows.
+    """
+    attempts = QuizAttempt.objects.filter(quiz_id=quiz_id, student__isnull=False)
+    prepared = IndividualResult.objects.filter(quiz_id=quiz_id, quiz_attempt__prepared=True)
+    if attempt_ids is not None:
+        attempts = attempts.filter(id__in=attempt_ids)
+        prepared = prepared.filter(quiz_attempt_id__in=attempt_ids)
+    prepared.delete()
+    attempts = attempts.exclude(prepared=True)
+    results = [
+        IndividualResult(
+            quiz_id=quiz_id,
+            quiz_attempt_id=attempt_id,
+            student_id=student_id,
+            total_marks=total_marks,
+            year_level=year_level,
+            school_id=school_id,
+            school_type=school_type,
+            is_country=is_country,
+        )
+        for attempt_id, student_id, total_marks, year_level, school_id, school_type, is_country in attempts.values_list(
+            "id",
+            "student_id",
+            "total_marks",
+            "student__year_level",
+            "student__school_id",
+            "student__school__type",
+            "student__school__is_country",
+        )
+    ]
+    IndividualResult.objects.bulk_create(
+        results,
+        update_conflicts=True,
+        unique_fields=["quiz_attempt"],
+        update_fields=["student", "total_marks", "year_level", "school", "school_type", "is_country"],
+        batch_size=RESULTS_BATCH_SIZE,
+    )
+    return len(results)
+
+
+def refresh_team_results(quiz_id, team_ids=None):
+    """
+    Upsert the team results of a quiz, and delete those of teams with only prepared attempts.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        team_ids (list): The teams to refresh, defaults to every team with an attempt at the quiz.
+
+    Returns:
+        int: The number of refreshed rows.
+    """
+    attempts = QuizAttempt.objects.filter(quiz_id=quiz_id, team__isnull=False).exclude(prepared=True)
+    stale = TeamResult.objects.filter(quiz_id=quiz_id)
+    if team_ids is not None:
+        attempts = attempts.filter(team_id__in=team_ids)
+        stale = stale.filter(team_id__in=team_ids)
+    totals = dict(
+        attempts.order_by().values("team").annotate(total=Sum("total_marks")).values_list("team", "total")
+    )
+    stale.exclude(team_id__in=list(totals)).delete()
+
+    teams = (
+        Team.objects.filter(id__in=list(totals))
+        .annotate(max_year=Max(Cast("students__year_level", output_field=BigIntegerField())))
+        .values_list("id", "max_year", "school_id", "school__type", "school__is_country")
+    )
+    results = [
+        TeamResult(
+            quiz_id=quiz_id,
+            team_id=team_id,
+            total_marks=totals[team_id],
+            max_year=max_year,
+            school_id=school_id,
+            school_type=school_type or "",
+            is_country=bool(is_country),
+        )
+        for team_id, max_year, school_id, school_type, is_country in teams
+    ]
+    TeamResult.objects.bulk_create(
+        results,
+        update_conflicts=True,
+        unique_fields=["quiz", "team"],
+        update_fields=["total_marks", "max_year", "school", "school_type", "is_country"],
+        batch_size=RESULTS_BATCH_SIZE,
+    )
+    return len(results)
+
+
+def get_placement_windows(partitions):
+    """
+    Build the window expressions of the rank, dense rank and percentile in each partition of a quiz.
+
+    Args:
+        partitions (dict): Maps the prefix of the rank fields to the fields partitioning the results.
+
+    Returns:
+        dict: Maps the placement fields to window expressions.
+    """
+    windows = {}
+    for prefix, fields in partitions.items():
+        partition_by = [F("quiz_id")] + [F(field) for field in fields]
+        windows[f"{prefix}rank"] = Window(
+            Rank(), partition_by=partition_by, order_by=F("total_marks").desc()
+        )
+        windows[f"{prefix}dense_rank"] = Window(
+            DenseRank(), partition_by=partition_by, order_by=F("total_marks").desc()
+        )
+        windows[f"{prefix}percentile"] = Window(
+            CumeDist(), partition_by=partition_by, order_by=F("total_marks").asc()
+        )
+    return windows
+
+
+def rank_results(model, quiz_id):
+    """
+    Update the placements of the results of a quiz, only writing the rows whose placement moved.
+
+    Args:
+        model (Model): `IndividualResult` or `TeamResult`.
+        quiz_id (int): The primary key of the quiz.
+
+    Returns:
+        int: The number of rows whose placement changed.
+    """
+    windows = get_placement_windows(
+        INDIVIDUAL_PARTITIONS if model is IndividualResult else TEAM_PARTITIONS
+    )
+    fields = list(windows)
+    ranked = (
+        model.objects.filter(quiz_id=quiz_id)
+        .annotate(**{f"new_{field}": window for field, window in windows.items()})
+        .values("id", *fields, *(f"new_{field}" for field in fields))
+    )
+    changed = []
+    for row in ranked:
+        placement = {
+            field: round(row[f"new_{field}"] * 100, 1) if field.endswith("percentile") else row[f"new_{field}"]
+            for field in fields
+        }
+        if any(row[field] != value for field, value in placement.items()):
+            changed.append(model(id=row["id"], **placement))
+    model.objects.bulk_update(changed, fields, batch_size=RESULTS_BATCH_SIZE)
+    return len(changed)
+
+
+def refresh_results(quiz_id, attempt_ids=None, team_ids=None):
+    """
+    Refresh the individual and team results of a quiz and update their ranks.
+    The ranks are updated straight away when every attempt is refreshed, and left pending otherwise.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        attempt_ids (list): The attempts to refresh, defaults to every attempt of the quiz.
+        team_ids (list): Further teams to refresh when `attempt_ids` is given,
+            e.g. the previous team of a changed attempt.
+
+    Returns:
+        dict: Row counts of the refresh.
+    """
+    if attempt_ids is not None:
+        team_ids = set(team_ids or ()) | set(
+            QuizAttempt.objects.filter(id__in=attempt_ids, team__isnull=False).values_list("team_id", flat=True)
+        )
+    counts = {
+        "individual_results": refresh_individual_results(quiz_id, attempt_ids),
+        "team_results": refresh_team_results(quiz_id, None if attempt_ids is None else list(team_ids)),
+    }
+    if attempt_ids is not None:
+        add_pending_rankings([quiz_id])
+        return counts
+    PendingRanking.objects.filter(quiz_id=quiz_id).delete()
+    counts["individual_ranks"] = rank_results(IndividualResult, quiz_id)
+    counts["team_ranks"] = rank_results(TeamResult, quiz_id)
+    return counts
+
+
+def refresh_stale_results(quiz_id):
+    """
+    Refresh the results of the attempts of a quiz whose total marks changed since they were stored,
+    i.e. by answers saved during the quiz, and leave the placements of the quiz pending.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+
+    Returns:
+        int: The number of refreshed attempts.
+    """
+    stale = list(
+        QuizAttempt.objects.filter(quiz_id=quiz_id, student__isnull=False, prepared=False)
+        .exclude(result__total_marks=F("total_marks"))
+        .values_list("id", flat=True)
+    )
+    if stale:
+        refresh_results(quiz_id, attempt_ids=stale)
+    return len(stale)
+
+
+def rank_quiz_results(quiz_ids):
+    """
+    Update the placements of the individual and team results of quizzes.
+
+    Args:
+        quiz_ids (iterable): The primary keys of the quizzes.
+    """
+    for quiz_id in set(quiz_ids):
+        rank_results(IndividualResult, quiz_id)
+        rank_results(TeamResult, quiz_id)
+
+
+def add_pending_rankings(quiz_ids):
+    """
+    Leave the placements of quizzes to be updated before their results are next read.
+
+    Args:
+        quiz_ids (iterable): The primary keys of the quizzes.
+    """
+    PendingRanking.objects.bulk_create(
+        [PendingRanking(quiz_id=quiz_id) for quiz_id in set(quiz_ids)], ignore_conflicts=True
+    )
+
+
+def update_quiz_results(quiz_id):
+    """
+    Refresh the stale results of a quiz and compute its pending placements, before its results are read.
+
+    The update runs in a short transaction holding the quiz row. A concurrent reader skips the
+    locked quiz and reads the results as they are instead of waiting or updating them again.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+
+    Returns:
+        bool: Whether the results were updated, False when another process was updating them.
+    """
+    with transaction.atomic():
+        locked = Quiz.objects.select_for_update(skip_locked=True, no_key=True).filter(id=quiz_id)
+        if not list(locked.values_list("id", flat=True)):
+            return False
+        refresh_stale_results(quiz_id)
+        taken, _ = PendingRanking.objects.filter(quiz_id=quiz_id).delete()
+        if taken:
+            rank_quiz_results([quiz_id])
+    return True
+
+
+def rank_pending_results():
+    """
+    Update the results of every quiz whose placements are pending, one quiz per transaction.
+
+    Returns:
+        int: The number of quizzes updated.
+    """
+    return sum(
+        update_quiz_results(quiz_id)
+        for quiz_id in list(PendingRanking.objects.values_list("quiz_id", flat=True))
+    )
+
+
+def refresh_team_details(team_ids):
+    """
+    Update the school and highest year level of the results of teams whose members or school changed,
+    and leave the placements of their quizzes pending.
+
+    Args:
+        team_ids (list): The primary keys of the teams.
+    """
+    teams = (
+        Team.objects.filter(id__in=team_ids)
+        .annotate(max_year=Max(Cast("students__year_level", output_field=BigIntegerField())))
+        .values_list("id", "max_year", "school_id", "school__type", "school__is_country")
+    )
+    for team_id, max_year, school_id, school_type, is_country in teams:
+        TeamResult.objects.filter(team_id=team_id).update(
+            max_year=max_year,
+            school_id=school_id,
+            school_type=school_type or "",
+            is_country=bool(is_country),
+        )
+    add_pending_rankings(
+        TeamResult.objects.filter(team_id__in=team_ids).values_list("quiz_id", flat=True)
+    )
@@ -0,0 +1,101 @@
+"""
+Response matrix of a quiz, with one row per attempt and one column per question.
+
+The slots of the quiz are loaded once and the answers of a chunk of attempts in one query,
+keyed by attempt and question, so the number of queries does not grow with the number of
+questions, and only by one per chunk of attempts.
+"""
+
+from itertools import islice
+
+from ..quiz.models import QuestionAttempt, QuizSlot
+
+# number of attempts whose answers are loaded per query
+RESPONSES_CHUNK_SIZE = 1000
+
+
+def get_response_columns(quiz_id):
+    """
+    Get the questions of a quiz in slot order.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+
+    Returns:
+        list: Tuples of the question id and its column name, "<question id>|<question name>".
+    """
+    slots = (
+        QuizSlot.objects.filter(quiz_id=quiz_id)
+        .order_by("slot_index")
+        .values_list("question_id", "question__name")
+    )
+    return [(question_id, f"{question_id}|{name}") for question_id, name in slots]
+
+
+def get_answers(attempt_ids):
+    """
+    Load the answers of quiz attempts in one query.
+
+    Args:
+        attempt_ids (list): The primary keys of the quiz attempts.
+
+    Returns:
+        dict: Maps (attempt id, question id) to the answer of the student.
+    """
+    answers = QuestionAttempt.objects.filter(quiz_attempt_id__in=attempt_ids).values_list(
+        "quiz_attempt_id", "question_id", "answer_student"
+    )
+    return {(attempt_id, question_id): answer for attempt_id, question_id, answer in answers}
+
+
+def get_student_responses(columns, answers, attempt_id):
+    """
+    Pivot the answers of an attempt into its row of the matrix.
+
+    Args:
+        columns (list): The columns returned by `get_response_columns`.
+        answers (dict): The answers returned by `get_answers`.
+        attempt_id (int): The primary key of the quiz attempt.
+
+    Returns:
+        dict: Maps the column names to the answers, None for unanswered questions.
+    """
+    return {name: answers.get((attempt_id, question_id)) for question_id, name in columns}
+
+
+def build_response_matrix(quiz_id, attempts):
+    """
+    Get the responses of a page of attempts of a quiz.
+
+    Args:
+        quiz_id (int): The primary key of the quiz.
+        attempts (list): The quiz attempts.
+
+    Returns:
+        dict: Maps the attempt ids to their responses.
+    """
+    columns = get_response_columns(quiz_id)
+    answers = get_answers([attempt.id for attempt in attempts])
+    return {
+        attempt.id: get_student_responses(columns, answers, attempt.id)
+        for attempt in attempts
+    }
+
+
+def iter_response_matrix(columns, attempts, chunk_size=RESPONSES_CHUNK_SIZE):
+    """
+    Yield the attempts of a quiz with their responses, without loading every attempt at once.
+
+    Args:
+        columns (list): The columns of the quiz returned by `get_response_columns`.
+        attempts (QuerySet): The attempts of the quiz, in the order of the rows.
+        chunk_size (int): The number of attempts fetched and answers loaded at a time.
+
+    Yields:
+        tuple: An attempt and its responses.
+    """
+    rows = attempts.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        answers = get_answers([attempt.id for attempt in chunk])
+        for attempt in chunk:
+            yield attempt, get_student_responses(columns, answers, attempt.id)
@@ -1,9 +1,9 @@
-from django.forms import ValidationError
 from rest_framework import serializers
 
-from api.quiz.models import QuizAttempt, QuestionAttempt, QuizSlot
-from api.team.models import Team
+from api.quiz.models import QuizAttempt, QuestionAttempt
 from ..users.models import Student, User
+from .models import IndividualResult, TeamResult
+from .responses import build_response_matrix
 import uuid
 
 
@@ -13,6 +13,27 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["email"]
 
 
+class PlacementsField(serializers.Field):
+    """
+    The placements of a result within its year level, school type and country group,
+    each as a dict of the rank, dense rank and percentile.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return {
+            partition: {
+                placement: getattr(value, f"{partition}_{placement}")
+                for placement in ("rank", "dense_rank", "percentile")
+            }
+            for partition in ("year_level", "school_type", "country")
+        }
+
+
 class IndividualResultsSerializer(serializers.ModelSerializer):
     """
     Serializer for the results data.
@@ -22,16 +43,15 @@ class IndividualResultsSerializer(serializers.ModelSerializer):
     """
 
     name = serializers.SerializerMethodField()
-    year_level = serializers.IntegerField(source="student.year_level")
-    school = serializers.StringRelatedField(source="student.school")
-    school_type = serializers.CharField(source="student.school.type")
-    is_country = serializers.BooleanField(source="student.school.is_country")
+    year_level = serializers.IntegerField()
+    school = serializers.StringRelatedField()
+    placements = PlacementsField()
 
     def get_name(self, obj):
         return f"{obj.student.user.first_name} {obj.student.user.last_name}".strip()
 
     class Meta:
-        model = QuizAttempt
+        model = IndividualResult
         fields = [
             "name",
             "year_level",
@@ -39,6 +59,10 @@ class IndividualResultsSerializer(serializers.ModelSerializer):
             "school_type",
             "is_country",
             "total_marks",
+            "rank",
+            "dense_rank",
+            "percentile",
+            "placements",
         ]
 
 
@@ -61,16 +85,28 @@ class TeamResultsSerializer(serializers.ModelSerializer):
     a team, including their members, scores, and participation status.
     """
 
-    name = serializers.StringRelatedField()
+    name = serializers.StringRelatedField(source="team.name")
     school = serializers.StringRelatedField()
-    is_country = serializers.BooleanField(source="school.is_country")
-    students = StudentSerializer(many=True)
-    total_marks = serializers.IntegerField()
+    id = serializers.IntegerField(source="team_id")
+    students = StudentSerializer(source="team.students", many=True)
     max_year = serializers.IntegerField()
+    placements = PlacementsField()
 
     class Meta:
-        model = Team
-        fields = ["name", "school", "id", "total_marks", "is_country", "students", "max_year"]
+        model = TeamResult
+        fields = [
+            "name",
+            "school",
+            "id",
+            "total_marks",
+            "is_country",
+            "students",
+            "max_year",
+            "rank",
+            "dense_rank",
+            "percentile",
+            "placements",
+        ]
 
     def to_representation(self, instance):
         """Sort students by ID before returning the response."""
@@ -92,46 +128,22 @@ class StudentWithScoreSerializer(serializers.ModelSerializer):
 
 
 class TeamListSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the teams of a quiz with the score of each student.
 
-    name = serializers.StringRelatedField()
+    The students are read from `team.students`, which the view prefetches sorted by ID,
+    with their users and annotated with their `student_score` in the quiz.
+    """
+
+    name = serializers.StringRelatedField(source="team.name")
     school = serializers.StringRelatedField()
-    students = serializers.SerializerMethodField()
-    total_marks = serializers.IntegerField()
+    id = serializers.IntegerField(source="team_id")
+    students = StudentWithScoreSerializer(source="team.students", many=True)
 
     class Meta:
-        model = Team
+        model = TeamResult
         fields = ["name", "school", "id", "total_marks", "students",]
 
-    def get_students(self, obj):
-        quiz_id = self.context.get('quiz_id')
-        students_with_scores = []
-
-        for student in obj.students.all():
-            # Get the student's score for this quiz
-            attempt = QuizAttempt.objects.filter(
-                student=student,
-                quiz_id=quiz_id
-            ).first()
-
-            student_score = attempt.total_marks if attempt else 0
-
-            # Add the score to the student data
-            student_data = {
-                'id': student.id,
-                'name': f"{student.user.first_name} {student.user.last_name}" if student.user.first_name else student.user.username,
-                'year_level': student.year_level,
-                'student_score': student_score
-            }
-            students_with_scores.append(student_data)
-
-        return students_with_scores
-
-    def to_representation(self, instance):
-        """Sort students by ID before returning the response."""
-        response = super().to_representation(instance)
-        response["students"] = sorted(response["students"], key=lambda x: x["id"])
-        return response
-
 
 class QuestionAttemptSerializer(serializers.ModelSerializer):
     """
@@ -217,7 +229,7 @@ class QuizAttemptSerializer(serializers.ModelSerializer):
     team = serializers.SerializerMethodField()
 
     def get_team(self, obj):
-        return obj.team.id if obj.team else None
+        return obj.team_id
 
     def get_username(self, obj):
         return obj.student.user.username
@@ -249,47 +261,19 @@ class QuizAttemptSerializer(serializers.ModelSerializer):
 
     def get_student_responses(self, obj):
         """
-        Get student responses for a specific quiz.
-        This function retrieves the responses of each student for a given quiz.
+        Get the responses of the attempt to each question of the quiz.
+
+        The views list attempts with the responses of the whole page in the `student_responses`
+        context, built by `build_response_matrix`, else they are loaded for this attempt.
         """
         quiz_id = self.context.get('quiz_id')
         if not quiz_id:
             raise serializers.ValidationError({"quiz_id": "Quiz ID is required to fetch student responses."})
 
-        student = obj.student
-        if not student:
-            raise serializers.ValidationError({"student_id": "Student ID is required to fetch responses."})
-
-        try:
-            student_id = int(student.id)
-        except ValueError:
-            raise ValidationError({"student_id": "Invalid student_id. Must be an integer."})
-
-        # Get the quiz attempts for the student
-        quiz_attempts = QuizAttempt.objects.filter(student_id=student_id, quiz=quiz_id)
-        # Get the first quiz attempt for the student
-        quiz_attempt = quiz_attempts.first()
-
-        # Prepare the student responses dictionary
-        student_responses = {}
-        # Iterate through the quiz slots to get the student's responses
-        for slot in QuizSlot.objects.filter(quiz_id=quiz_id).order_by("slot_index"):
-            # may need to edit, as I think the question assigned to slot_index may change when a block is shuffled
-            # therefore, we need to reference question id not the slot_index
-            # question_id = slot.slot_index
-            question_id = slot.question.id
-            # Get the student's response for the question
-            response = QuestionAttempt.objects.filter(
-                quiz_attempt=quiz_attempt,
-                question=slot.question,
-                student_id=student_id
-            ).first()
-            if response:
-                student_responses[str(question_id) + "|" + str(slot.question.name)] = response.answer_student
-            else:
-                student_responses[str(question_id) + "|" + str(slot.question.name)] = None
-
-        return student_responses
+        responses = self.context.get("student_responses")
+        if responses is not None and obj.id in responses:
+            return responses[obj.id]
+        return build_response_matrix(obj.quiz_id, [obj])[obj.id]
 
     class Meta:
         model = QuizAttempt
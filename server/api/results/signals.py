@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ..quiz.models import Quiz, QuizAttempt
+from ..quiz.signals import attempts_marked, attempts_started
+from ..team.models import Team, TeamMember
+from ..users.models import School, Student
+from ..users.signals import students_enrolled
+from .choices import invalidate_filter_choices
+from .models import IndividualResult, TeamResult
+from .refresh import add_pending_rankings, refresh_results, refresh_team_details
+
+# saving only other fields of an attempt, e.g. its state on submit, leaves its results unchanged
+RESULT_FIELDS = {"quiz", "student", "team", "total_marks"}
+
+
+@receiver(attempts_marked)
+def refresh_marked_results(sender, quiz_ids, **kwargs):
+    for quiz_id in quiz_ids:
+        refresh_results(quiz_id)
+
+
+@receiver(attempts_started)
+def refresh_started_results(sender, quiz_id, attempt_ids, **kwargs):
+    # prepared attempts have no results, a started one becomes an entry
+    refresh_results(quiz_id, attempt_ids=attempt_ids)
+
+
+@receiver(post_save, sender=QuizAttempt)
+def refresh_attempt_results(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not RESULT_FIELDS.intersection(update_fields):
+        return
+    refresh_results(instance.quiz_id, attempt_ids=[instance.id])
+
+
+@receiver(post_delete, sender=QuizAttempt)
+def refresh_deleted_attempt_results(sender, instance, **kwargs):
+    # the individual result is deleted with the attempt, the team total is refreshed
+    # after the commit, when a deleted quiz has also taken its results with it
+    team_ids = [instance.team_id] if instance.team_id else []
+    transaction.on_commit(
+        lambda: refresh_results(instance.quiz_id, attempt_ids=[], team_ids=team_ids)
+    )
+
+
+@receiver(post_save, sender=Student)
+def refresh_student_results(sender, instance, created, **kwargs):
+    if created:
+        return
+    results = IndividualResult.objects.filter(student=instance)
+    results.update(
+        year_level=instance.year_level,
+        school_id=instance.school_id,
+        school_type=instance.school.type,
+        is_country=instance.school.is_country,
+    )
+    add_pending_rankings(results.values_list("quiz_id", flat=True))
+    refresh_team_details(list(instance.isA.values_list("team_id", flat=True)))
+
+
+@receiver(post_save, sender=School)
+def refresh_school_results(sender, instance, created, **kwargs):
+    if created:
+        return
+    individual_results = IndividualResult.objects.filter(school=instance)
+    team_results = TeamResult.objects.filter(school=instance)
+    individual_results.update(school_type=instance.type, is_country=instance.is_country)
+    team_results.update(school_type=instance.type, is_country=instance.is_country)
+    add_pending_rankings(
+        list(individual_results.values_list("quiz_id", flat=True).distinct())
+        + list(team_results.values_list("quiz_id", flat=True).distinct())
+    )
+
+
+@receiver(post_save, sender=Team)
+def refresh_team_results_details(sender, instance, created, **kwargs):
+    if not created:
+        refresh_team_details([instance.id])
+
+
+@receiver([post_save, post_delete], sender=TeamMember)
+def refresh_team_member_results(sender, instance, **kwargs):
+    refresh_team_details([instance.team_id])
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+@receiver([post_save, post_delete], sender=Student)
+def refresh_filter_choices(sender, **kwargs):
+    invalidate_filter_choices()
+
+
+@receiver(students_enrolled)
+def refresh_enrolled_filter_choices(sender, **kwargs):
+    invalidate_filter_choices()
@@ -1,8 +1,21 @@
+import csv
+import io
+import zipfile
+
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from api.quiz.models import Quiz, QuizAttempt
+from api.question.models import Answer, Question
+from api.quiz.marking import save_answers
+from api.quiz.models import Quiz, QuizAttempt, QuizSlot, QuestionAttempt
+from api.quiz.signals import attempts_marked
+from .choices import FILTER_CHOICES_CACHE_KEY
+from .models import IndividualResult, PendingRanking
+from .refresh import rank_pending_results, update_quiz_results
 from ..users.models import School, Student
 from ..team.models import Team, TeamMember
 from datetime import datetime
@@ -13,6 +26,7 @@ awst = tz.gettz("Australia/Perth")
 
 class ResultsAPITest(APITestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
 
         # Create schools
@@ -139,6 +153,13 @@ class ResultsAPITest(APITestCase):
                 "school_type": "Independent",
                 "is_country": True,
                 "total_marks": 85,
+                "rank": 1,
+                "dense_rank": 1,
+                "percentile": 100.0,
+                "placements": {
+                    partition: {"rank": 1, "dense_rank": 1, "percentile": 100.0}
+                    for partition in ("year_level", "school_type", "country")
+                },
             },
         )
 
@@ -201,3 +222,414 @@ class ResultsAPITest(APITestCase):
         data = response.json()["results"]
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]["school"], "Outback School")
+
+    def test_insights_should_count_students_and_teams(self):
+        # Arrange
+        QuizAttempt.objects.filter(id=self.quiz_attempt3.id).update(total_marks=0)
+        url = reverse("results:insight-list")
+
+        # Act
+        with self.assertNumQueries(5):  # session, user, quiz version, students and teams
+            response = self.client.get(url, {"quiz_id": self.quiz1.id})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        all_students, scored_students, all_teams, scored_teams = response.json()
+        self.assertEqual(all_students["category"], "All Students")
+        self.assertEqual(all_students["total"], 2)
+        self.assertEqual(all_students["public_count"], 2)
+        self.assertEqual(all_students["country"], 0)
+        self.assertEqual(scored_students["total"], 1)
+        self.assertEqual(all_teams["total"], 1)
+        self.assertEqual(scored_teams["total"], 1)
+
+    def test_insights_should_be_cached_until_marked(self):
+        # Arrange
+        url = reverse("results:insight-list")
+        self.client.get(url, {"quiz_id": self.quiz1.id})
+        QuizAttempt.objects.filter(quiz=self.quiz1).update(total_marks=0)
+
+        # Act
+        cached = self.client.get(url, {"quiz_id": self.quiz1.id}).json()
+        Quiz.objects.filter(id=self.quiz1.id).update(marked_at=datetime.now(tz=awst))
+        marked = self.client.get(url, {"quiz_id": self.quiz1.id}).json()
+
+        # Assert
+        self.assertEqual(cached[1]["total"], 2)
+        self.assertEqual(marked[1]["total"], 0)
+
+    def test_results_should_be_refreshed_when_attempts_are_marked(self):
+        # Arrange
+        QuizAttempt.objects.filter(id=self.quiz_attempt1.id).update(total_marks=10)
+        url = reverse("results:team-list")
+
+        # Act
+        before = IndividualResult.objects.get(quiz_attempt=self.quiz_attempt1).total_marks
+        attempts_marked.send(sender=Quiz, quiz_ids=[self.quiz1.id])
+        refreshed = IndividualResult.objects.get(quiz_attempt=self.quiz_attempt1).total_marks
+        after = self.client.get(url, {"quiz_id": self.quiz1.id}).json()["results"]
+
+        # Assert
+        self.assertEqual((before, refreshed), (100, 10))
+        self.assertEqual(after[0]["total_marks"], 50)
+        ranks = IndividualResult.objects.filter(quiz=self.quiz1).order_by("rank")
+        self.assertEqual(
+            [(result.student_id, result.rank) for result in ranks],
+            [(self.student3.id, 1), (self.student1.id, 2)],
+        )
+
+    def test_leaderboard_should_follow_answers_saved_during_the_quiz(self):
+        # Arrange
+        question = Question.objects.create(name="Autosaved", is_comp=True, diff_level=1, mark=60)
+        Answer.objects.create(question=question, value=7)
+        QuizSlot.objects.create(quiz=self.quiz1, question=question, slot_index=0, block=1)
+        QuizAttempt.objects.filter(id=self.quiz_attempt3.id).update(state=QuizAttempt.State.IN_PROGRESS)
+        attempt = QuizAttempt.objects.select_related("quiz").get(id=self.quiz_attempt3.id)
+        individual_url = reverse("results:individual-list")
+        team_url = reverse("results:team-list")
+
+        # Act
+        with CaptureQueriesContext(connection) as saved:
+            save_answers(attempt, {question.id: 7}, seq=1)
+        individual = self.client.get(individual_url, {"quiz_id": self.quiz1.id, "ordering": "rank"}).json()["results"]
+        teams = self.client.get(team_url, {"quiz_id": self.quiz1.id}).json()["results"]
+
+        # Assert
+        self.assertEqual(
+            [(result["name"], result["total_marks"], result["rank"]) for result in individual],
+            [("Test User1", 100, 1), ("Inactive User", 60, 2)],
+        )
+        self.assertEqual(teams[0]["total_marks"], 160)
+        # saving an answer only writes the answer and the attempt
+        self.assertFalse([query for query in saved.captured_queries if "results_" in query["sql"]])
+
+    def test_team_leaderboard_should_order_by_team_id(self):
+        # Arrange
+        QuizAttempt.objects.create(
+            quiz=self.quiz1, student=self.student2, total_marks=1, current_page=1, team=self.team2
+        )
+        url = reverse("results:team-list")
+
+        # Act
+        response = self.client.get(url, {"quiz_id": self.quiz1.id, "ordering": "-id"})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["results"]
+        self.assertEqual([team["id"] for team in data], [self.team2.id, self.team1.id])
+
+    def test_individual_leaderboard_should_rank_ties_and_filter_by_placement(self):
+        # Arrange
+        user = User.objects.create_user(username="tieduser", first_name="Tied", last_name="User")
+        student = Student.objects.create(user=user, school=self.school2, year_level="10")
+        QuizAttempt.objects.create(quiz=self.quiz1, student=student, total_marks=100, current_page=1)
+        url = reverse("results:individual-list")
+
+        # Act
+        response = self.client.get(url, {"quiz_id": self.quiz1.id, "rank__lte": 2, "ordering": "rank"})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["results"]
+        self.assertEqual([result["rank"] for result in data], [1, 1])
+        self.assertEqual([result["percentile"] for result in data], [100.0, 100.0])
+        low = IndividualResult.objects.get(quiz_attempt=self.quiz_attempt3)
+        self.assertEqual((low.rank, low.dense_rank, low.percentile), (3, 2, 33.3))
+        self.assertEqual((low.school_type_rank, low.country_rank), (2, 2))
+
+    def test_saved_attempts_should_be_ranked_when_read(self):
+        # Arrange
+        rank_pending_results()
+        user = User.objects.create_user(username="lateuser", first_name="Late", last_name="User")
+        student = Student.objects.create(user=user, school=self.school2, year_level="10")
+        url = reverse("results:individual-list")
+
+        # Act
+        with CaptureQueriesContext(connection) as created:
+            QuizAttempt.objects.create(
+                quiz=self.quiz1, student=student, total_marks=70, current_page=1, state=QuizAttempt.State.IN_PROGRESS
+            )
+        stale = IndividualResult.objects.get(quiz_attempt=self.quiz_attempt3)
+        pending = PendingRanking.objects.filter(quiz=self.quiz1).exists()
+        response = self.client.get(url, {"quiz_id": self.quiz1.id, "ordering": "rank"})
+
+        # Assert
+        self.assertFalse([query for query in created.captured_queries if query["sql"].startswith("UPDATE")])
+        self.assertEqual(stale.rank, 2)
+        self.assertTrue(pending)
+        self.assertEqual(
+            [(result["total_marks"], result["rank"]) for result in response.json()["results"]],
+            [(100, 1), (70, 2), (40, 3)],
+        )
+        self.assertFalse(PendingRanking.objects.exists())
+
+    def test_prepared_attempts_should_not_be_entries(self):
+        # Arrange
+        self.quiz1.time_window = 30
+        self.quiz1.save()
+        user = User.objects.create_user(username="absentuser", first_name="Absent", last_name="User")
+        student = Student.objects.create(user=user, school=self.school2, year_level="10")
+        TeamMember.objects.create(student=student, team=self.team1)
+        # an attempt prepared by the competition warm-up, never started by the student
+        attempt = QuizAttempt.objects.create(
+            quiz=self.quiz1, student=student, total_marks=0, current_page=0, prepared=True
+        )
+        attempts_marked.send(sender=Quiz, quiz_ids=[self.quiz1.id])
+
+        # Act
+        results = self.client.get(reverse("results:individual-list"), {"quiz_id": self.quiz1.id}).json()
+        insights = self.client.get(reverse("results:insight-list"), {"quiz_id": self.quiz1.id}).json()
+        low = IndividualResult.objects.get(quiz_attempt=self.quiz_attempt3)
+        attempt.start()
+        started = self.client.get(reverse("results:individual-list"), {"quiz_id": self.quiz1.id}).json()
+
+        # Assert
+        self.assertEqual(len(results["results"]), 2)
+        self.assertEqual(low.percentile, 50.0)
+        self.assertEqual(insights[0]["total"], 2)
+        self.assertEqual(len(started["results"]), 3)
+
+    def test_team_list_should_use_constant_queries(self):
+        # Arrange
+        url = reverse("results:teamlist-list")
+        params = {"quiz_id": self.quiz1.id, "limit": 100}
+        # the first read after attempts were saved also computes their placements
+        update_quiz_results(self.quiz1.id)
+        with CaptureQueriesContext(connection) as one_team:
+            self.client.get(url, params)
+        for index in range(5):
+            team = Team.objects.create(name=f"Team {index}", school=self.school2)
+            user = User.objects.create_user(username=f"member{index}", first_name="", last_name="")
+            student = Student.objects.create(user=user, school=self.school2, year_level="9")
+            TeamMember.objects.create(student=student, team=team)
+            QuizAttempt.objects.create(
+                quiz=self.quiz1, student=student, total_marks=index, current_page=1, team=team
+            )
+        update_quiz_results(self.quiz1.id)
+
+        # Act
+        with self.assertNumQueries(len(one_team)):
+            response = self.client.get(url, params)
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["results"]
+        self.assertEqual(len(data), 6)
+        team1 = next(team for team in data if team["id"] == self.team1.id)
+        self.assertEqual(
+            team1["students"],
+            [
+                {"id": self.student1.id, "name": "Test User1", "year_level": "10", "student_score": 100},
+                {"id": self.student3.id, "name": "Inactive User", "year_level": "10", "student_score": 40},
+            ],
+        )
+        team4 = next(team for team in data if team["name"] == "Team 4")
+        self.assertEqual(team4["students"][0]["name"], "member4")
+        self.assertEqual(team4["students"][0]["student_score"], 4)
+
+    def test_quiz_attempts_should_export_response_matrix(self):
+        # Arrange
+        questions = [
+            Question.objects.create(name=f"Q{index}", is_comp=True, diff_level=1, mark=1)
+            for index in range(3)
+        ]
+        for index, question in enumerate(questions):
+            QuizSlot.objects.create(quiz=self.quiz1, question=question, slot_index=index, block=1)
+        for attempt, question, answer in [
+            (self.quiz_attempt1, questions[0], 10),
+            (self.quiz_attempt1, questions[2], 12),
+            (self.quiz_attempt3, questions[1], 21),
+        ]:
+            QuestionAttempt.objects.create(
+                student=attempt.student, question=question, quiz_attempt=attempt, answer_student=answer,
+                is_correct=False,
+            )
+        url = reverse("results:quiz-attempts-responses")
+
+        # Act
+        with self.assertNumQueries(5):  # session, user, slots, attempts and their answers
+            response = self.client.get(url, {"quiz_id": self.quiz1.id, "format": "csv"})
+            lines = b"".join(response.streaming_content).decode().splitlines()
+        paginated = self.client.get(reverse("results:quiz-attempts-list"), {"quiz_id": self.quiz1.id})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        columns = [f"{question.id}|{question.name}" for question in questions]
+        self.assertEqual(lines[0].split(",")[-3:], columns)
+        self.assertEqual(lines[1].split(",")[-3:], ["10", "", "12"])
+        self.assertEqual(lines[2].split(",")[-3:], ["", "21", ""])
+        self.assertEqual(
+            paginated.json()["results"][0]["student_responses"],
+            {columns[0]: 10, columns[1]: None, columns[2]: 12},
+        )
+
+    def test_team_results_should_export_csv(self):
+        # Arrange
+        url = reverse("results:team-export")
+
+        # Act
+        response = self.client.get(url, {"quiz_id": self.quiz1.id, "format": "csv"})
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'quiz-{self.quiz1.id}-team.csv', response["Content-Disposition"])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["name"], "Team A")
+        self.assertEqual(rows[0]["total_marks"], "140")
+        self.assertEqual(rows[0]["students"], "Test User1; Inactive User")
+        self.assertEqual(rows[0]["placements.country.rank"], "1")
+
+    def test_individual_results_should_export_xlsx(self):
+        # Arrange
+        url = reverse("results:individual-export")
+
+        # Act
+        response = self.client.get(url, {"quiz_id": self.quiz1.id, "format": "xlsx", "ordering": "-total_marks"})
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("xl/workbook.xml", archive.namelist())
+        self.assertEqual(sheet.count("<row>"), 3)
+        self.assertLess(sheet.index("Test User1"), sheet.index("Inactive User"))
+
+    def test_export_should_require_quiz_id(self):
+        # Act
+        response = self.client.get(reverse("results:individual-export"), {"format": "csv"})
+
+        # Assert
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content.decode().splitlines(), ["detail", "Quiz ID is required."])
+
+    def test_individual_leaderboard_should_page_with_cursors(self):
+        # Arrange
+        for index in range(5):
+            user = User.objects.create_user(username=f"cursor{index}", first_name="Cursor", last_name=str(index))
+            student = Student.objects.create(user=user, school=self.school1, year_level="9")
+            QuizAttempt.objects.create(quiz=self.quiz1, student=student, total_marks=40, current_page=1)
+        url = reverse("results:individual-list")
+        params = {"quiz_id": self.quiz1.id, "ordering": "-total_marks", "limit": 2, "count": "exact"}
+
+        # Act
+        pages = [self.client.get(url, params).json()]
+        while pages[-1]["next"]:
+            pages.append(self.client.get(pages[-1]["next"]).json())
+        previous = self.client.get(pages[-1]["previous"]).json()
+        offset = self.client.get(url, {**params, "offset": 2}).json()
+
+        # Assert
+        names = [result["name"] for page in pages for result in page["results"]]
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(pages[0]["count"], 7)
+        self.assertEqual(len(set(names)), 7)
+        self.assertEqual([result["total_marks"] for page in pages for result in page["results"]], [100] + [40] * 6)
+        self.assertEqual(previous["results"], pages[-2]["results"])
+        self.assertEqual(offset["count"], 7)
+        self.assertEqual(offset["results"], pages[1]["results"])
+
+    def test_item_analysis_should_describe_each_question(self):
+        # Arrange
+        q0, q1 = [
+            Question.objects.create(name=f"Item {index}", is_comp=True, diff_level=1, mark=1)
+            for index in range(2)
+        ]
+        QuizSlot.objects.create(quiz=self.quiz1, question=q0, slot_index=0, block=1)
+        QuizSlot.objects.create(quiz=self.quiz1, question=q1, slot_index=1, block=1)
+        attempt2 = QuizAttempt.objects.create(quiz=self.quiz1, student=self.student2, total_marks=70, current_page=1)
+        # the rows are created in the order the questions are answered
+        for attempt, question, answer, is_correct in [
+            (self.quiz_attempt1, q1, 1, True),
+            (self.quiz_attempt1, q0, 1, True),
+            (self.quiz_attempt3, q0, 7, False),
+            (self.quiz_attempt3, q1, 5, False),
+            (attempt2, q0, 7, False),
+            (attempt2, q1, 1, True),
+        ]:
+            QuestionAttempt.objects.create(
+                student=attempt.student, question=question, quiz_attempt=attempt,
+                answer_student=answer, is_correct=is_correct,
+            )
+        url = reverse("results:item-analysis-list")
+
+        # Act
+        response = self.client.get(url, {"quiz_id": self.quiz1.id})
+        with self.assertNumQueries(3):  # session, user and quiz version
+            cached = self.client.get(url, {"quiz_id": self.quiz1.id})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        first, second = response.json()
+        self.assertEqual(cached.json(), [first, second])
+        self.assertEqual((first["question_id"], first["attempts"], first["correct"]), (q0.id, 3, 1))
+        self.assertEqual(first["percent_correct"], 33.3)
+        self.assertEqual(first["point_biserial"], 0.866)
+        self.assertEqual(first["average_position"], 1.33)
+        self.assertEqual(first["wrong_answers"], [{"answer": 7, "count": 2}])
+        self.assertEqual((second["percent_correct"], second["point_biserial"]), (66.7, 0.866))
+        self.assertEqual(second["average_position"], 1.67)
+        self.assertEqual(second["wrong_answers"], [{"answer": 5, "count": 1}])
+
+    def test_histogram_should_bin_scores_by_group(self):
+        # Arrange
+        url = reverse("results:histogram-list")
+
+        # Act
+        response = self.client.get(url, {"quiz_id": self.quiz1.id, "bin_width": 25})
+        invalid = self.client.get(url, {"quiz_id": self.quiz1.id, "bin_width": 0})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "bin_width": 25,
+                "bins": [0, 25, 50, 75, 100],
+                "all": [0, 1, 0, 0, 1],
+                "year_level": {"10": [0, 1, 0, 0, 1]},
+                "school_type": {"Public": [0, 1, 0, 0, 1]},
+            },
+        )
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_filter_choices_should_be_cached_until_changed(self):
+        # Arrange
+        url = reverse("results:individual-list")
+        self.client.get(url, {"year_level": 10, "quiz_id": self.quiz1.id})
+
+        # Act
+        # session, user, the quiz lock, stale attempts and pending ranking in a savepoint, and results,
+        # the choices are cached
+        with self.assertNumQueries(8):
+            cached = self.client.get(url, {"year_level": 10, "quiz_id": self.quiz1.id})
+        with self.assertNumQueries(3):  # session, user and the year level looked up, the choices are kept
+            unknown = self.client.get(url, {"year_level": 7})
+        user = User.objects.create_user(username="year7", first_name="Year", last_name="Seven")
+        Student.objects.create(user=user, school=self.school1, year_level="7")
+        known = self.client.get(url, {"year_level": 7})
+
+        # Assert
+        self.assertEqual(len(cached.json()["results"]), 2)
+        self.assertEqual(unknown.status_code, 400)
+        self.assertEqual(known.status_code, 200)
+
+    def test_filter_choices_cached_by_another_process_should_accept_new_quizzes(self):
+        # Arrange
+        url = reverse("results:individual-list")
+        self.client.get(url, {"quiz_id": self.quiz1.id})
+        stale = cache.get(FILTER_CHOICES_CACHE_KEY)
+        quiz = Quiz.objects.create(name="New Quiz", intro="New", total_marks=100, open_time_date=datetime.now(tz=awst))
+        # the quiz was created by another process, whose receiver left this cache alone
+        cache.set(FILTER_CHOICES_CACHE_KEY, stale)
+
+        # Act
+        response = self.client.get(url, {"quiz_id": quiz.id})
+        unknown = self.client.get(url, {"quiz_id": quiz.id + 1})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+        self.assertEqual(unknown.status_code, 400)
+        self.assertIn((quiz.id, "New Quiz"), cache.get(FILTER_CHOICES_CACHE_KEY)["quizzes"])
@@ -11,7 +11,16 @@ Note: The `DefaultRouter` is included for potential future API extensions.
 """
 
 from django.urls import include, path
-from .views import IndividualResultsViewSet, TeamResultsViewSet, TeamListViewSet, InsightsViewSet, QuestionAttemptsViewSet, QuizAttemptViewSet
+from .views import (
+    IndividualResultsViewSet,
+    TeamResultsViewSet,
+    TeamListViewSet,
+    InsightsViewSet,
+    HistogramViewSet,
+    ItemAnalysisViewSet,
+    QuestionAttemptsViewSet,
+    QuizAttemptViewSet,
+)
 from rest_framework.routers import SimpleRouter
 
 app_name = "results"
@@ -22,6 +31,8 @@ router.register(
 )
 router.register("results/team", TeamResultsViewSet, basename="team")
 router.register("results/insight", InsightsViewSet, basename="insight")
+router.register("results/histogram", HistogramViewSet, basename="histogram")
+router.register("results/item-analysis", ItemAnalysisViewSet, basename="item-analysis")
 router.register(
     "results/question-attempts", QuestionAttemptsViewSet, basename="question-attempts"
 )
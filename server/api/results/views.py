@@ -1,12 +1,27 @@
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import BigIntegerField
 from rest_framework import viewsets, filters, status
-from django_filters import FilterSet, ChoiceFilter, ModelChoiceFilter
-from django.db.models import Sum, Max
-from django.db.models.functions import Cast
-from ..quiz.models import Quiz, QuizAttempt, QuestionAttempt
+from django_filters import FilterSet, ChoiceFilter
+from ..quiz.models import Quiz, QuizAttempt, QuizSlot, QuestionAttempt
 from .serializers import IndividualResultsSerializer, TeamResultsSerializer, TeamListSerializer, QuestionAttemptSerializer, QuizAttemptSerializer
-from ..team.models import Team
+from .analysis import DEFAULT_WRONG_ANSWERS, MAX_WRONG_ANSWERS, get_item_analysis
+from .choices import (
+    CachedChoiceFilter,
+    get_quiz_id_choices,
+    get_quiz_name_choices,
+    get_year_level_choices,
+    quiz_id_exists,
+    quiz_name_exists,
+    year_level_exists,
+)
+from .exports import EXPORT_CHUNK_SIZE, EXPORT_RENDERERS, ExportMixin, export_response, flatten_row
+from .histograms import DEFAULT_BIN_WIDTH, get_histogram
+from .insights import get_insights
+from .models import IndividualResult, TeamResult
+from .pagination import ResultsPagination
+from .refresh import PLACEMENT_FIELDS, update_quiz_results
+from .responses import build_response_matrix, get_response_columns, iter_response_matrix
 from ..users.models import School, Student
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
@@ -14,36 +29,55 @@ from rest_framework.decorators import action, permission_classes
 from rest_framework.permissions import IsAdminUser
 
 
+class AliasOrderingFilter(filters.OrderingFilter):
+    """
+    Ordering filter that maps the ordering keys of a view to other lookups with the view's
+    `ordering_aliases`, so that the keys used by clients stay the same when a column moves.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        aliases = getattr(view, "ordering_aliases", {})
+        if not ordering:
+            return ordering
+        return [
+            f"-{aliases.get(term[1:], term[1:])}" if term.startswith("-") else aliases.get(term, term)
+            for term in ordering
+        ]
+
+
 class IndividualResultsFilter(FilterSet):
-    quiz_name = ModelChoiceFilter(
+    # the choices are validated against the cached lookup of `choices.py`
+    quiz_name = CachedChoiceFilter(
         field_name="quiz__name",
-        queryset=Quiz.objects.all(),
+        choices=get_quiz_name_choices,
+        exists=quiz_name_exists,
         label="Quiz Name",
-        to_field_name="name",
     )
-    quiz_id = ModelChoiceFilter(
-        queryset=Quiz.objects.all().values_list("id", flat=True),
+    quiz_id = CachedChoiceFilter(
+        field_name="quiz_id",
+        choices=get_quiz_id_choices,
+        exists=quiz_id_exists,
         label="Quiz ID",
     )
-    year_level = ModelChoiceFilter(
-        field_name="student__year_level",
-        queryset=Student.objects.distinct("year_level").values_list(
-            "year_level", flat=True
-        ),
+    year_level = CachedChoiceFilter(
+        field_name="year_level",
+        choices=get_year_level_choices,
+        exists=year_level_exists,
         label="Year Level",
-        to_field_name="year_level",
     )
     school_type = ChoiceFilter(
-        field_name="student__school__type", choices=School.SchoolType.choices
+        field_name="school_type", choices=School.SchoolType.choices
     )
 
     class Meta:
-        model = QuizAttempt
-        fields = ["quiz_name", "quiz_id", "year_level", "school_type"]
+        model = IndividualResult
+        # the declared filters, and e.g. `rank__lte` or `year_level_percentile__gte` for the placements
+        fields = {field: ["exact", "lte", "gte"] for field in PLACEMENT_FIELDS}
 
 
 @permission_classes([IsAdminUser])
-class IndividualResultsViewSet(viewsets.ReadOnlyModelViewSet):
+class IndividualResultsViewSet(ExportMixin, viewsets.ReadOnlyModelViewSet):
     """
     ResultsView API view to manage Results data.
 
@@ -61,7 +95,7 @@ class IndividualResultsViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IndividualResultsFilter
     filter_backends = [
         DjangoFilterBackend,
-        filters.OrderingFilter,
+        AliasOrderingFilter,
         filters.SearchFilter,
     ]
     search_fields = ["student__user__first_name", "student__user__last_name"]
@@ -71,12 +105,26 @@ class IndividualResultsViewSet(viewsets.ReadOnlyModelViewSet):
         "student__school__type",
         "student__school__name",
         "student__user__first_name",
+        *PLACEMENT_FIELDS,
     ]
+    # the stored results hold the year level and school type of the student
+    ordering_aliases = {
+        "student__year_level": "year_level",
+        "student__school__type": "school_type",
+        "student__school__name": "school__name",
+    }
     ordering = ["-student__year_level"]
+    pagination_class = ResultsPagination
+    page_size = 100
+    cursor_fields = ["total_marks", "year_level", "school_type", *PLACEMENT_FIELDS]
+    export_name = "individual"
 
     def get_queryset(self):
-        queryset = QuizAttempt.objects.select_related("quiz", "student__school")
+        queryset = IndividualResult.objects.select_related("student__user", "school")
         quiz_id = self.request.query_params.get("quiz_id")
+        # answers saved during the quiz and the placements they left pending are applied before they are read
+        if quiz_id and quiz_id.isdigit():
+            update_quiz_results(int(quiz_id))
         if quiz_id:
             queryset = queryset.filter(quiz_id=quiz_id)
         return queryset
@@ -96,38 +144,38 @@ class IndividualResultsViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 class TeamResultsFilter(FilterSet):
-    quiz_name = ModelChoiceFilter(
-        field_name="quiz_attempts__quiz__name",  # Correctly reference the quiz name
-        queryset=Quiz.objects.all(),
+    quiz_name = CachedChoiceFilter(
+        field_name="quiz__name",
+        choices=get_quiz_name_choices,
+        exists=quiz_name_exists,
         label="Quiz Name",
-        to_field_name="name",
     )
-    quiz_id = ModelChoiceFilter(
-        field_name="quiz_attempts__quiz__id",  # Correctly reference the quiz ID
-        queryset=Quiz.objects.all().values_list("id", flat=True),
+    quiz_id = CachedChoiceFilter(
+        field_name="quiz_id",
+        choices=get_quiz_id_choices,
+        exists=quiz_id_exists,
         label="Quiz ID",
     )
-    year_level = ModelChoiceFilter(
-        field_name="students__year_level",
-        queryset=Student.objects.distinct("year_level").values_list(
-            "year_level", flat=True
-        ),
+    year_level = CachedChoiceFilter(
+        field_name="team__students__year_level",
+        choices=get_year_level_choices,
+        exists=year_level_exists,
         label="Year Level",
-        to_field_name="year_level",
+        distinct=True,
     )
     school_type = ChoiceFilter(
-        field_name="students__school__type",
+        field_name="school_type",
         choices=School.SchoolType.choices,
         label="School Type",
     )
 
     class Meta:
-        model = Team
-        fields = ["quiz_name", "quiz_id", "year_level", "school_type"]
+        model = TeamResult
+        fields = {field: ["exact", "lte", "gte"] for field in PLACEMENT_FIELDS}
 
 
 @permission_classes([IsAdminUser])
-class TeamResultsViewSet(viewsets.ReadOnlyModelViewSet):
+class TeamResultsViewSet(ExportMixin, viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         quiz_id = self.request.query_params.get("quiz_id")
         if not quiz_id:
@@ -138,26 +186,33 @@ class TeamResultsViewSet(viewsets.ReadOnlyModelViewSet):
         except ValueError:
             raise ValidationError({"quiz_id": "Invalid quiz_id. Must be an integer."})
 
-        # Filter teams that are referenced in the `team` field of a QuizAttempt for the given quiz
-        queryset = Team.objects.filter(quiz_attempts__quiz_id=quiz_id).distinct()
-
-        # Annotate additional fields for the queryset
-        queryset = queryset.annotate(
-            total_marks=Sum("quiz_attempts__total_marks"),
-            max_year=Max(Cast("students__year_level", output_field=BigIntegerField())),
-        )
-        return queryset
+        # answers saved during the quiz and the placements they left pending are applied before they are read
+        update_quiz_results(quiz_id)
+        # the stored results of the teams referenced in the `team` field of a QuizAttempt for the given quiz
+        return TeamResult.objects.filter(quiz_id=quiz_id).select_related(
+            "team", "school"
+        ).prefetch_related("team__students__user")
 
     serializer_class = TeamResultsSerializer
     filterset_class = TeamResultsFilter
     filter_backends = [
         DjangoFilterBackend,
-        filters.OrderingFilter,
+        AliasOrderingFilter,
         filters.SearchFilter,
     ]
-    search_fields = ["school__name", "id"]
-    ordering_fields = ["total_marks", "max_year", "id", "school__name"]
+    search_fields = ["school__name", "team__id"]
+    ordering_fields = ["total_marks", "max_year", "id", "school__name", *PLACEMENT_FIELDS]
+    # `id` is the id of the team
+    ordering_aliases = {"id": "team_id"}
     ordering = ["-total_marks"]
+    pagination_class = ResultsPagination
+    page_size = 50
+    cursor_fields = ["total_marks", "team_id", *PLACEMENT_FIELDS]
+    export_name = "team"
+
+    def get_export_row(self, data):
+        data["students"] = [student["name"] for student in data["students"]]
+        return flatten_row(data)
 
     # action for getting non-paginated results
     @action(detail=False, methods=["get"], pagination_class=None)
@@ -181,55 +236,99 @@ class InsightsViewSet(viewsets.ReadOnlyModelViewSet):
 
     def list(self, request, *args, **kwargs):
         quiz_id = self.request.query_params.get("quiz_id")
-        all_students = Student.objects.filter(quiz_attempts__quiz_id=quiz_id).distinct() if quiz_id else Student.objects.all()
-        scored_students = all_students.filter(quiz_attempts__total_marks__gt=0)
-        all_teams = Team.objects.filter(quiz_attempts__quiz_id=quiz_id).distinct() if quiz_id else Team.objects.all()
-        scored_team = all_teams.filter(
-            students__quiz_attempts__total_marks__gt=0
-        ).distinct()
-
-        def get_counts(queryset, category, type):
-
-            if type == "student":
-                year_filter = "year_level"
-            elif type == "team":
-                year_filter = "students__year_level"
-
-            return {
-                "category": category,
-                "total": queryset.count(),
-                "public_count": queryset.filter(school__type="Public").count(),
-                "catholic_count": queryset.filter(school__type="Catholic").count(),
-                "independent_count": queryset.filter(
-                    school__type="Independent"
-                ).count(),
-                "allies_count": queryset.filter(school__type="Allies").count(),
-                "country": queryset.filter(school__is_country=True).count(),
-                "year_7": queryset.filter(**{year_filter: "7"}).count(),
-                "year_8": queryset.filter(**{year_filter: "8"}).count(),
-                "year_9": queryset.filter(**{year_filter: "9"}).count(),
-            }
-
-        data = [
-            get_counts(all_students, "All Students", "student"),
-            get_counts(scored_students, "Students with scores", "student"),
-            get_counts(all_teams, "All Teams", "team"),
-            get_counts(scored_team, "Teams with scores", "team"),
-        ]
+        if quiz_id:
+            try:
+                quiz_id = int(quiz_id)
+            except ValueError:
+                raise ValidationError({"quiz_id": "Invalid quiz_id. Must be an integer."})
+        try:
+            data = get_insights(quiz_id)
+        except Quiz.DoesNotExist:
+            return Response(
+                {"detail": "Quiz not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(data, status=status.HTTP_200_OK)
 
+
+@permission_classes([IsAdminUser])
+class HistogramViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    View to retrieve the score distribution of a quiz in bins of `?bin_width=` marks,
+    in total, by year level and by school type.
+    """
+
+    # need to define get_queryset, but we don't use
+    def get_queryset(self):
+        return IndividualResult.objects.none()
+
+    def list(self, request, *args, **kwargs):
+        quiz_id = self.request.query_params.get("quiz_id")
+        if not quiz_id:
+            return Response(
+                {"detail": "Quiz ID is required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            quiz_id = int(quiz_id)
+            bin_width = int(self.request.query_params.get("bin_width", DEFAULT_BIN_WIDTH))
+        except ValueError:
+            raise ValidationError({"detail": "quiz_id and bin_width must be integers."})
+        if bin_width < 1:
+            raise ValidationError({"bin_width": "Must be at least 1."})
+        try:
+            data = get_histogram(quiz_id, bin_width)
+        except Quiz.DoesNotExist:
+            return Response(
+                {"detail": "Quiz not found."}, status=status.HTTP_404_NOT_FOUND
+            )
         return Response(data, status=status.HTTP_200_OK)
 
 
-class QuestionAttemptsViewSet(viewsets.ReadOnlyModelViewSet):
+@permission_classes([IsAdminUser])
+class ItemAnalysisViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    View to retrieve the item analysis of each question of a quiz, with `?top=` of its most
+    common wrong answers.
+    """
+
+    # need to define get_queryset, but we don't use
+    def get_queryset(self):
+        return QuizSlot.objects.none()
+
+    def list(self, request, *args, **kwargs):
+        quiz_id = self.request.query_params.get("quiz_id")
+        if not quiz_id:
+            return Response(
+                {"detail": "Quiz ID is required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            quiz_id = int(quiz_id)
+            wrong_answers = int(self.request.query_params.get("top", DEFAULT_WRONG_ANSWERS))
+        except ValueError:
+            raise ValidationError({"detail": "quiz_id and top must be integers."})
+        if not 0 <= wrong_answers <= MAX_WRONG_ANSWERS:
+            raise ValidationError({"top": f"Must be between 0 and {MAX_WRONG_ANSWERS}."})
+        try:
+            data = get_item_analysis(quiz_id, wrong_answers)
+        except Quiz.DoesNotExist:
+            return Response(
+                {"detail": "Quiz not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class QuestionAttemptsViewSet(ExportMixin, viewsets.ReadOnlyModelViewSet):
     """
     View to retrieve all question attempts for a specific quiz.
     """
 
-    queryset = QuestionAttempt.objects.all()
+    queryset = QuestionAttempt.objects.select_related("quiz_attempt__quiz", "student__user", "question")
     serializer_class = QuestionAttemptSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["student__user__first_name", "student__user__last_name"]
     ordering_fields = ["student__year_level", "question__id", "is_correct" "marks"]
+    pagination_class = ResultsPagination
+    page_size = 200
+    export_name = "question-attempts"
 
     def get_queryset(self):
         quiz_id = self.request.query_params.get("quiz_id")
@@ -281,11 +380,13 @@ class QuizAttemptViewSet(viewsets.ReadOnlyModelViewSet):
     """
     View to retrieve all quiz attempts for a specific quiz, along with their question attempts.
     """
-    queryset = QuizAttempt.objects.all()
+    queryset = QuizAttempt.objects.select_related("student__user")
     serializer_class = QuizAttemptSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["student__user__first_name", "student__user__last_name"]
     ordering_fields = ["student__user__last_name", "student__user__first_name", "time_start"]
+    pagination_class = ResultsPagination
+    page_size = 50
 
     def get_queryset(self):
         quiz_id = self.request.query_params.get("quiz_id")
@@ -304,6 +405,21 @@ class QuizAttemptViewSet(viewsets.ReadOnlyModelViewSet):
         context['quiz_id'] = self.request.query_params.get('quiz_id')
         return context
 
+    def get_attempts_serializer(self, attempts):
+        """Serialize attempts with the responses of all of them loaded at once."""
+        serializer = self.get_serializer(attempts, many=True)
+        quiz_id = self.request.query_params.get("quiz_id")
+        if quiz_id:
+            serializer.context["student_responses"] = build_response_matrix(int(quiz_id), list(attempts))
+        return serializer
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_attempts_serializer(page).data)
+        return Response(self.get_attempts_serializer(queryset).data)
+
     # action for getting non-paginated results
     @action(detail=False, methods=["get"], pagination_class=None)
     def non_paginated(self, request, *args, **kwargs):
@@ -314,9 +430,45 @@ class QuizAttemptViewSet(viewsets.ReadOnlyModelViewSet):
             )
 
         quiz_attempts = self.get_queryset()
-        serializer = self.get_serializer(quiz_attempts, many=True)
+        serializer = self.get_attempts_serializer(quiz_attempts)
         return Response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=["get"],
+        pagination_class=None,
+        permission_classes=[IsAdminUser],
+        renderer_classes=EXPORT_RENDERERS,
+    )
+    def responses(self, request, *args, **kwargs):
+        """
+        Stream the response matrix of a quiz as JSON or, with `?format=csv` or `?format=xlsx`,
+        as a spreadsheet, with one row per attempt and one column per question.
+        """
+        quiz_id = self.request.query_params.get("quiz_id")
+        if not quiz_id:
+            return Response(
+                {"detail": "Quiz ID is required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        attempts = self.filter_queryset(self.get_queryset())
+        if not attempts.ordered:
+            attempts = attempts.order_by("id")
+        quiz_id = int(quiz_id)
+        fields = [name for name in QuizAttemptSerializer.Meta.fields if name != "student_responses"]
+        columns = get_response_columns(quiz_id)
+        header = fields + [name for _, name in columns]
+        context = self.get_serializer_context()
+
+        def get_rows():
+            for attempt, responses in iter_response_matrix(columns, attempts, EXPORT_CHUNK_SIZE):
+                context["student_responses"] = {attempt.id: responses}
+                data = QuizAttemptSerializer(attempt, context=context).data
+                del data["student_responses"]
+                yield {**data, **responses}
+
+        return export_response(request, f"quiz-{quiz_id}-responses", header, get_rows())
+
 
 @permission_classes([IsAdminUser])
 class TeamListViewSet(viewsets.ReadOnlyModelViewSet):
@@ -329,31 +481,43 @@ class TeamListViewSet(viewsets.ReadOnlyModelViewSet):
             quiz_id = int(quiz_id)
         except ValueError:
             raise ValidationError({"quiz_id": "Invalid quiz_id. Must be an integer."})
-        queryset = Team.objects.filter(quiz_attempts__quiz_id=quiz_id).distinct()
-
-        # Annotate additional fields for the queryset
-        queryset = queryset.annotate(
-            total_marks=Sum("quiz_attempts__total_marks"),
+        # one query for the students of every listed team, sorted and with their score in the quiz
+        students = (
+            Student.objects.select_related("user")
+            .annotate(
+                student_score=Coalesce(
+                    Subquery(
+                        QuizAttempt.objects.filter(student=OuterRef("pk"), quiz_id=quiz_id)
+                        .order_by("id")
+                        .values("total_marks")[:1]
+                    ),
+                    0,
+                )
+            )
+            .order_by("id")
+        )
+        # answers saved during the quiz and the placements they left pending are applied before they are read
+        update_quiz_results(quiz_id)
+        return (
+            TeamResult.objects.filter(quiz_id=quiz_id)
+            .select_related("team", "school")
+            .prefetch_related(Prefetch("team__students", queryset=students))
         )
-
-        return queryset
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        quiz_id = self.request.query_params.get("quiz_id")
-        context.update({"quiz_id": quiz_id})
-        return context
 
     serializer_class = TeamListSerializer
     filterset_class = TeamResultsFilter
     filter_backends = [
         DjangoFilterBackend,
-        filters.OrderingFilter,
+        AliasOrderingFilter,
         filters.SearchFilter,
     ]
-    search_fields = ["school__name", "id"]
+    search_fields = ["school__name", "team__id"]
     ordering_fields = ["total_marks", "id", "school__name"]
+    ordering_aliases = {"id": "team_id"}
     ordering = ["-total_marks"]
+    pagination_class = ResultsPagination
+    page_size = 50
+    cursor_fields = ["total_marks", "team_id"]
 
     # action for getting non-paginated results
     @action(detail=False, methods=["get"], pagination_class=None)
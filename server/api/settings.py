@@ -187,6 +187,65 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Cache keys include a version stamp read from the database (e.g. Quiz.updated_at),
+# so a per-process cache stays consistent between gunicorn workers.
+# Use a shared backend (e.g. FileBasedCache) to let management commands such as
+# warm_up_competitions fill the cache used by the workers.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND")
+        or "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": os.environ.get("CACHE_LOCATION") or "wajo",
+    }
+}
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+# Staff and teacher passwords use the first hasher. Generated student passwords use the
+# cheaper STUDENT_PASSWORD_HASHER, e.g. student_scrypt, student_pbkdf2_sha256 or argon2
+# with argon2-cffi installed, and are rehashed with it on login when it or its cost changes.
+# Compare the logins per second of each with `manage.py benchmark_logins`.
+
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+    "api.users.hashers.StudentScryptPasswordHasher",
+    "api.users.hashers.StudentPBKDF2PasswordHasher",
+]
+STUDENT_PASSWORD_HASHER = os.environ.get("STUDENT_PASSWORD_HASHER") or "student_scrypt"
+# about 25 ms and 8 MiB per login on one core, where the default hasher takes 270 ms
+STUDENT_SCRYPT_WORK_FACTOR = int(os.environ.get("STUDENT_SCRYPT_WORK_FACTOR") or 2**13)
+STUDENT_PBKDF2_ITERATIONS = int(os.environ.get("STUDENT_PBKDF2_ITERATIONS") or 100_000)
+
+AUTHENTICATION_BACKENDS = ["api.users.backends.StudentPasswordBackend"]
+
+# Token buckets of the logins per client IP and per school of the students, and of the failed
+# logins per student, as the logins allowed at once and the logins per second added back.
+# Logins finding their bucket empty get a 429 instead of waiting for a worker.
+# A school behind one NAT shares its IP bucket.
+LOGIN_THROTTLE_RATES = {
+    "ip": (
+        int(os.environ.get("LOGIN_THROTTLE_IP_BURST") or 300),
+        float(os.environ.get("LOGIN_THROTTLE_IP_RATE") or 30),
+    ),
+    "school": (
+        int(os.environ.get("LOGIN_THROTTLE_SCHOOL_BURST") or 300),
+        float(os.environ.get("LOGIN_THROTTLE_SCHOOL_RATE") or 30),
+    ),
+    "user": (
+        int(os.environ.get("LOGIN_THROTTLE_USER_BURST") or 10),
+        float(os.environ.get("LOGIN_THROTTLE_USER_RATE") or 1 / 60),
+    ),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -1,4 +1,5 @@
 from unfold.admin import ModelAdmin, StackedInline
+from .hashers import set_user_password
 from .models import School, Student, Teacher
 from django.contrib import admin
 from django.contrib.auth.models import User
@@ -50,7 +51,7 @@ class CustomUserAdmin(ModelAdmin, ImportExportModelAdmin):
 
     def save_model(self, request, obj, form, change):
         if form.cleaned_data["password"]:
-            obj.set_password(form.cleaned_data["password"])
+            set_user_password(obj, form.cleaned_data["password"])
         super().save_model(request, obj, form, change)
 
 
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password
+
+from rest_framework.exceptions import Throttled
+
+from .hashers import make_student_password
+from .throttling import return_login_token, take_login_token
+
+
+class StudentPasswordBackend(ModelBackend):
+    """
+    Model backend checking the passwords of students against `STUDENT_PASSWORD_HASHER`, so
+    their hashes are upgraded to it on login instead of to the hasher of the staff.
+
+    The logins of the students of a school take a token of its login bucket and of the bucket of
+    failed logins of the student before the password is hashed, and raise `Throttled` when one is
+    empty, which the token endpoint returns as a 429. A wrong password gives the token of the
+    school back, so it cannot lock the students of a school out, and a right one that of the student.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            # the relations read by the token claims are loaded with the user, in one query
+            user = UserModel._default_manager.select_related("student", "teacher").get(
+                **{UserModel.USERNAME_FIELD: username}
+            )
+        except UserModel.DoesNotExist:
+            # hash the password anyway, with the hasher of most users, so unknown usernames
+            # take as long as wrong passwords
+            make_student_password(password)
+            return None
+        if not hasattr(user, "student"):
+            if user.check_password(password) and self.user_can_authenticate(user):
+                return user
+            return None
+
+        # a school logging in faster than the competition can start is turned away before the hash
+        school_id = user.student.school_id
+        wait = take_login_token("school", school_id)
+        if wait is not None:
+            raise Throttled(wait)
+        # and so is a student whose password was guessed too often
+        wait = take_login_token("user", username)
+        if wait is not None:
+            return_login_token("school", school_id)
+            raise Throttled(wait)
+
+        def upgrade(raw_password):
+            user.password = make_student_password(raw_password)
+            user.save(update_fields=["password"])
+
+        if not (
+            check_password(password, user.password, upgrade, preferred=settings.STUDENT_PASSWORD_HASHER)
+            and self.user_can_authenticate(user)
+        ):
+            return_login_token("school", school_id)
+            return None
+        return_login_token("user", username)
+        return user
@@ -0,0 +1,161 @@
+"""
+Bulk enrolment of students.
+
+The rows of a roster are validated one by one, so an invalid row is reported without aborting
+the others. The usernames of each school are then allocated as one block, the passwords are
+hashed across a process pool, and the users and students are inserted with `bulk_create` in
+one transaction, instead of a username lookup, a hash and two saves per student.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .hashers import make_student_password
+from .models import School, Student
+from .serializers import StudentSerializer
+from .signals import students_enrolled
+from .usernames import allocate_usernames
+
+# rows inserted per statement
+ENROLMENT_BATCH_SIZE = 500
+# below this many passwords, starting a process pool costs more than hashing in the request
+PARALLEL_HASH_THRESHOLD = 32
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Hash student passwords with `STUDENT_PASSWORD_HASHER`, across a process pool for large batches.
+
+    Args:
+        passwords (list): The plain text passwords.
+        workers (int): The number of processes, defaults to the number of CPUs. 1 hashes in this process.
+
+    Returns:
+        list: The hashed passwords, in the same order.
+    """
+    if workers == 1 or (workers is None and len(passwords) < PARALLEL_HASH_THRESHOLD):
+        return [make_student_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(make_student_password, passwords, chunksize=16))
+
+
+def create_students(rows):
+    """
+    Create the users and students of validated rows in one transaction.
+
+    Args:
+        rows (list): The validated data of `StudentSerializer`, with the plain text password in `user`.
+
+    Returns:
+        tuple: The created students, and the indexes of the rows left out because their school
+            has no free usernames.
+    """
+    passwords = hash_passwords([row["user"]["password"] for row in rows])
+    schools = {}
+    for index, row in enumerate(rows):
+        schools.setdefault(row["school"].id, []).append(index)
+    with transaction.atomic():
+        usernames = {}
+        # schools are locked in one order, so two rosters of the same schools cannot deadlock
+        for school_id, indexes in sorted(schools.items()):
+            usernames.update(zip(indexes, allocate_usernames(school_id, len(indexes))))
+        created = sorted(usernames)
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=usernames[index],
+                    first_name=rows[index]["user"]["first_name"],
+                    last_name=rows[index]["user"]["last_name"],
+                    password=passwords[index],
+                )
+                for index in created
+            ],
+            batch_size=ENROLMENT_BATCH_SIZE,
+        )
+        students = Student.objects.bulk_create(
+            [
+                Student(
+                    user=user,
+                    plaintext_password=rows[index]["user"]["password"],
+                    **{
+                        field: value
+                        for field, value in rows[index].items()
+                        if field not in ("user", "plaintext_password")
+                    },
+                )
+                for user, index in zip(users, created)
+            ],
+            batch_size=ENROLMENT_BATCH_SIZE,
+        )
+    students_enrolled.send(sender=Student, students=students)
+    return students, [index for index in range(len(rows)) if index not in usernames]
+
+
+def get_roster_schools(rows, school=None):
+    """
+    Look up the schools of a roster at once, instead of once by each row.
+
+    Args:
+        rows (list): The student data, as posted to `StudentViewSet`.
+        school (School): The school of every student, e.g. of a teacher, instead of their `school_id`.
+
+    Returns:
+        dict: The schools by primary key, for the `schools` context of `StudentSerializer`.
+    """
+    if school:
+        return {school.id: school}
+    school_ids = {str(row.get("school_id")) for row in rows if isinstance(row, dict)}
+    return School.objects.in_bulk([int(school_id) for school_id in school_ids if school_id.isdigit()])
+
+
+def validate_students(rows, school=None):
+    """
+    Validate the rows of a roster one by one.
+
+    Args:
+        rows (list): The student data, as posted to `StudentViewSet`.
+        school (School): The school of every student, e.g. of a teacher, instead of their `school_id`.
+
+    Returns:
+        tuple: The validated data of the valid rows, their indexes, and a list of
+            `{"row": index, "errors": {...}}` for the invalid rows.
+    """
+    schools = get_roster_schools(rows, school)
+    valid, indexes, errors = [], [], []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({"row": index, "errors": {"non_field_errors": ["Expected an object."]}})
+            continue
+        if school:
+            row = {**row, "school_id": school.id}
+        serializer = StudentSerializer(data=row, context={"schools": schools})
+        if serializer.is_valid():
+            valid.append(serializer.validated_data)
+            indexes.append(index)
+        else:
+            errors.append({"row": index, "errors": serializer.errors})
+    return valid, indexes, errors
+
+
+def enrol_students(rows, school=None):
+    """
+    Validate and create the students of a roster, reporting the errors of each invalid row.
+
+    Args:
+        rows (list): The student data, as posted to `StudentViewSet`.
+        school (School): The school of every student, e.g. of a teacher, instead of their `school_id`.
+
+    Returns:
+        tuple: The created students, and a list of `{"row": index, "errors": {...}}`
+            for the rows which were not created.
+    """
+    valid, indexes, errors = validate_students(rows, school)
+    students, left_out = create_students(valid) if valid else ([], [])
+    errors.extend(
+        {"row": indexes[index], "errors": {"username": ["The school has no free usernames left."]}}
+        for index in left_out
+    )
+    errors.sort(key=lambda error: error["row"])
+    return students, errors
@@ -0,0 +1,69 @@
+"""
+Password hashers of the generated student accounts.
+
+Staff and teacher passwords keep the first of `PASSWORD_HASHERS`. The generated student
+passwords, which teachers can read back from `Student.plaintext_password` anyway, are hashed
+with the cheaper `STUDENT_PASSWORD_HASHER`, so a cohort logging in at the start of a
+competition does not saturate the workers. Its cost is read from the settings, and a student
+hash of another hasher or cost is rehashed by `StudentPasswordBackend` on login.
+"""
+
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, ScryptPasswordHasher, make_password
+
+
+class StudentScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    Scrypt with the work factor of `STUDENT_SCRYPT_WORK_FACTOR`, computed in one pass instead of
+    the five of `ScryptPasswordHasher`, which only multiply the time of a login.
+
+    The derived key is 32 bytes instead of 64, so the encoded hash fits in the 128 characters
+    of `User.password`.
+    """
+
+    algorithm = "student_scrypt"
+    parallelism = 1
+    # bytes of the derived key
+    digest_length = 32
+
+    @property
+    def work_factor(self):
+        return settings.STUDENT_SCRYPT_WORK_FACTOR
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=self.maxmem, dklen=self.digest_length
+        )
+        hash_ = base64.b64encode(hash_).decode("ascii").strip()
+        return "%s$%d$%s$%d$%d$%s" % (self.algorithm, n, salt, r, p, hash_)
+
+
+class StudentPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 with SHA256 and the iterations of `STUDENT_PBKDF2_ITERATIONS`."""
+
+    algorithm = "student_pbkdf2_sha256"
+
+    @property
+    def iterations(self):
+        return settings.STUDENT_PBKDF2_ITERATIONS
+
+
+def make_student_password(password):
+    """Hash the password of a student with `STUDENT_PASSWORD_HASHER`."""
+    return make_password(password, hasher=settings.STUDENT_PASSWORD_HASHER)
+
+
+def set_user_password(user, password):
+    """Set the password of a user, with the student hasher for students."""
+    if hasattr(user, "student"):
+        user.password = make_student_password(password)
+        user._password = password
+    else:
+        user.set_password(password)
@@ -0,0 +1,87 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from api.auth.views import CustomTokenObtainPairView
+from api.users.hashers import make_student_password
+from api.users.models import School, Student
+from api.users.usernames import allocate_usernames
+
+# student hashers compared by default, argon2 is added when argon2-cffi is installed
+DEFAULT_PROFILES = ["pbkdf2_sha256", "student_pbkdf2_sha256", "student_scrypt"]
+PASSWORD = "benchmark-password"
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the student logins per second of one worker through the token endpoint under "
+        "each password hasher profile. The benchmark student is created in a transaction which "
+        "is rolled back, so it can run against a staging database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            action="append",
+            help="A password hasher algorithm to measure, e.g. student_scrypt. Defaults to the usual ones.",
+        )
+        parser.add_argument("--logins", type=int, default=50, help="Number of logins per profile.")
+
+    def handle(self, *args, **options):
+        profiles = options["profile"] or DEFAULT_PROFILES + self.get_optional_profiles()
+        for profile in profiles:
+            try:
+                get_hasher(profile)
+            except ValueError:
+                raise CommandError(f"Unknown password hasher {profile}, see PASSWORD_HASHERS.")
+
+        self.stdout.write(f"Configured student hasher: {settings.STUDENT_PASSWORD_HASHER}")
+        for profile in profiles:
+            try:
+                with transaction.atomic(), override_settings(STUDENT_PASSWORD_HASHER=profile):
+                    elapsed = self.benchmark(options["logins"])
+                    raise Rollback
+            except Rollback:
+                pass
+            self.stdout.write(
+                f"{profile}: {options['logins'] / elapsed:.1f} logins/s, "
+                f"{elapsed * 1000 / options['logins']:.1f} ms per login"
+            )
+
+    def get_optional_profiles(self):
+        try:
+            import argon2  # noqa: F401
+        except ImportError:
+            return []
+        return ["argon2"]
+
+    def benchmark(self, logins):
+        school = School.objects.create(name=f"Benchmark school {time.time()}")
+        user = User.objects.create(
+            username=allocate_usernames(school.id, 1)[0],
+            first_name="Benchmark",
+            last_name="Student",
+            password=make_student_password(PASSWORD),
+        )
+        Student.objects.create(user=user, school=school, year_level="7")
+
+        view = CustomTokenObtainPairView.as_view()
+        factory = APIRequestFactory()
+        started = time.perf_counter()
+        for _ in range(logins):
+            response = view(
+                factory.post("/api/auth/token/", {"username": user.username, "password": PASSWORD}, format="json")
+            )
+            if response.status_code != 200:
+                raise CommandError(f"Login failed with {response.status_code}: {response.data}")
+        return time.perf_counter() - started
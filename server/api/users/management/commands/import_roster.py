@@ -0,0 +1,113 @@
+import csv
+from pathlib import Path
+from xml.etree import ElementTree
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.results.exports import stream_csv, stream_xlsx
+from api.users.models import RosterImportJob, School
+from api.users.roster import (
+    CREDENTIAL_COLUMNS,
+    ERROR_COLUMNS,
+    ROSTER_CHUNK_SIZE,
+    claim_roster_import,
+    count_roster_rows,
+    enqueue_roster_import,
+    get_job_rows,
+    run_roster_import,
+)
+
+
+def write_sheet(path, header, rows):
+    """Write rows to a CSV file, or an XLSX file when the path ends with `.xlsx`."""
+    if path.suffix.lower() == ".xlsx":
+        with path.open("wb") as file:
+            for part in stream_xlsx(header, rows):
+                file.write(part)
+    else:
+        with path.open("w", newline="", encoding="utf-8") as file:
+            for line in stream_csv(header, rows):
+                file.write(line)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the students of a CSV or XLSX roster with the columns first_name, last_name, "
+        "year_level, school_id and optionally password, e.g. a state-wide roster. Writes the "
+        "credentials of the created students and the errors of the other rows to two files. The roster "
+        "is imported as a job committing each chunk, a job failing part way is resumed with --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("roster", type=Path, nargs="?", help="The CSV or XLSX roster.")
+        parser.add_argument(
+            "--resume", type=int, help="Resume this failed import job instead of importing a roster."
+        )
+        parser.add_argument(
+            "--school", type=int, help="Enrol every student in this school instead of their school_id."
+        )
+        parser.add_argument(
+            "--credentials",
+            type=Path,
+            help="The credentials sheet to write, CSV or XLSX by extension. Defaults to <roster>-credentials.csv.",
+        )
+        parser.add_argument(
+            "--errors",
+            type=Path,
+            help="The error report to write, CSV or XLSX by extension. Defaults to <roster>-errors.csv.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=ROSTER_CHUNK_SIZE, help="Rows validated and created at a time."
+        )
+
+    def get_job(self, options):
+        """Queue the import of the roster, or queue the failed job to resume again."""
+        if options["resume"]:
+            job = RosterImportJob.objects.defer("content").filter(pk=options["resume"]).first()
+            if job is None:
+                raise CommandError(f"Roster import job {options['resume']} does not exist.")
+            if job.state == RosterImportJob.State.FAILED:
+                job.state = RosterImportJob.State.QUEUED
+                job.tries = 0
+                job.save(update_fields=["state", "tries"])
+            return job
+
+        roster_path = options["roster"]
+        if roster_path is None or not roster_path.is_file():
+            raise CommandError(f"{roster_path} does not exist.")
+        school = None
+        if options["school"]:
+            try:
+                school = School.objects.get(pk=options["school"])
+            except School.DoesNotExist:
+                raise CommandError(f"School {options['school']} does not exist.")
+        with roster_path.open("rb") as file:
+            try:
+                rows_total = count_roster_rows(file, roster_path.name)
+            except (ValueError, UnicodeDecodeError, csv.Error, ElementTree.ParseError) as error:
+                raise CommandError(f"{roster_path} is not a UTF-8 CSV or an XLSX file, no students were created: {error}")
+            return enqueue_roster_import(file, roster_path.name, school, None, rows_total)
+
+    def handle(self, *args, **options):
+        job = self.get_job(options)
+        roster_path = Path(options["roster"] or job.filename)
+        credentials_path = options["credentials"] or roster_path.with_name(f"{roster_path.stem}-credentials.csv")
+        errors_path = options["errors"] or roster_path.with_name(f"{roster_path.stem}-errors.csv")
+
+        # a failed chunk is tried again from the last committed one, like by the worker
+        while (claimed := claim_roster_import(job_id=job.id)) is not None:
+            job = run_roster_import(claimed, chunk_size=options["chunk_size"])
+        job.refresh_from_db(fields=["state", "error", "created", "failed"])
+        if job.state != RosterImportJob.State.DONE:
+            raise CommandError(
+                f"Roster import job {job.id} is {job.get_state_display().lower()} after {job.created} students "
+                f"were created: {job.error} Resume it with --resume {job.id}."
+            )
+        write_sheet(credentials_path, CREDENTIAL_COLUMNS, get_job_rows(job, "credentials"))
+        write_sheet(errors_path, ERROR_COLUMNS, get_job_rows(job, "errors"))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {job.created} students, {job.failed} rows failed. "
+                f"Credentials written to {credentials_path}, errors to {errors_path}."
+            )
+        )
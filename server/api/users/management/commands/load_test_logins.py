@@ -0,0 +1,104 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.quiz.management.commands.benchmark_competition_start import percentile
+from api.users.models import Student
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a burst of student logins against a running server, e.g. 5,000 students logging "
+        "in at the open of a competition, and report the responses by status and their latency. "
+        "The credentials are read from a credentials sheet of import_roster, or from the "
+        "students in the database, repeated when there are fewer than the logins."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default="http://localhost:8000", help="The server to log in to, without the /api path."
+        )
+        parser.add_argument("--logins", type=int, default=5000, help="Number of logins in the burst.")
+        parser.add_argument("--concurrency", type=int, default=200, help="Number of concurrent requests.")
+        parser.add_argument(
+            "--ramp", type=float, default=60, help="Seconds over which the logins start, 0 for all at once."
+        )
+        parser.add_argument(
+            "--credentials", help="A CSV credentials sheet with student_id and password columns."
+        )
+        parser.add_argument(
+            "--school", type=int, action="append", help="Only log in students of this school."
+        )
+        parser.add_argument("--timeout", type=float, default=60, help="Seconds before a login is abandoned.")
+
+    def get_credentials(self, options):
+        if options["credentials"]:
+            with open(options["credentials"], newline="", encoding="utf-8") as file:
+                return [(row["student_id"], row["password"]) for row in csv.DictReader(file)]
+        students = Student.objects.exclude(plaintext_password="")
+        if options["school"]:
+            students = students.filter(school_id__in=options["school"])
+        return list(students.values_list("user__username", "plaintext_password")[: options["logins"]])
+
+    def handle(self, *args, **options):
+        credentials = self.get_credentials(options)
+        if not credentials:
+            raise CommandError("No student credentials found.")
+        logins = list(islice(cycle(credentials), options["logins"]))
+        url = f"{options['url'].rstrip('/')}/api/auth/token/"
+        interval = options["ramp"] / len(logins)
+
+        def login(index):
+            username, password = logins[index]
+            # the logins start evenly over the ramp, as students arriving at the competition
+            delay = started + index * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            request = Request(
+                url,
+                data=json.dumps({"username": username, "password": password}).encode(),
+                headers={"Content-Type": "application/json"},
+            )
+            sent = time.perf_counter()
+            try:
+                with urlopen(request, timeout=options["timeout"]) as response:
+                    status_code = response.status
+            except HTTPError as error:
+                status_code = error.code
+            except (URLError, TimeoutError, ConnectionError):
+                status_code = None
+            return time.perf_counter() - sent, status_code
+
+        self.stdout.write(
+            f"Replaying {len(logins)} logins of {len(credentials)} students against {url} "
+            f"over {options['ramp']:.0f} s with {options['concurrency']} concurrent requests."
+        )
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(login, range(len(logins))))
+        wall_time = time.perf_counter() - started
+
+        statuses = {}
+        for _, status_code in results:
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+        latencies = sorted(latency for latency, status_code in results if status_code == 200)
+        self.stdout.write(
+            "responses: "
+            + "  ".join(
+                f"{status_code or 'failed'}: {count}"
+                for status_code, count in sorted(statuses.items(), key=lambda item: item[0] or 0)
+            )
+            + f"\nthroughput: {statuses.get(200, 0) / wall_time:.1f} logins/s over {wall_time:.1f} s"
+        )
+        if latencies:
+            self.stdout.write(
+                f"logged in p50: {percentile(latencies, 0.50) * 1000:.1f} ms  "
+                f"p99: {percentile(latencies, 0.99) * 1000:.1f} ms  "
+                f"max: {latencies[-1] * 1000:.1f} ms"
+            )
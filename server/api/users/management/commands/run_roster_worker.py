@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.users.models import RosterImportJob
+from api.users.roster import ROSTER_CHUNK_SIZE, claim_roster_import, run_roster_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued roster import jobs. Jobs are claimed from the database, "
+        "so several workers can run side by side without a message broker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no more jobs to run instead of polling.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=ROSTER_CHUNK_SIZE,
+            help="Number of roster rows committed together.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Roster worker started.")
+        while True:
+            # a connection broken by a failed run is replaced, like between two requests
+            close_old_connections()
+            job = claim_roster_import()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(f"Importing {job.filename} (job {job.id}), resuming after row {job.last_row}.")
+            job = run_roster_import(job, chunk_size=options["chunk_size"])
+            if job.state == RosterImportJob.State.FAILED:
+                self.stderr.write(f"Job {job.id} failed: {job.error}")
+            elif job.state == RosterImportJob.State.QUEUED:
+                self.stderr.write(f"Job {job.id} run {job.tries} failed, it is queued again: {job.error}")
+            else:
+                self.stdout.write(
+                    self.style.SUCCESS(f"Job {job.id} created {job.created} students, {job.failed} rows failed.")
+                )
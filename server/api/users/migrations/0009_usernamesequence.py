@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-17 13:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_school_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsernameSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('last_number', models.IntegerField(default=0)),
+                ('digits', models.IntegerField(default=5)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='username_sequences', to='users.school')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('year', 'school'), name='unique_username_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.15 on 2026-10-17 14:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_usernamesequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RosterImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(blank=True, default='', max_length=255)),
+                ('content', models.BinaryField(default=b'')),
+                ('state', models.IntegerField(choices=[(1, 'Queued'), (2, 'Running'), (3, 'Done'), (4, 'Failed')], default=1)),
+                ('rows_total', models.IntegerField(default=0)),
+                ('rows_processed', models.IntegerField(default=0)),
+                ('last_row', models.IntegerField(default=0)),
+                ('created', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('tries', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(
+                    null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='roster_import_jobs', to=settings.AUTH_USER_MODEL
+                )),
+                ('school', models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='roster_import_jobs', to='users.school'
+                )),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RosterImportChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_row', models.IntegerField()),
+                ('credentials', models.JSONField(default=list)),
+                ('errors', models.JSONField(default=list)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='users.rosterimportjob')),
+            ],
+            options={
+                'ordering': ['last_row'],
+            },
+        ),
+    ]
@@ -87,3 +87,111 @@ class Teacher(models.Model):
 
     def __str__(self):
         return f"{self.user.username}"
+
+
+class UsernameSequence(models.Model):
+    """
+    The last number given to a generated student username of a school in a year.
+
+    Fields:
+        year (IntegerField): The year of the usernames.
+        school (ForeignKey): The school of the usernames.
+        last_number (IntegerField): The number after the year and school id of the last username handed out.
+        digits (IntegerField): The number of digits of the numbers, which grows once they are used up.
+    """
+
+    year = models.IntegerField()
+    school = models.ForeignKey(
+        School, on_delete=models.CASCADE, related_name="username_sequences"
+    )
+    last_number = models.IntegerField(default=0)
+    digits = models.IntegerField(default=5)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["year", "school"], name="unique_username_sequence")
+        ]
+
+    def __str__(self):
+        return f"{self.year}{self.school_id}: {self.last_number}"
+
+
+class RosterImportJob(models.Model):
+    """
+    Represents the background import of a roster too large for one request, executed by the
+    `run_roster_worker` command.
+
+    Fields:
+        id: The primary key for the import job.
+        created_by (ForeignKey): The teacher or staff member who uploaded the roster.
+        school (ForeignKey): The school of every student, e.g. of a teacher, instead of their `school_id`.
+        filename (CharField): The name of the uploaded file.
+        content (BinaryField): The uploaded file, emptied once the job is done.
+        state (IntegerField): 1 is for queued, 2 is for running, 3 is for done and 4 is for failed.
+        rows_total (IntegerField): The number of student rows of the roster.
+        rows_processed (IntegerField): The number of rows imported in committed chunks.
+        last_row (IntegerField): The row number of the last row of the last committed chunk,
+            a resumed job continues after it.
+        created (IntegerField): The number of students created.
+        failed (IntegerField): The number of rows not created, invalid or duplicates.
+        error (TextField): The error message of the last failed run.
+        tries (IntegerField): The number of times a worker claimed the job.
+        created_at (DateTimeField): When the job was queued.
+        started_at (DateTimeField): When a worker first picked up the job.
+        finished_at (DateTimeField): When the job finished or failed.
+        heartbeat_at (DateTimeField): Last time the running worker committed a chunk.
+    """
+
+    class State(models.IntegerChoices):
+        QUEUED = 1
+        RUNNING = 2
+        DONE = 3
+        FAILED = 4
+
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, related_name="roster_import_jobs"
+    )
+    school = models.ForeignKey(
+        School, on_delete=models.CASCADE, null=True, blank=True, related_name="roster_import_jobs"
+    )
+    filename = models.CharField(max_length=255, default="", blank=True)
+    content = models.BinaryField(default=b"")
+    state = models.IntegerField(choices=State.choices, default=State.QUEUED)
+    rows_total = models.IntegerField(default=0)
+    rows_processed = models.IntegerField(default=0)
+    last_row = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    error = models.TextField(default="", blank=True)
+    tries = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.id} {self.filename} {self.get_state_display()}"
+
+
+class RosterImportChunk(models.Model):
+    """
+    The credentials and errors of a committed chunk of a roster import job, saved in the
+    transaction creating its students.
+
+    Fields:
+        job (ForeignKey): The import job.
+        last_row (IntegerField): The row number of the last row of the chunk.
+        credentials (JSONField): The credentials sheet rows of the created students.
+        errors (JSONField): The error report rows of the other rows.
+    """
+
+    job = models.ForeignKey(RosterImportJob, on_delete=models.CASCADE, related_name="chunks")
+    last_row = models.IntegerField()
+    credentials = models.JSONField(default=list)
+    errors = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ["last_row"]
+
+    def __str__(self):
+        return f"{self.job_id}: {self.last_row}"
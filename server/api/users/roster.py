@@ -0,0 +1,469 @@
+"""
+Imports of student rosters from CSV and XLSX files.
+
+The rows of a file are read one at a time and imported in chunks of `ROSTER_CHUNK_SIZE`. Each
+chunk is validated, checked for duplicates with one query, and created through the bulk
+enrolment. A state-wide file of 50,000 rows is never held in memory as a whole.
+
+A file is read through once before anything is imported, so an unreadable file creates no
+students. A roster of at most one chunk is imported in one transaction within the request, its
+credentials and errors spooled to temporary files which are read back once it is imported.
+A larger roster is queued as a `RosterImportJob` for the `run_roster_worker` command, which
+commits each chunk together with its credentials and errors in a `RosterImportChunk`, so the
+usernames of a school are not locked for the whole roster and a crashed or failed job resumes
+after its last committed chunk, until it was tried `ROSTER_JOB_MAX_TRIES` times.
+
+A row is a duplicate when a student of the same school, name and year level exists, in the
+school or earlier in the file, so importing a file again only reports its students as duplicates.
+XLSX files are read with `zipfile` and `iterparse`, like the exports of the results are written,
+and only their shared strings are kept in memory.
+"""
+
+import csv
+import io
+import json
+import tempfile
+import zipfile
+from datetime import timedelta
+from itertools import islice
+from xml.etree import ElementTree
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.crypto import get_random_string
+from django.utils.timezone import now
+
+from .enrolment import create_students, validate_students
+from .models import RosterImportChunk, RosterImportJob, Student
+
+# rows validated and created at a time
+ROSTER_CHUNK_SIZE = 1000
+# columns read from a roster, the others are ignored
+ROSTER_COLUMNS = ("first_name", "last_name", "year_level", "school_id", "attendent_year", "password")
+CREDENTIAL_COLUMNS = ["row", "student_id", "password", "first_name", "last_name", "year_level", "school"]
+ERROR_COLUMNS = ["row", "first_name", "last_name", "year_level", "school_id", "errors"]
+# generated passwords leave out characters which are easily mistaken for each other, e.g. O and 0
+PASSWORD_CHARACTERS = "abcdefghjkmnpqrstuvwxyzACDEFGHJKLMNPQRSTUVWXYZ23456789"
+PASSWORD_LENGTH = 8
+# bytes of credentials, and of errors, kept in memory before they are spooled to disk
+ROSTER_SPOOL_SIZE = 1024 * 1024
+# a running job without a committed chunk for this long is considered crashed
+ROSTER_JOB_STALE_AFTER = timedelta(minutes=5)
+# runs of a job, crashed or failed, before it is given up
+ROSTER_JOB_MAX_TRIES = 3
+
+SPREADSHEET_NAMESPACE = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIP_NAMESPACE = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_NAMESPACE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def get_column_name(header):
+    """Normalise a header cell, e.g. `First Name` to `first_name`."""
+    return "_".join(str(header or "").strip().lower().split())
+
+
+def read_csv_rows(file):
+    """
+    Yield the rows of a CSV file as lists of values, the header first.
+
+    Args:
+        file (file): The binary file, UTF-8 with or without a byte order mark.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text)
+    finally:
+        # the wrapper would close the file, which is read again after it is counted
+        text.detach()
+
+
+def get_cell_index(reference):
+    """Get the index of the column of a cell reference, e.g. 0 for `A2` and 27 for `AB2`."""
+    index = 0
+    for character in reference:
+        if not character.isalpha():
+            break
+        index = index * 26 + ord(character.upper()) - ord("A") + 1
+    return index - 1
+
+
+def get_text(element):
+    return "".join(text.text or "" for text in element.iter(f"{SPREADSHEET_NAMESPACE}t"))
+
+
+def read_xlsx_rows(file):
+    """
+    Yield the rows of the first worksheet of an XLSX file as lists of values, the header first.
+
+    Args:
+        file (file): The seekable binary file.
+
+    Raises:
+        ValueError: If the file is not an XLSX file.
+    """
+    try:
+        archive = zipfile.ZipFile(file)
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        sheet_id = workbook.find(f"{SPREADSHEET_NAMESPACE}sheets/{SPREADSHEET_NAMESPACE}sheet").get(
+            f"{RELATIONSHIP_NAMESPACE}id"
+        )
+        target = next(
+            relationship.get("Target")
+            for relationship in relationships.iter(f"{PACKAGE_NAMESPACE}Relationship")
+            if relationship.get("Id") == sheet_id
+        )
+    except (zipfile.BadZipFile, KeyError, AttributeError, StopIteration, ElementTree.ParseError):
+        raise ValueError("The file is not an XLSX file.")
+    sheet_path = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+
+    shared_strings = []
+    if "xl/sharedStrings.xml" in archive.namelist():
+        with archive.open("xl/sharedStrings.xml") as strings:
+            for _, element in ElementTree.iterparse(strings):
+                if element.tag == f"{SPREADSHEET_NAMESPACE}si":
+                    shared_strings.append(get_text(element))
+                    element.clear()
+
+    with archive.open(sheet_path) as sheet:
+        sheet_data = None
+        number = 0
+        for event, element in ElementTree.iterparse(sheet, events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{SPREADSHEET_NAMESPACE}sheetData":
+                    sheet_data = element
+                continue
+            if element.tag != f"{SPREADSHEET_NAMESPACE}row":
+                continue
+            # empty rows are left out of a worksheet, they are yielded so the rows keep their numbers
+            row_number = int(element.get("r", number + 1))
+            for _ in range(number + 1, row_number):
+                yield []
+            number = row_number
+            values = []
+            for cell in element.iter(f"{SPREADSHEET_NAMESPACE}c"):
+                index = get_cell_index(cell.get("r", "")) if cell.get("r") else len(values)
+                values.extend([""] * (index - len(values)))
+                value = cell.find(f"{SPREADSHEET_NAMESPACE}v")
+                if cell.get("t") == "inlineStr":
+                    values.append(get_text(cell))
+                elif value is None:
+                    values.append("")
+                elif cell.get("t") == "s":
+                    values.append(shared_strings[int(value.text)])
+                else:
+                    values.append(value.text or "")
+            yield values
+            # the rows read are dropped, so the tree stays one row deep
+            element.clear()
+            if sheet_data is not None:
+                sheet_data.remove(element)
+
+
+def read_roster(file, filename=""):
+    """
+    Yield the rows of a roster file with their row numbers in the file, the header being row 1.
+
+    Args:
+        file (file): The binary CSV or XLSX file.
+        filename (str): The name of the file, XLSX files are also recognised by their content.
+
+    Returns:
+        iterable: Tuples of the row number and a dict of the `ROSTER_COLUMNS` of the row.
+    """
+    is_xlsx = filename.lower().endswith(".xlsx") or file.read(4) == b"PK\x03\x04"
+    file.seek(0)
+    rows = read_xlsx_rows(file) if is_xlsx else read_csv_rows(file)
+    header = [get_column_name(column) for column in next(rows, [])]
+    for number, values in enumerate(rows, 2):
+        row = {
+            column: value.strip() if isinstance(value, str) else value
+            for column, value in zip(header, values)
+            if column in ROSTER_COLUMNS
+        }
+        # blank lines, e.g. at the end of a spreadsheet, are not students
+        if any(row.values()):
+            yield number, row
+
+
+def count_roster_rows(file, filename=""):
+    """
+    Read a whole roster without importing it, so that an unreadable file is rejected before any student is created.
+
+    Args:
+        file (file): The seekable binary CSV or XLSX file, rewound afterwards.
+        filename (str): The name of the file.
+
+    Returns:
+        int: The number of student rows.
+
+    Raises:
+        ValueError, UnicodeDecodeError, csv.Error, ElementTree.ParseError: If the file cannot be read.
+    """
+    count = sum(1 for _ in read_roster(file, filename))
+    file.seek(0)
+    return count
+
+
+def get_student_key(school_id, first_name, last_name, year_level):
+    return (school_id, first_name.strip().lower(), last_name.strip().lower(), str(year_level))
+
+
+def get_existing_keys(students):
+    """
+    Find which of validated students already exist, by school, name and year level, in one query.
+
+    Args:
+        students (list): The validated data of `StudentSerializer`.
+
+    Returns:
+        set: The keys of `get_student_key` of the existing students.
+    """
+    if not students:
+        return set()
+    existing = (
+        Student.objects.annotate(first=Lower("user__first_name"), last=Lower("user__last_name"))
+        .filter(
+            school_id__in={student["school"].id for student in students},
+            first__in={student["user"]["first_name"].strip().lower() for student in students},
+            last__in={student["user"]["last_name"].strip().lower() for student in students},
+        )
+        .values_list("school_id", "first", "last", "year_level")
+    )
+    return {get_student_key(*student) for student in existing}
+
+
+class RosterImport:
+    """
+    Import of a roster, keeping the credentials of the created students for `get_credentials`
+    and the errors of the other rows for `get_errors`.
+
+    Attributes:
+        school (School): The school of every student, e.g. of a teacher, instead of their `school_id`.
+        created (int): The number of students created.
+        failed (int): The number of rows not created, invalid or duplicates.
+    """
+
+    def __init__(self, school=None, chunk_size=ROSTER_CHUNK_SIZE):
+        self.school = school
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.failed = 0
+        self.credentials = tempfile.SpooledTemporaryFile(max_size=ROSTER_SPOOL_SIZE, mode="w+")
+        self.errors = tempfile.SpooledTemporaryFile(max_size=ROSTER_SPOOL_SIZE, mode="w+")
+
+    def format_errors(self, errors):
+        """Get the error report rows of a chunk, in row order, from tuples of the row number, row and errors by field."""
+        return [
+            {
+                **{column: row.get(column) for column in ERROR_COLUMNS},
+                "row": number,
+                "errors": "; ".join(
+                    f"{field}: {' '.join(str(message) for message in field_messages)}"
+                    for field, field_messages in messages.items()
+                ),
+            }
+            for number, row, messages in sorted(errors, key=lambda error: error[0])
+        ]
+
+    def get_credentials(self):
+        """Yield the credentials sheet rows of the created students, by `CREDENTIAL_COLUMNS`, once imported."""
+        self.credentials.seek(0)
+        for line in self.credentials:
+            yield json.loads(line)
+
+    def get_errors(self):
+        """Yield the error report rows, by `ERROR_COLUMNS`, once imported."""
+        self.errors.seek(0)
+        for line in self.errors:
+            yield json.loads(line)
+
+    def import_rows(self, rows):
+        """
+        Import the rows of a roster in one transaction, spooling their credentials and errors.
+
+        Args:
+            rows (iterable): The row numbers and rows, as yielded by `read_roster`.
+
+        Raises:
+            Exception: Any error reading the rows, after which none of them are created.
+        """
+        rows = iter(rows)
+        with transaction.atomic():
+            while chunk := list(islice(rows, self.chunk_size)):
+                credentials, errors = self.import_chunk(chunk)
+                for row in credentials:
+                    self.credentials.write(json.dumps(row) + "\n")
+                for row in errors:
+                    self.errors.write(json.dumps(row) + "\n")
+
+    def import_chunk(self, chunk):
+        """
+        Validate and create a chunk of rows.
+
+        Returns:
+            tuple: The credentials sheet rows of the created students and the error report rows of the others.
+        """
+        numbers = [number for number, _ in chunk]
+        rows = [
+            {**row, "password": row.get("password") or get_random_string(PASSWORD_LENGTH, PASSWORD_CHARACTERS)}
+            for _, row in chunk
+        ]
+        valid, indexes, invalid = validate_students(rows, self.school)
+        errors = [(numbers[error["row"]], rows[error["row"]], error["errors"]) for error in invalid]
+
+        # students created by earlier chunks are found in the database like the existing ones
+        seen = get_existing_keys(valid)
+        new, new_indexes = [], []
+        for student, index in zip(valid, indexes):
+            key = get_student_key(
+                student["school"].id, student["user"]["first_name"], student["user"]["last_name"], student["year_level"]
+            )
+            if key in seen:
+                errors.append((numbers[index], rows[index], {"non_field_errors": ["The student already exists."]}))
+                continue
+            seen.add(key)
+            new.append(student)
+            new_indexes.append(index)
+
+        students, left_out = create_students(new) if new else ([], [])
+        errors.extend(
+            (numbers[new_indexes[index]], rows[new_indexes[index]], {"username": ["The school has no free usernames left."]})
+            for index in left_out
+        )
+        self.failed += len(errors)
+        left_out = set(left_out)
+        created = [index for position, index in enumerate(new_indexes) if position not in left_out]
+        self.created += len(students)
+        credentials = [
+            {
+                "row": numbers[index],
+                "student_id": student.user.username,
+                "password": student.plaintext_password,
+                "first_name": student.user.first_name,
+                "last_name": student.user.last_name,
+                "year_level": student.year_level,
+                "school": student.school.name,
+            }
+            for student, index in zip(students, created)
+        ]
+        return credentials, self.format_errors(errors)
+
+
+def enqueue_roster_import(file, filename, school, user, rows_total):
+    """
+    Queue the import of a roster read through by `count_roster_rows`.
+
+    Args:
+        file (file): The seekable binary CSV or XLSX file.
+        filename (str): The name of the file.
+        school (School): The school of every student, or None to use their `school_id`.
+        user (User): The teacher or staff member importing the roster.
+        rows_total (int): The number of student rows.
+
+    Returns:
+        RosterImportJob: The queued job.
+    """
+    file.seek(0)
+    return RosterImportJob.objects.create(
+        created_by=user, school=school, filename=filename, content=file.read(), rows_total=rows_total
+    )
+
+
+def claim_roster_import(stale_after=ROSTER_JOB_STALE_AFTER, job_id=None):
+    """
+    Claim the oldest queued job, or a running job whose worker stopped sending heartbeats.
+
+    The row is locked with SKIP LOCKED so that several workers never claim the same job.
+
+    Args:
+        stale_after (timedelta): How long a running job may go without a heartbeat.
+        job_id (int): Claim only this job, e.g. for the `import_roster` command.
+
+    Returns:
+        RosterImportJob or None: The claimed job, now in the running state, without its file loaded.
+    """
+    current_time = now()
+    with transaction.atomic():
+        job = (
+            RosterImportJob.objects.select_for_update(skip_locked=True)
+            .defer("content")
+            .filter(
+                Q(state=RosterImportJob.State.QUEUED)
+                | Q(state=RosterImportJob.State.RUNNING, heartbeat_at__lt=current_time - stale_after)
+            )
+            .order_by("id")
+        )
+        if job_id is not None:
+            job = job.filter(pk=job_id)
+        job = job.first()
+        if job is None:
+            return None
+        job.state = RosterImportJob.State.RUNNING
+        job.started_at = job.started_at or current_time
+        job.heartbeat_at = current_time
+        job.tries += 1
+        job.save(update_fields=["state", "started_at", "heartbeat_at", "tries"])
+    return job
+
+
+def run_roster_import(job, chunk_size=ROSTER_CHUNK_SIZE):
+    """
+    Import the rows of a claimed job, resuming after `job.last_row`.
+
+    The credentials, errors and progress of each chunk are saved in the transaction creating its
+    students. When a chunk fails, the job is queued again to resume after the last committed one,
+    unless it has run out of tries.
+
+    Args:
+        job (RosterImportJob): A job in the running state.
+        chunk_size (int): The number of rows committed together.
+
+    Returns:
+        RosterImportJob: The finished, queued again or failed job.
+    """
+    roster = RosterImport(job.school, chunk_size=chunk_size)
+    try:
+        content = RosterImportJob.objects.values_list("content", flat=True).get(pk=job.pk)
+        rows = (row for row in read_roster(io.BytesIO(bytes(content)), job.filename) if row[0] > job.last_row)
+        while chunk := list(islice(rows, chunk_size)):
+            with transaction.atomic():
+                credentials, errors = roster.import_chunk(chunk)
+                RosterImportChunk.objects.create(
+                    job=job, last_row=chunk[-1][0], credentials=credentials, errors=errors
+                )
+                job.last_row = chunk[-1][0]
+                job.rows_processed += len(chunk)
+                job.created += len(credentials)
+                job.failed += len(errors)
+                job.heartbeat_at = now()
+                job.save(update_fields=["last_row", "rows_processed", "created", "failed", "heartbeat_at"])
+        job.state = RosterImportJob.State.DONE
+        # the credentials are kept in the chunks, the file is no longer needed
+        job.content = b""
+    except Exception as error:
+        retry = job.tries < ROSTER_JOB_MAX_TRIES
+        job.state = RosterImportJob.State.QUEUED if retry else RosterImportJob.State.FAILED
+        job.error = str(error)
+        if retry:
+            job.save(update_fields=["state", "error"])
+            return job
+    job.finished_at = now()
+    update_fields = ["state", "error", "finished_at"]
+    if job.state == RosterImportJob.State.DONE:
+        update_fields.append("content")
+    job.save(update_fields=update_fields)
+    return job
+
+
+def get_job_rows(job, sheet):
+    """
+    Yield the rows of a sheet of the committed chunks of a job, in row order.
+
+    Args:
+        job (RosterImportJob): The import job.
+        sheet (str): `credentials` or `errors`.
+    """
+    for rows in job.chunks.order_by("last_row").values_list(sheet, flat=True).iterator(chunk_size=10):
+        yield from rows
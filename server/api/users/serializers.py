@@ -1,8 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Student, Teacher, School
-import random
-from django.utils.timezone import now
+from .models import RosterImportJob, Student, Teacher, School
+from .hashers import make_student_password, set_user_password
+from .usernames import allocate_usernames
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -43,7 +43,7 @@ class UserSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         if "password" in validated_data:
             password = validated_data.pop("password")
-            instance.set_password(password)
+            set_user_password(instance, password)
             instance.save()
             validated_data["password"] = instance.password
         return super().update(instance, validated_data)
@@ -102,6 +102,22 @@ class SchoolSerializer(serializers.ModelSerializer):
         exclude = ["code"]
 
 
+class SchoolField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key of a school, looked up in the `schools` of the context when it is given,
+    e.g. by the bulk enrolment which loads the schools of a roster at once.
+    """
+
+    def to_internal_value(self, data):
+        schools = self.context.get("schools")
+        if schools is None:
+            return super().to_internal_value(data)
+        try:
+            return schools[int(data)]
+        except (KeyError, TypeError, ValueError):
+            self.fail("does_not_exist", pk_value=data)
+
+
 class StudentSerializer(serializers.ModelSerializer):
     """
     StudentSerializer is a ModelSerializer for the Student model.
@@ -133,7 +149,7 @@ class StudentSerializer(serializers.ModelSerializer):
     )
     year_level = serializers.IntegerField(
         required=True, min_value=0, max_value=12)
-    school_id = serializers.PrimaryKeyRelatedField(
+    school_id = SchoolField(
         queryset=School.objects.all(), write_only=True, source="school"
     )
     school = SchoolSerializer(read_only=True)
@@ -155,21 +171,15 @@ class StudentSerializer(serializers.ModelSerializer):
         """
         # Extract and create the nested User instance
         user = validated_data.pop("user")
-        random_str = self.random_digits(4)
-
-        random_str = str(now().year) + \
-            str(validated_data["school"].id) + random_str
-        user["username"] = random_str
+        usernames = allocate_usernames(validated_data["school"].id, 1)
+        if not usernames:
+            raise serializers.ValidationError({"username": ["The school has no free usernames left."]})
+        user["username"] = usernames[0]
         user_serializer = UserSerializer(data=user)
-        # if the username clashes with another student, generate a new one
-        while User.objects.filter(username=random_str).exists():
-            random_str = self.random_digits(4)
-            random_str = str(now().year) + \
-                str(validated_data["school"].id) + random_str
-            user["username"] = random_str
-            user_serializer = UserSerializer(data=user)
         user_serializer.is_valid(raise_exception=True)
-        user = user_serializer.save()
+        user = User(**user_serializer.validated_data)
+        user.password = make_student_password(user.password)
+        user.save()
         validated_data["user"] = user
 
         return super().create(validated_data)
@@ -198,13 +208,6 @@ class StudentSerializer(serializers.ModelSerializer):
         instance = super().update(instance, validated_data)
         return instance
 
-    def random_digits(self, n):
-        digits = [i for i in range(0, 10)]
-        random_str = ""
-        for i in range(n):
-            random_str += str(random.choice(digits))
-        return random_str
-
     class Meta:
         model = Student
         exclude = ["user"]
@@ -330,3 +333,23 @@ class TeacherSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         representation["role"] = "teacher"
         return representation
+
+
+class RosterImportJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the progress of a background roster import job.
+    """
+
+    state = serializers.CharField(source="get_state_display", read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    def get_progress(self, obj):
+        if obj.state == RosterImportJob.State.DONE:
+            return 100.0
+        if not obj.rows_total:
+            return 0.0
+        return round(100 * obj.rows_processed / obj.rows_total, 1)
+
+    class Meta:
+        model = RosterImportJob
+        exclude = ["content"]
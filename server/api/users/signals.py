@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after students were created in bulk, with the keyword argument `students`.
+# Bulk inserts do not send post_save.
+students_enrolled = Signal()
@@ -1,10 +1,32 @@
+import io
+import json
+import zipfile
+from xml.etree import ElementTree
+
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import User
-from django.test import TestCase
-from .models import School, Student, Teacher
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from api.results.exports import stream_xlsx
+from .enrolment import hash_passwords
+from .hashers import make_student_password
+from .models import RosterImportJob, School, Student, Teacher, UsernameSequence
+from .roster import (
+    ROSTER_CHUNK_SIZE,
+    ROSTER_JOB_MAX_TRIES,
+    RosterImport,
+    claim_roster_import,
+    enqueue_roster_import,
+    run_roster_import,
+)
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from .serializers import UserSerializer, SchoolSerializer, StudentSerializer
+from .usernames import allocate_usernames
 
 
 class SchoolModelTest(TestCase):
@@ -126,6 +148,251 @@ class StudentAPITestCase(APITestCase):
         self.assertIn("password", response_content)
         self.assertIn("password2", response_content)
 
+    def test_enrol_students_reports_invalid_rows(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        roster = [
+            self.student_data[0],
+            {**self.student_data[0], "year_level": 13},
+            {**self.student_data[0], "first_name": "Fgh", "password": "password3"},
+        ]
+        response = self.client.post("/api/users/students/enrol/", roster, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [1])
+        self.assertIn("year_level", response.data["errors"][0]["errors"])
+        self.assertEqual(
+            [(student["first_name"], student["password"]) for student in response.data["students"]],
+            [("Abc", "password2"), ("Fgh", "password3")],
+        )
+        user = User.objects.get(username=response.data["students"][1]["student_id"])
+        self.assertTrue(user.check_password("password3"))
+        self.assertEqual(user.student.school, self.school)
+
+    def test_allocate_usernames_skips_taken(self):
+        prefix = f"2025{self.school.id}"
+        User.objects.create(username=f"{prefix}00002")
+        self.assertEqual(
+            allocate_usernames(self.school.id, 3, year=2025),
+            [f"{prefix}00001", f"{prefix}00003", f"{prefix}00004"],
+        )
+        # a block of any size takes the same queries
+        with CaptureQueriesContext(connection) as queries:
+            allocate_usernames(self.school.id, 1, year=2025)
+        with self.assertNumQueries(len(queries)):
+            usernames = allocate_usernames(self.school.id, 500, year=2025)
+        self.assertEqual((usernames[0], len(set(usernames))), (f"{prefix}00006", 500))
+
+    def test_allocate_usernames_widens_used_up_numbers(self):
+        prefix = f"2025{self.school.id}"
+        UsernameSequence.objects.create(year=2025, school=self.school, last_number=9998, digits=4)
+        User.objects.create(username=f"{prefix}10000")
+        self.assertEqual(
+            allocate_usernames(self.school.id, 3, year=2025),
+            [f"{prefix}9999", f"{prefix}10001", f"{prefix}10002"],
+        )
+        self.assertEqual(UsernameSequence.objects.get(school=self.school).digits, 5)
+
+    def test_import_roster_csv(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        self.client.post("/api/users/students/", self.student_data, format="json")
+        roster = SimpleUploadedFile(
+            "roster.csv",
+            (
+                "First Name,Last Name,Year Level,School ID,Password\n"
+                f"abc,de,12,{self.school.id},password2\n"
+                f"Fgh,Ij,11,{self.school.id},\n"
+                ",,,,\n"
+                f"Klm,No,13,{self.school.id},password4\n"
+                f"FGH,IJ,11,{self.school.id},password5\n"
+            ).encode(),
+        )
+        response = self.client.post("/api/users/students/import/", {"file": roster}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(
+            [(row["row"], row["first_name"], row["year_level"]) for row in report["credentials"]], [(3, "Fgh", 11)]
+        )
+        user = User.objects.get(username=report["credentials"][0]["student_id"])
+        self.assertTrue(user.check_password(report["credentials"][0]["password"]))
+        self.assertEqual(
+            [(row["row"], row["errors"].split(":")[0]) for row in report["errors"]],
+            [(2, "non_field_errors"), (5, "year_level"), (6, "non_field_errors")],
+        )
+
+    def test_import_roster_xlsx(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        header = ["first_name", "last_name", "year_level", "school_id", "password"]
+        rows = [
+            {"first_name": "Abc", "last_name": "De", "year_level": 12, "school_id": self.school.id, "password": "p1"},
+            {"first_name": "Fgh", "last_name": "Ij", "year_level": 0, "school_id": 0, "password": "p2"},
+        ]
+        roster = SimpleUploadedFile("roster.xlsx", b"".join(stream_xlsx(header, rows)))
+        response = self.client.post(
+            "/api/users/students/import/?format=xlsx", {"file": roster}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as workbook:
+            credentials, errors = (
+                [
+                    ["".join(cell.itertext()) for cell in row]
+                    for row in ElementTree.fromstring(workbook.read(f"xl/worksheets/sheet{number}.xml")).iter(
+                        "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}row"
+                    )
+                ]
+                for number in (1, 2)
+            )
+        self.assertEqual(len(credentials), 2)
+        self.assertEqual(credentials[1][:3], ["2", credentials[1][1], "p1"])
+        self.assertEqual(errors[1][:2], ["3", "Fgh"])
+
+    def test_import_roster_failing_part_way_creates_no_students(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        header = ["first_name", "last_name", "year_level", "school_id", "password"]
+        rows = [
+            {"first_name": "Abc", "last_name": "De", "year_level": 12, "school_id": self.school.id, "password": "p1"},
+            {"first_name": "Fgh", "last_name": "Ij", "year_level": 11, "school_id": self.school.id, "password": "p2"},
+        ]
+        # the worksheet is cut off in its second row
+        archive = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(b"".join(stream_xlsx(header, rows)))) as workbook:
+            with zipfile.ZipFile(archive, "w") as broken:
+                for name in workbook.namelist():
+                    content = workbook.read(name)
+                    if name == "xl/worksheets/sheet1.xml":
+                        content = content[:content.index(b"Fgh")]
+                    broken.writestr(name, content)
+        roster = SimpleUploadedFile("roster.xlsx", archive.getvalue())
+        response = self.client.post("/api/users/students/import/", {"file": roster}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(User.objects.filter(first_name="Abc").exists())
+
+        def read_rows():
+            yield 2, {key: str(value) for key, value in rows[0].items()}
+            raise ValueError("The file is not an XLSX file.")
+
+        # the first chunk is created before the second one fails
+        roster = RosterImport(self.school, chunk_size=1)
+        with self.assertRaises(ValueError):
+            roster.import_rows(read_rows())
+        self.assertEqual(roster.created, 1)
+        self.assertFalse(User.objects.filter(first_name="Abc").exists())
+
+    def test_import_large_roster_queues_a_job(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        lines = [f"Student{number},Test,7,{self.school.id}" for number in range(ROSTER_CHUNK_SIZE + 1)]
+        roster = SimpleUploadedFile("roster.csv", "\n".join(["first_name,last_name,year_level,school_id", *lines]).encode())
+        response = self.client.post("/api/users/students/import/", {"file": roster}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["job"]["rows_total"], ROSTER_CHUNK_SIZE + 1)
+        self.assertNotIn("content", response.data["job"])
+        self.assertFalse(Student.objects.exists())
+        response = self.client.get(f"/api/users/students/import-jobs/{response.data['job']['id']}/")
+        self.assertEqual((response.data["state"], response.data["progress"]), ("Queued", 0.0))
+
+    def test_roster_import_job_commits_each_chunk_and_resumes(self):
+        roster = io.BytesIO(
+            (
+                "first_name,last_name,year_level,school_id\n"
+                f"Abc,De,12,{self.school.id}\n"
+                f"Fgh,Ij,11,{self.school.id}\n"
+                f"Klm,No,13,{self.school.id}\n"
+            ).encode()
+        )
+        job = enqueue_roster_import(roster, "roster.csv", None, self.user, 3)
+        # a worker crashed after committing the chunk of row 2
+        job.last_row = 2
+        job.save(update_fields=["last_row"])
+        job = run_roster_import(claim_roster_import(), chunk_size=1)
+        self.assertEqual(job.state, RosterImportJob.State.DONE)
+        self.assertEqual((job.created, job.failed, job.rows_processed), (1, 1, 2))
+        self.assertEqual(list(job.chunks.values_list("last_row", flat=True)), [3, 4])
+        self.assertFalse(User.objects.filter(first_name="Abc").exists())
+        self.assertEqual(bytes(RosterImportJob.objects.get(pk=job.pk).content), b"")
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+        response = self.client.get(f"/api/users/students/import-jobs/{job.id}/sheets/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([row["row"] for row in report["credentials"]], [3])
+        self.assertEqual([row["row"] for row in report["errors"]], [4])
+
+        # an unreadable file is tried again until it runs out of tries
+        job = enqueue_roster_import(io.BytesIO(b"PK\x03\x04"), "roster.xlsx", None, self.user, 1)
+        for _ in range(ROSTER_JOB_MAX_TRIES):
+            job = run_roster_import(claim_roster_import(), chunk_size=1)
+        self.assertEqual((job.state, job.tries), (RosterImportJob.State.FAILED, ROSTER_JOB_MAX_TRIES))
+        self.assertIsNone(claim_roster_import())
+
+    def test_hash_passwords_in_processes(self):
+        hashed = hash_passwords(["password2", "password3"], workers=2)
+        self.assertTrue(check_password("password2", hashed[0]))
+        self.assertTrue(check_password("password3", hashed[1]))
+
+
+class StudentPasswordHasherTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.school = School.objects.create(name="Test School")
+        self.user = User.objects.create_user(username="20251234", password="password2")
+        Student.objects.create(user=self.user, school=self.school, year_level="7")
+
+    def login(self, username, password):
+        return self.client.post("/api/auth/token/", {"username": username, "password": password}, format="json")
+
+    def test_student_password_upgraded_on_login(self):
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+        self.assertEqual(self.login("20251234", "wrong").status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login("20251234", "password2").status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("student_scrypt$8192$"))
+
+        with self.settings(STUDENT_PASSWORD_HASHER="student_pbkdf2_sha256", STUDENT_PBKDF2_ITERATIONS=1000):
+            self.assertEqual(self.login("20251234", "password2").status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("student_pbkdf2_sha256$1000$"))
+
+    def test_student_password_fits_password_field(self):
+        max_length = User._meta.get_field("password").max_length
+        for algorithm in ("student_scrypt", "student_pbkdf2_sha256"):
+            with self.settings(STUDENT_PASSWORD_HASHER=algorithm):
+                self.assertLessEqual(len(make_student_password("password2")), max_length)
+
+    def test_student_login_in_one_query(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_student_password("password2"))
+        with self.assertNumQueries(1):
+            response = self.login("20251234", "password2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        claims = AccessToken(response.data["access"])
+        self.assertEqual((claims["role"], claims["school_id"]), ("student", self.school.id))
+
+    @override_settings(LOGIN_THROTTLE_RATES={"ip": (6, 0.01), "school": (2, 0.01), "user": (2, 0.01)})
+    def test_login_token_buckets(self):
+        user = User.objects.create_user(username="20251235", password="password3")
+        Student.objects.create(user=user, school=self.school, year_level="7")
+        # wrong passwords give the token of the school back and take one of the student
+        self.assertEqual(self.login("20251234", "wrong").status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login("20251234", "wrong").status_code, status.HTTP_401_UNAUTHORIZED)
+        # the bucket of failed logins of the student is empty, before the password is hashed
+        with self.assertNumQueries(1):
+            response = self.login("20251234", "password2")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.login("20251235", "password3").status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login("20251235", "password3").status_code, status.HTTP_200_OK)
+        # the bucket of the school is empty, before the password is hashed
+        with self.assertNumQueries(1):
+            response = self.login("20251235", "password3")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+        # the bucket of the client IP is empty, before the user is looked up
+        with self.assertNumQueries(0):
+            response = self.login("admin", "Password123")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_staff_password_keeps_default_hasher(self):
+        User.objects.create_superuser(username="admin", password="Password123")
+        self.assertEqual(self.login("admin", "Password123").status_code, status.HTTP_200_OK)
+        self.assertTrue(User.objects.get(username="admin").password.startswith("pbkdf2_sha256$"))
+
 
 class TeacherAPITestCase(APITestCase):
 
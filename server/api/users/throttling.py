@@ -0,0 +1,72 @@
+"""
+Token buckets of the logins.
+
+At the start of a competition a whole cohort logs in within minutes, and every login costs a
+password hash. The logins of a client IP, checked before the view, and the logins of the
+students of a school, checked before their password is hashed, take a token from a bucket
+which refills at a steady rate. A login finding its bucket empty gets a 429 with `Retry-After`
+at once, instead of queueing on the workers or hashing the password until the requests time out.
+
+A wrong password gives the token of the school back, so guessing cannot lock the students of a
+school out, and is counted in the bucket of failed logins of the student instead, which turns
+away a guessed username before its password is hashed.
+
+The buckets live in the default cache. They are read and written without a lock, so a burst
+across processes can take a few tokens more than the bucket holds, and they are only shared
+between the workers with a shared `CACHE_BACKEND`.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+def take_login_token(scope, ident):
+    """
+    Take a token from the login bucket of a client IP or a school.
+
+    Args:
+        scope (str): The key of the bucket size and rate in `LOGIN_THROTTLE_RATES`, `ip`, `school` or `user`.
+        ident (str): The client IP, school id or username.
+
+    Returns:
+        float: The seconds until a token is available when the bucket is empty, else None.
+    """
+    capacity, rate = settings.LOGIN_THROTTLE_RATES[scope]
+    key = f"login-throttle:{scope}:{ident}"
+    # wall clock time, the buckets are shared between processes
+    now = time.time()
+    tokens, updated_at = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens < 1:
+        cache.set(key, (tokens, now), timeout=capacity / rate + 1)
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), timeout=capacity / rate + 1)
+    return None
+
+
+def return_login_token(scope, ident):
+    """
+    Give back a token taken by a login that turned out not to count against the bucket.
+
+    Args:
+        scope (str): The key of the bucket in `LOGIN_THROTTLE_RATES`.
+        ident (str): The client IP, school id or username.
+    """
+    capacity, rate = settings.LOGIN_THROTTLE_RATES[scope]
+    key = f"login-throttle:{scope}:{ident}"
+    tokens, updated_at = cache.get(key, (capacity, time.time()))
+    cache.set(key, (min(capacity, tokens + 1), updated_at), timeout=capacity / rate + 1)
+
+
+class LoginRateThrottle(BaseThrottle):
+    """Throttle of the logins of a client IP, by the token bucket of `take_login_token`."""
+
+    def allow_request(self, request, view):
+        self.wait_time = take_login_token("ip", self.get_ident(request))
+        return self.wait_time is None
+
+    def wait(self):
+        return self.wait_time
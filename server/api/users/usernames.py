@@ -0,0 +1,79 @@
+"""
+Generated usernames of students.
+
+A student username is the year, the school id and a number of `UsernameSequence.digits`
+digits, e.g. `20251200042`. New sequences start with `USERNAME_DIGITS` digits, and a sequence
+whose numbers are used up continues with one more digit, so a school is not limited to a number
+of students in a year. The numbers of a school in a year are handed out in blocks from its
+`UsernameSequence` row, which is locked while a block is taken, so concurrent rosters of a
+school get disjoint numbers without checking each username or retrying. Numbers already
+taken, e.g. by the random usernames generated before the sequences, are skipped with one
+query for the usernames above the sequence.
+"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.functions import Length
+from django.utils.timezone import now
+
+from .models import UsernameSequence
+
+# number of digits after the year and school id of a new sequence, 99,999 students of a school in a year
+USERNAME_DIGITS = 5
+
+
+def get_username_prefix(school_id, year=None):
+    return f"{year or now().year}{school_id}"
+
+
+def get_taken_usernames(prefix, digits, after):
+    """
+    Get the usernames with a prefix and number of digits above a number, usernames of one length and prefix sort as their numbers.
+    """
+    return set(
+        User.objects.annotate(length=Length("username"))
+        .filter(
+            username__gt=f"{prefix}{after:0{digits}d}",
+            username__startswith=prefix,
+            length=len(prefix) + digits,
+        )
+        .values_list("username", flat=True)
+    )
+
+
+def allocate_usernames(school_id, count, year=None):
+    """
+    Hand out unused usernames for students of a school, in a fixed number of queries
+    unless the numbers of the sequence get one more digit.
+
+    Args:
+        school_id (int): The primary key of the school.
+        count (int): The number of usernames.
+        year (int): The year of the usernames, defaults to the current year.
+
+    Returns:
+        list: The usernames in order.
+    """
+    year = year or now().year
+    prefix = get_username_prefix(school_id, year)
+    with transaction.atomic():
+        # the lock makes a concurrent allocation for the school wait until this block is taken
+        sequence, _ = UsernameSequence.objects.select_for_update().get_or_create(
+            year=year, school_id=school_id, defaults={"digits": USERNAME_DIGITS}
+        )
+        number, digits = sequence.last_number, sequence.digits
+        taken = get_taken_usernames(prefix, digits, number)
+        usernames = []
+        while len(usernames) < count:
+            if number == 10 ** digits - 1:
+                # the numbers of this length are used up, the next ones are one digit longer
+                digits += 1
+                taken = get_taken_usernames(prefix, digits, number)
+            number += 1
+            username = f"{prefix}{number:0{digits}d}"
+            if username not in taken:
+                usernames.append(username)
+        if number != sequence.last_number:
+            sequence.last_number, sequence.digits = number, digits
+            sequence.save(update_fields=["last_number", "digits"])
+    return usernames
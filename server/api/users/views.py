@@ -1,12 +1,42 @@
-from django.db import IntegrityError
-from rest_framework.decorators import permission_classes
+import csv
+from itertools import chain
+from xml.etree import ElementTree
+
+from django.db import IntegrityError, transaction
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.utils.timezone import now
+from rest_framework.decorators import action, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework import status, viewsets, filters
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from api.permissions import IsTeacher, IsAdmin
+from api.results.exports import (
+    EXPORT_RENDERERS,
+    XLSX_CONTENT_TYPE,
+    ZIP_CONTENT_TYPE,
+    stream_csv,
+    stream_json,
+    stream_xlsx_sheets,
+    stream_zip,
+)
 from django.contrib.auth.models import User
-from .models import Student, Teacher, School
+from .enrolment import create_students, enrol_students, get_roster_schools
+from .models import RosterImportJob, Student, Teacher, School
+from .roster import (
+    CREDENTIAL_COLUMNS,
+    ERROR_COLUMNS,
+    ROSTER_CHUNK_SIZE,
+    RosterImport,
+    count_roster_rows,
+    enqueue_roster_import,
+    get_job_rows,
+    read_roster,
+)
 from .serializers import (
+    RosterImportJobSerializer,
     StudentSerializer,
     SchoolSerializer,
     TeacherSerializer,
@@ -16,6 +46,41 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.views import APIView
 
 
+def roster_sheets_response(request, filename, credentials, errors):
+    """
+    Stream the credentials sheet and the error report of a roster import, as one JSON object, an
+    XLSX file with two sheets, or a zip of two CSV files, by `?format=`.
+
+    Args:
+        request (Request): The request, negotiated by `EXPORT_RENDERERS`.
+        filename (str): The name of the downloaded file, without extension.
+        credentials (iterable): The credentials sheet rows.
+        errors (iterable): The error report rows.
+
+    Returns:
+        StreamingHttpResponse: The streamed file.
+    """
+    extension = request.accepted_renderer.format
+    if extension == "csv":
+        content = stream_zip([
+            ("credentials.csv", stream_csv(CREDENTIAL_COLUMNS, credentials)),
+            ("errors.csv", stream_csv(ERROR_COLUMNS, errors)),
+        ])
+        response = StreamingHttpResponse(content, content_type=ZIP_CONTENT_TYPE)
+        extension = "zip"
+    elif extension == "xlsx":
+        content = stream_xlsx_sheets([
+            ("Credentials", CREDENTIAL_COLUMNS, credentials),
+            ("Errors", ERROR_COLUMNS, errors),
+        ])
+        response = StreamingHttpResponse(content, content_type=XLSX_CONTENT_TYPE)
+    else:
+        content = chain(['{"credentials":'], stream_json(credentials), [',"errors":'], stream_json(errors), ["}"])
+        response = StreamingHttpResponse(content, content_type="application/json")
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+
 @permission_classes([IsAdminUser])
 class AdminUserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.filter(is_staff=True)
@@ -86,28 +151,153 @@ class StudentViewSet(viewsets.ModelViewSet):
         return self.queryset.none()
 
     def create(self, request, *args, **kwargs):
+        if not (hasattr(request.user, "teacher") or request.user.is_staff):
+            return Response(
+                {"error": "You do not have permission to access this resource."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
         data = request.data.copy()  # Create a mutable copy of request.data
+        school = None
         if hasattr(request.user, "teacher"):
             # teacher can only create students for their school
+            school = request.user.teacher.school
             for student in data:
-                student["school_id"] = self.request.user.teacher.school.id
-            serializer = self.get_serializer(data=data, many=True)
-            serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            self.set_passwords(serializer.data, data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        elif self.request.user.is_staff:
-            # allow bulk creation of students by admin
-            serializer = self.get_serializer(data=data, many=True)
-            serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            self.set_passwords(serializer.data, data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+                student["school_id"] = school.id
+        # allow bulk creation of students by admin
+        serializer = self.get_serializer(
+            data=data,
+            many=True,
+            context={**self.get_serializer_context(), "schools": get_roster_schools(data, school)},
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            students, left_out = create_students(serializer.validated_data)
+            if left_out:
+                # no student is created when some of them cannot be
+                raise ValidationError([
+                    {"username": ["The school has no free usernames left."]} if index in left_out else {}
+                    for index in range(len(data))
+                ])
+        prefetch_related_objects(students, "quiz_attempts")
+        response_data = self.get_serializer(students, many=True).data
+        self.set_passwords(response_data, data)
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"])
+    def enrol(self, request, *args, **kwargs):
+        """
+        Enrol a roster of students, creating the valid rows and reporting the errors of the others
+        by their index, instead of rejecting the whole roster.
+        """
+        if hasattr(request.user, "teacher"):
+            school = request.user.teacher.school
+        elif request.user.is_staff:
+            school = None
         else:
             return Response(
                 {"error": "You do not have permission to access this resource."},
                 status=status.HTTP_403_FORBIDDEN,
             )
+        if not isinstance(request.data, list):
+            return Response({"detail": "Expected a list of students."}, status=status.HTTP_400_BAD_REQUEST)
+
+        students, errors = enrol_students(request.data, school)
+        prefetch_related_objects(students, "quiz_attempts")
+        response_data = self.get_serializer(students, many=True).data
+        for item, student in zip(response_data, students):
+            item["password"] = student.plaintext_password
+        return Response(
+            {"students": response_data, "errors": errors},
+            status=status.HTTP_201_CREATED if students else status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[MultiPartParser],
+        renderer_classes=EXPORT_RENDERERS,
+    )
+    def import_roster(self, request, *args, **kwargs):
+        """
+        Import a CSV or XLSX roster uploaded as `file`, streaming back the credentials sheet of the
+        created students and the error report of the other rows, as one JSON object, an XLSX
+        file with two sheets, or a zip of two CSV files, by `?format=`.
+
+        The roster is read through before any student is created, so an unreadable file creates
+        none. A roster of at most `ROSTER_CHUNK_SIZE` rows is imported in one transaction before
+        the response starts. A larger one is queued as a job for the `run_roster_worker` command,
+        its progress at `import-jobs/<id>/` and its sheets at `import-jobs/<id>/sheets/`.
+        """
+        if hasattr(request.user, "teacher"):
+            school = request.user.teacher.school
+        elif request.user.is_staff:
+            school = None
+        else:
+            return Response(
+                {"error": "You do not have permission to access this resource."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        file = request.FILES.get("file")
+        if file is None:
+            return Response({"detail": "A roster file is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rows_total = count_roster_rows(file, file.name)
+        except (ValueError, UnicodeDecodeError, csv.Error, ElementTree.ParseError):
+            return Response(
+                {"detail": "The roster must be a UTF-8 CSV or an XLSX file."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if not rows_total:
+            return Response({"detail": "The roster has no students."}, status=status.HTTP_400_BAD_REQUEST)
+        if rows_total > ROSTER_CHUNK_SIZE:
+            job = enqueue_roster_import(file, file.name, school, request.user, rows_total)
+            return Response(
+                {"message": "Roster import queued.", "job": RosterImportJobSerializer(job).data},
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        roster = RosterImport(school)
+        roster.import_rows(read_roster(file, file.name))
+        return roster_sheets_response(
+            request, f"roster-{now():%Y%m%d-%H%M%S}", roster.get_credentials(), roster.get_errors()
+        )
+
+    def get_roster_import_job(self, request, job_id):
+        """Get a roster import job of the user, or any job for staff, or None."""
+        jobs = RosterImportJob.objects.defer("content")
+        if not request.user.is_staff:
+            jobs = jobs.filter(created_by=request.user)
+        return jobs.filter(pk=job_id).first()
+
+    @action(detail=False, methods=["get"], url_path=r"import-jobs/(?P<job_id>\d+)")
+    def import_job(self, request, job_id=None):
+        """
+        Retrieve the progress of a roster import job.
+        api: /api/users/students/import-jobs/1/
+        """
+        job = self.get_roster_import_job(request, job_id)
+        if job is None:
+            return Response({"detail": "Roster import job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(RosterImportJobSerializer(job).data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"import-jobs/(?P<job_id>\d+)/sheets",
+        renderer_classes=EXPORT_RENDERERS,
+    )
+    def import_job_sheets(self, request, job_id=None):
+        """
+        Stream the credentials sheet and the error report of the committed chunks of a roster import
+        job, complete once the job is done, by `?format=` as for an import.
+        api: /api/users/students/import-jobs/1/sheets/?format=xlsx
+        """
+        job = self.get_roster_import_job(request, job_id)
+        if job is None:
+            return Response({"detail": "Roster import job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return roster_sheets_response(
+            request, f"roster-{job.id}", get_job_rows(job, "credentials"), get_job_rows(job, "errors")
+        )
 
     def update(self, request, *args, **kwargs):
         data = request.data.copy()  # Create a mutable copy of request.data
@@ -136,15 +326,6 @@ class StudentViewSet(viewsets.ModelViewSet):
         for item, student_data in zip(serialized_data, original_data):
             item["password"] = student_data["password"]
 
-    def perform_create(self, serializer):
-        # Save the student instance
-        students = serializer.save()
-
-        # Update the plaintext_password field for each student
-        for student, data in zip(students, self.request.data):
-            student.plaintext_password = data.get("password")
-            student.save()
-
 
 @permission_classes([IsAuthenticated])
 class TeacherViewSet(viewsets.ModelViewSet):